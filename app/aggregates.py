@@ -0,0 +1,265 @@
+"""
+Materialized aggregate tables behind the dashboard panels.
+
+Every panel in main.py is a small groupby over the order data. The tables
+are computed once per dataset version and stored under
+`./data/aggregates/<version>/`, so a dashboard rerun only reads a few
+kilobytes instead of scanning every order row.
+
+When the star-schema warehouse (warehouse.py) has been built, the tables are
+computed from it, otherwise from the merged snapshot. Both count the same
+units: distinct orders, and revenue summed once per payment, not per row of
+the exploded merged frame, where an order with several items, payments or
+reviews appears once per combination. The merged frame is an inner join, so
+orders without items or payments are only counted from the warehouse.
+
+Rebuild them explicitly with:
+
+    python app/aggregates.py
+"""
+import os
+import shutil
+
+import pyarrow.feather as feather
+
+from snapshot import MERGED_CSV, SNAPSHOT_PATH, dataset_version, load_site_df
+from warehouse import WAREHOUSE_DIR, Warehouse, warehouse_exists
+
+AGGREGATES_DIR = "./data/aggregates"
+# Part of the stored directory name; bumped when the tables change meaning,
+# so tables stored by an older version of this module are recomputed
+AGGREGATES_FORMAT = 2
+
+
+def _orders_per(frame, column, key="order_key"):
+    # Distinct orders per value of `column`, most orders first
+    return (
+        frame.groupby(column, observed=True)[key]
+        .nunique()
+        .reset_index(name="order_id")
+        .astype({column: str})
+        .sort_values("order_id", ascending=False)
+    )
+
+
+def compute_aggregates(site_df):
+    """
+    Compute every table read by the dashboard
+
+    Counts the same units as compute_warehouse_aggregates: distinct orders,
+    and revenue over distinct payments (order_id, payment_sequential),
+    since every row of the merged frame repeats its order and payment once
+    per item and review.
+
+    Input:
+        Row-level DataFrame as returned by snapshot.load_site_df
+    Returns:
+        Dictionary of table name -> DataFrame, already sorted for plotting
+    """
+    purchase = site_df.order_purchase_timestamp
+    tables = {}
+
+    tables["top_orders_cities"] = _orders_per(site_df, "customer_city", "order_id")
+    payments = site_df.drop_duplicates(["order_id", "payment_sequential"])
+    tables["top_revenue_cities"] = (
+        payments.groupby("customer_city", observed=True)["payment_value"]
+        .sum()
+        .reset_index()
+        .astype({"customer_city": str})
+        .sort_values("payment_value", ascending=False)
+    )
+    tables["seller_cities"] = _orders_per(site_df, "seller_city", "order_id").rename(
+        columns={"order_id": "orders"}
+    )
+
+    tables["orders_by_hour"] = (
+        site_df.groupby(purchase.dt.hour)["order_id"].nunique().reset_index()
+    )
+    tables["orders_by_day"] = (
+        site_df.groupby(purchase.dt.day_name())["order_id"]
+        .nunique()
+        .reset_index()
+        .sort_values("order_id", ascending=False)
+    )
+
+    tables["category_orders"] = _orders_per(
+        site_df, "product_category_name_english", "order_id"
+    )
+    tables["super_category_orders"] = _orders_per(
+        site_df, "product_category", "order_id"
+    ).rename(columns={"order_id": "orders"})
+
+    return {name: table.reset_index(drop=True) for name, table in tables.items()}
+
+
+def compute_warehouse_aggregates(wh, start=None, end=None):
+    """
+    Compute every table read by the dashboard from the warehouse
+
+    Input:
+        Warehouse and an optional purchase-time range [start, end); only
+        the order partitions overlapping it are read
+    Returns:
+        Dictionary of table name -> DataFrame, with the same names and
+        columns as compute_aggregates
+    """
+    tables = {}
+    orders = wh.frame("orders", ["customer_city", "order_purchase_timestamp"], start, end)
+    orders["order_key"] = orders.index
+    items = wh.frame(
+        "items",
+        ["order_key", "seller_city", "product_category_name_english", "product_category"],
+        start,
+        end,
+    )
+    payments = wh.frame("payments", ["customer_city", "payment_value"], start, end)
+
+    tables["top_orders_cities"] = _orders_per(orders, "customer_city")
+    tables["top_revenue_cities"] = (
+        payments.groupby("customer_city", observed=True)["payment_value"]
+        .sum()
+        .reset_index()
+        .astype({"customer_city": str})
+        .sort_values("payment_value", ascending=False)
+    )
+    tables["seller_cities"] = _orders_per(items, "seller_city").rename(
+        columns={"order_id": "orders"}
+    )
+
+    purchase = orders.order_purchase_timestamp
+    tables["orders_by_hour"] = (
+        purchase.dt.hour.value_counts()
+        .sort_index()
+        .rename_axis("order_purchase_timestamp")
+        .reset_index(name="order_id")
+    )
+    tables["orders_by_day"] = (
+        purchase.dt.day_name()
+        .value_counts()
+        .rename_axis("order_purchase_timestamp")
+        .reset_index(name="order_id")
+    )
+
+    tables["category_orders"] = _orders_per(items, "product_category_name_english")
+    tables["super_category_orders"] = _orders_per(items, "product_category").rename(
+        columns={"order_id": "orders"}
+    )
+    return {name: table.reset_index(drop=True) for name, table in tables.items()}
+
+
+def current_version(
+    csv_path=MERGED_CSV, snapshot_path=SNAPSHOT_PATH, warehouse_dir=WAREHOUSE_DIR
+):
+    """
+    Version of the data behind the dashboard tables
+
+    The warehouse version when it has been built, otherwise the merged
+    snapshot's.
+    """
+    if warehouse_exists(warehouse_dir):
+        return "wh-" + Warehouse(warehouse_dir).version
+    return dataset_version(csv_path, snapshot_path)
+
+
+def time_bounds(warehouse_dir=WAREHOUSE_DIR):
+    """
+    First and last purchase timestamp, (None, None) without a warehouse
+    """
+    if not warehouse_exists(warehouse_dir):
+        return None, None
+    return Warehouse(warehouse_dir).time_bounds()
+
+
+def load_range_aggregates(start, end, warehouse_dir=WAREHOUSE_DIR):
+    """
+    Dashboard tables for the orders purchased in [start, end)
+
+    Not stored on disk: ranges are arbitrary, and with the partition
+    pruning of the warehouse they only read the months they cover.
+    """
+    return compute_warehouse_aggregates(Warehouse(warehouse_dir), start, end)
+
+
+def _compute(csv_path, snapshot_path, warehouse_dir):
+    if warehouse_exists(warehouse_dir):
+        return compute_warehouse_aggregates(Warehouse(warehouse_dir))
+    return compute_aggregates(load_site_df(csv_path, snapshot_path))
+
+
+def _version_dir(version, aggregates_dir=AGGREGATES_DIR):
+    name = f"v{AGGREGATES_FORMAT}-" + version.replace(":", "-")
+    return os.path.join(aggregates_dir, name)
+
+
+def write_aggregates(tables, version, aggregates_dir=AGGREGATES_DIR):
+    target = _version_dir(version, aggregates_dir)
+    tmp_dir = target + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, table in tables.items():
+        feather.write_feather(
+            table, os.path.join(tmp_dir, name + ".arrow"), compression="uncompressed"
+        )
+
+    # Swap the complete directory in and drop tables of older versions
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_dir, target)
+    for entry in os.listdir(aggregates_dir):
+        path = os.path.join(aggregates_dir, entry)
+        if path != target and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def read_aggregates(version, aggregates_dir=AGGREGATES_DIR):
+    target = _version_dir(version, aggregates_dir)
+    if not os.path.isdir(target):
+        return None
+    return {
+        entry[: -len(".arrow")]: feather.read_feather(os.path.join(target, entry))
+        for entry in os.listdir(target)
+        if entry.endswith(".arrow")
+    }
+
+
+def build_aggregates(
+    csv_path=MERGED_CSV,
+    snapshot_path=SNAPSHOT_PATH,
+    aggregates_dir=AGGREGATES_DIR,
+    warehouse_dir=WAREHOUSE_DIR,
+):
+    version = current_version(csv_path, snapshot_path, warehouse_dir)
+    tables = _compute(csv_path, snapshot_path, warehouse_dir)
+    write_aggregates(tables, version, aggregates_dir)
+    return tables
+
+
+def load_aggregates(
+    csv_path=MERGED_CSV,
+    snapshot_path=SNAPSHOT_PATH,
+    aggregates_dir=AGGREGATES_DIR,
+    warehouse_dir=WAREHOUSE_DIR,
+):
+    """
+    Load the dashboard tables for the current dataset version
+
+    The row-level data is only touched when no tables exist for the current
+    version yet. If the data directory is read-only the freshly computed
+    tables are returned without being stored.
+    """
+    version = current_version(csv_path, snapshot_path, warehouse_dir)
+    tables = read_aggregates(version, aggregates_dir)
+    if tables is not None:
+        return tables
+
+    tables = _compute(csv_path, snapshot_path, warehouse_dir)
+    try:
+        write_aggregates(tables, version, aggregates_dir)
+    except OSError:
+        pass
+    return tables
+
+
+if __name__ == "__main__":
+    tables = build_aggregates()
+    for name, table in tables.items():
+        print(f"{name}: {len(table)} rows")
@@ -1,158 +1,64 @@
+import os
+
 import streamlit as st
-import skops.io as sio
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-import re
-from nltk.corpus import stopwords
-from nltk.stem import RSLPStemmer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.pipeline import Pipeline
-
-# Load Vectorizer
-def custom_tokenizer(text, max_words=50):
-    tokens = text.split()[:max_words]
-    return tokens
-unknown_types = sio.get_untrusted_types(file="tfidf_vectorizer.skops")
-vectorizer = sio.load("tfidf_vectorizer.skops", trusted=unknown_types)
-
-# Load model
-unknown_types = sio.get_untrusted_types(file="logistic_sentiment.skops")
-model = sio.load("logistic_sentiment.skops", trusted=unknown_types)
-
-# Download stopwords
-pt_stopwords = stopwords.words('portuguese')
-
-# Defining a function to plot the sentiment of a given phrase
-def sentiment_analysis(text, pipeline, vectorizer, model):
-    
-    # Applying the pipeline
-    if type(text) is not list:
-        text = [text]
-    text_prep = pipeline.transform(text)
-    matrix = vectorizer.transform(text_prep)
-    
-    # Predicting sentiment
-    pred = model.predict(matrix)
-    proba = model.predict_proba(matrix)
-    return pred, proba
-    
-# Class for regular expressions application
-class ApplyRegex(BaseEstimator, TransformerMixin):
-    
-    def __init__(self, regex_transformers):
-        self.regex_transformers = regex_transformers
-        
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X, y=None):
-        # Applying all regex functions in the regex_transformers dictionary
-        for regex_name, regex_function in self.regex_transformers.items():
-            X = regex_function(X)
-            
-        return X
-    
-def stopwords_removal(text, cached_stopwords=stopwords.words('portuguese')):
-    return [c.lower() for c in text.split() if c.lower() not in cached_stopwords]
-
-# Class for stopwords removal from the corpus
-class StopWordsRemoval(BaseEstimator, TransformerMixin):
-    
-    def __init__(self, text_stopwords):
-        self.text_stopwords = text_stopwords
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X, y=None):
-        return [' '.join(stopwords_removal(comment, self.text_stopwords)) for comment in X]
-
-def stemming_process(text, stemmer=RSLPStemmer()):
-    return [stemmer.stem(c) for c in text.split()]
-
-# Class for apply the stemming process
-class StemmingProcess(BaseEstimator, TransformerMixin):
-    
-    def __init__(self, stemmer):
-        self.stemmer = stemmer
-    
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X, y=None):
-        return [' '.join(stemming_process(comment, self.stemmer)) for comment in X]
-    
-# Class for extracting features from corpus
-class TextFeatureExtraction(BaseEstimator, TransformerMixin):
-    
-    def __init__(self, vectorizer):
-        self.vectorizer = vectorizer
-        
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X, y=None):
-        return self.vectorizer.fit_transform(X).toarray()
-
-def re_breakline(text_list):
-    # Applying regex
-    return [re.sub('[\n\r]', ' ', r) for r in text_list]
-
-def re_hiperlinks(text_list):
-    # Applying regex
-    pattern = 'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    return [re.sub(pattern, ' link ', r) for r in text_list]
-
-def re_dates(text_list):
-    # Applying regex
-    pattern = '([0-2][0-9]|(3)[0-1])(\/|\.)(((0)[0-9])|((1)[0-2]))(\/|\.)\d{2,4}'
-    return [re.sub(pattern, ' data ', r) for r in text_list]
-
-def re_money(text_list):
-    # Applying regex
-    pattern = '[R]{0,1}\$[ ]{0,}\d+(,|\.)\d+'
-    return [re.sub(pattern, ' dinheiro ', r) for r in text_list]
-
-def re_numbers(text_list):    
-    # Applying regex
-    return [re.sub('[0-9]+', ' numero ', r) for r in text_list]
-
-def re_negation(text_list):
-    # Applying regex
-    return [re.sub('([nN][ãÃaA][oO]|[ñÑ]| [nN] )', ' negação ', r) for r in text_list]
-
-def re_special_chars(text_list):
-    # Applying regex
-    return [re.sub('\W', ' ', r) for r in text_list]
-
-def re_whitespaces(text_list):
-    # Applying regex
-    white_spaces = [re.sub('\s+', ' ', r) for r in text_list]
-    white_spaces_end = [re.sub('[ \t]+$', '', r) for r in white_spaces]
-    return white_spaces_end
-
-regex_transformers = {
-    'break_line': re_breakline,
-    'hiperlinks': re_hiperlinks,
-    'dates': re_dates,
-    'money': re_money,
-    'numbers': re_numbers,
-    'negation': re_negation,
-    'special_chars': re_special_chars,
-    'whitespaces': re_whitespaces
-}
-
-text_pipeline = Pipeline([
-    ('text_features', TextFeatureExtraction(vectorizer))
-])
-
-prod_pipeline = Pipeline([
-    ('regex', ApplyRegex(regex_transformers)),
-    ('stopwords', StopWordsRemoval(stopwords.words('portuguese'))),
-    ('stemming', StemmingProcess(RSLPStemmer()))
-])
-vectorizer = text_pipeline.named_steps['text_features'].vectorizer
+from bundle import BUNDLE_DIR, SentimentBundle
+from feature_index import FEATURE_INDEX_PATH, FeatureIndex
+from inference import load_skops, sentiment_analysis
+from linear_scorer import SCORER_PATH, LinearScorer
+from resources import file_version, shared_cache
+
+# Only what scoring needs is imported up front: scikit-learn, nltk and
+# matplotlib are imported when the fallback pipeline or the plot needs them.
+
+# Memory-mapped bundle written by bundle.py, used while it matches the skops
+# files; otherwise the skops files are loaded. Either way they are loaded once
+# per process and shared by all sessions until the files change.
+def load_bundle():
+    bundle = SentimentBundle(BUNDLE_DIR)
+    return bundle.is_current(), bundle
+
+
+bundle_current = False
+bundle_manifest = os.path.join(BUNDLE_DIR, "manifest.json")
+if os.path.exists(bundle_manifest):
+    bundle_version = tuple(
+        file_version(path)
+        for path in (bundle_manifest, "tfidf_vectorizer.skops", "logistic_sentiment.skops")
+    )
+    bundle_current, bundle = shared_cache.get("sentiment_bundle", bundle_version, load_bundle)
+
+if bundle_current:
+    vectorizer = bundle
+    model = shared_cache.get("sentiment_bundle_scorer", bundle_version, bundle.scorer)
+else:
+    vectorizer = shared_cache.get_file("tfidf_vectorizer.skops", load_skops)
+
+    # Load model
+    model = shared_cache.get_file("logistic_sentiment.skops", load_skops)
+
+    # NumPy export of the model written by linear_scorer.py, if it is current
+    if os.path.exists(SCORER_PATH):
+        scorer = shared_cache.get_file(SCORER_PATH, LinearScorer.load)
+        if scorer.matches(model):
+            model = scorer
+
+# Surface token -> feature lookup built by feature_index.py; skips stemming
+# at inference. Ignored when missing or built from another vectorizer.
+feature_index = None
+if os.path.exists(FEATURE_INDEX_PATH):
+    feature_index = shared_cache.get_file(FEATURE_INDEX_PATH, FeatureIndex.load)
+    if not feature_index.matches(vectorizer):
+        feature_index = None
+
+if feature_index is not None:
+    prod_pipeline = None
+    vectorizer = feature_index
+else:
+    from sentiment import build_prod_pipeline
+
+    prod_pipeline = build_prod_pipeline()
+    if bundle_current:
+        vectorizer = shared_cache.get("sentiment_bundle_vectorizer", bundle_version, bundle.vectorizer)
 
 
 # Title of the app
@@ -169,6 +75,8 @@ if st.button("Analyze"):
         st.error("Please enter some text.")
     else:
         pred, proba = sentiment_analysis(user_input, pipeline=prod_pipeline, vectorizer=vectorizer, model=model)
+        import matplotlib.pyplot as plt
+
         fig, ax = plt.subplots(figsize=(5, 3))
         if pred[0] == 1:            
             text = 'Positive'
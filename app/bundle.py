@@ -0,0 +1,268 @@
+"""
+Compact, memory-mappable bundle of the sentiment artifacts.
+
+Unpickling tfidf_vectorizer.skops (2 MB, mostly the 207 stopwords and the
+stop_words_ set of every discarded term) and the logistic model dominates
+the cold start of a worker. The bundle keeps only what inference needs:
+
+    manifest.json        format, shapes, dtypes, vectorizer parameters,
+                         intercept, classes and sha256 of every file and of
+                         the skops sources it was exported from
+    vocab.bin            sorted vocabulary, UTF-8, concatenated
+    vocab_offsets.u32    n_features + 1 little-endian offsets into vocab.bin
+    idf.f64              little-endian float64 idf vector
+    coef.f32             little-endian float32 coefficient vector
+
+Arrays are opened with np.memmap, so every worker on the host shares the
+same pages through the page cache. Columns are in sorted vocabulary order,
+which is the order CountVectorizer assigns them.
+
+    python app/bundle.py export
+    python app/bundle.py verify data/comments.csv
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from resources import file_version
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE_DIR = os.path.join(APP_DIR, "sentiment_bundle")
+DEFAULT_VECTORIZER = os.path.join(APP_DIR, "tfidf_vectorizer.skops")
+DEFAULT_MODEL = os.path.join(APP_DIR, "logistic_sentiment.skops")
+
+FORMAT_VERSION = 1
+
+# Vectorizer parameters stored in the manifest to rebuild a TfidfVectorizer
+VECTORIZER_PARAMS = (
+    "lowercase",
+    "ngram_range",
+    "norm",
+    "smooth_idf",
+    "stop_words",
+    "sublinear_tf",
+    "use_idf",
+)
+
+_ARRAYS = {"idf.f64": "<f8", "coef.f32": "<f4", "vocab_offsets.u32": "<u4"}
+
+
+def _write_buffer(directory, name, data):
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(data)
+    return {
+        "bytes": len(data),
+        "sha256": file_version(os.path.join(directory, name), content_hash=True),
+    }
+
+
+def export_bundle(
+    bundle_dir=BUNDLE_DIR,
+    vectorizer_path=DEFAULT_VECTORIZER,
+    model_path=DEFAULT_MODEL,
+):
+    """
+    Export the skops vectorizer and model to a bundle directory
+
+    The bundle is written next to the target and swapped in, so readers
+    never see a partial bundle.
+
+    Returns:
+        The manifest
+    """
+    from inference import load_skops
+
+    vectorizer = load_skops(vectorizer_path)
+    model = load_skops(model_path)
+    if model.coef_.shape != (1, len(vectorizer.vocabulary_)):
+        raise ValueError("Model coefficients don't match the vectorizer vocabulary")
+
+    terms = sorted(vectorizer.vocabulary_)
+    if [vectorizer.vocabulary_[term] for term in terms] != list(range(len(terms))):
+        raise ValueError("Vectorizer columns are not in sorted vocabulary order")
+    encoded = [term.encode("utf-8") for term in terms]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(term) for term in encoded], out=offsets[1:])
+
+    params = vectorizer.get_params()
+    manifest = {
+        "format": FORMAT_VERSION,
+        "n_features": len(terms),
+        "intercept": float(model.intercept_[0]),
+        "classes": model.classes_.tolist(),
+        "vectorizer": {name: params[name] for name in VECTORIZER_PARAMS},
+        "sources": {
+            os.path.basename(path): file_version(path, content_hash=True)
+            for path in (vectorizer_path, model_path)
+        },
+        "files": {},
+    }
+
+    tmp_dir = bundle_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    buffers = {
+        "vocab.bin": b"".join(encoded),
+        "vocab_offsets.u32": offsets.tobytes(),
+        "idf.f64": np.asarray(vectorizer.idf_, dtype="<f8").tobytes(),
+        "coef.f32": np.asarray(model.coef_[0], dtype="<f4").tobytes(),
+    }
+    for name, data in buffers.items():
+        manifest["files"][name] = _write_buffer(tmp_dir, name, data)
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+    old_dir = bundle_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(bundle_dir):
+        os.replace(bundle_dir, old_dir)
+    os.replace(tmp_dir, bundle_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+class SentimentBundle:
+    """
+    Memory-mapped view of an exported bundle
+
+    Input:
+        Bundle directory and a flag to check the sha256 of every file
+        against the manifest
+    """
+
+    def __init__(self, bundle_dir=BUNDLE_DIR, verify=True):
+        self.bundle_dir = bundle_dir
+        with open(os.path.join(bundle_dir, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported bundle format: {self.manifest.get('format')}")
+        if verify:
+            for name, entry in self.manifest["files"].items():
+                if file_version(self._path(name), content_hash=True) != entry["sha256"]:
+                    raise ValueError(f"{self._path(name)} doesn't match the manifest")
+
+        n_features = self.manifest["n_features"]
+        self.idf = self._map("idf.f64", n_features)
+        self.coef = self._map("coef.f32", n_features)
+        offsets = self._map("vocab_offsets.u32", n_features + 1)
+        with open(self._path("vocab.bin"), "rb") as f:
+            vocab = f.read()
+        self.feature_names = [
+            vocab[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        self.intercept = self.manifest["intercept"]
+        self.classes = np.asarray(self.manifest["classes"])
+
+    def _path(self, name):
+        return os.path.join(self.bundle_dir, name)
+
+    def _map(self, name, length):
+        dtype = np.dtype(_ARRAYS[name])
+        if self.manifest["files"][name]["bytes"] != length * dtype.itemsize:
+            raise ValueError(f"{self._path(name)} has an unexpected size")
+        return np.memmap(self._path(name), dtype=dtype, mode="r", shape=(length,))
+
+    def is_current(self, vectorizer_path=DEFAULT_VECTORIZER, model_path=DEFAULT_MODEL):
+        # False once a skops source was retrained after the export
+        sources = self.manifest["sources"]
+        return all(
+            sources.get(os.path.basename(path)) == file_version(path, content_hash=True)
+            for path in (vectorizer_path, model_path)
+            if os.path.exists(path)
+        )
+
+    def vectorizer(self):
+        """
+        Fitted TfidfVectorizer equivalent to the exported one
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        from inference import custom_tokenizer
+
+        params = dict(self.manifest["vectorizer"])
+        params["ngram_range"] = tuple(params["ngram_range"])
+        vectorizer = TfidfVectorizer(
+            tokenizer=custom_tokenizer,
+            vocabulary={term: i for i, term in enumerate(self.feature_names)},
+            **params,
+        )
+        vectorizer._validate_vocabulary()
+        vectorizer.idf_ = self.idf
+        return vectorizer
+
+    def scorer(self):
+        """
+        LinearScorer over the memory-mapped coefficients
+        """
+        from linear_scorer import LinearScorer
+
+        return LinearScorer(self.coef, self.intercept, self.classes)
+
+
+def verify_bundle(
+    texts,
+    bundle_dir=BUNDLE_DIR,
+    vectorizer_path=DEFAULT_VECTORIZER,
+    model_path=DEFAULT_MODEL,
+):
+    """
+    Round-trip check of a bundle against the skops originals
+
+    Input:
+        Review texts to score with both and the artifact paths
+    Returns:
+        Dict with the largest matrix and probability differences and the
+        number of differing labels
+    """
+    from inference import load_skops
+    from sentiment import build_prod_pipeline
+
+    bundle = SentimentBundle(bundle_dir)
+    vectorizer = load_skops(vectorizer_path)
+    model = load_skops(model_path)
+    if list(vectorizer.get_feature_names_out()) != bundle.feature_names:
+        raise AssertionError("Vocabulary differs from the skops vectorizer")
+    if not np.array_equal(vectorizer.idf_, bundle.idf):
+        raise AssertionError("idf differs from the skops vectorizer")
+
+    stems = build_prod_pipeline().transform(list(texts))
+    expected = vectorizer.transform(stems)
+    matrix = bundle.vectorizer().transform(stems)
+    labels, proba = bundle.scorer().score(matrix)
+    return {
+        "rows": expected.shape[0],
+        "max_matrix_diff": float(abs(expected - matrix).max()) if expected.nnz else 0.0,
+        "max_proba_diff": float(abs(model.predict_proba(expected) - proba).max()),
+        "label_mismatches": int((model.predict(expected) != labels).sum()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["export", "verify"])
+    parser.add_argument("corpus", nargs="?", default="./data/comments.csv")
+    parser.add_argument("--bundle", default=BUNDLE_DIR)
+    parser.add_argument("--vectorizer", default=DEFAULT_VECTORIZER)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        manifest = export_bundle(args.bundle, args.vectorizer, args.model)
+        size = sum(entry["bytes"] for entry in manifest["files"].values())
+        print(f"Wrote {args.bundle} ({size} bytes of arrays)")
+    else:
+        import pandas as pd
+
+        texts = pd.read_csv(args.corpus)["comment"].dropna().astype(str)
+        report = verify_bundle(texts, args.bundle, args.vectorizer, args.model)
+        print(json.dumps(report, indent=2))
+        if report["label_mismatches"] or report["max_proba_diff"] > 1e-6:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
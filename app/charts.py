@@ -0,0 +1,125 @@
+"""
+Cache of rendered dashboard charts.
+
+A panel is drawn once per (panel, dataset version, theme) and stored as PNG
+bytes in a process-wide LRU cache, so reruns and other sessions get the
+image without running seaborn or matplotlib again. Figures are created with
+`matplotlib.figure.Figure`, not pyplot, so they are never registered in the
+global figure manager and are freed as soon as they are rendered.
+
+The cache budget is read from OLIST_CHART_CACHE_MB (default 64 MB).
+"""
+import io
+import os
+
+from resources import ResourceCache
+
+DEFAULT_CHART_BUDGET_MB = 64
+
+# Same rendering options st.pyplot uses
+SAVEFIG_OPTIONS = {"bbox_inches": "tight", "dpi": 200, "format": "png"}
+
+chart_cache = ResourceCache(
+    int(
+        float(os.environ.get("OLIST_CHART_CACHE_MB", DEFAULT_CHART_BUDGET_MB))
+        * 1024
+        * 1024
+    )
+)
+
+
+def render_png(fig):
+    """
+    Render a figure to PNG bytes and release it
+
+    Input:
+        A matplotlib Figure
+    Returns:
+        PNG bytes
+    """
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, **SAVEFIG_OPTIONS)
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+
+def cached_chart(panel, version, draw, theme="light"):
+    """
+    Return the PNG of a dashboard panel, drawing it only on a cache miss
+
+    Input:
+        Panel name, dataset version, a zero-argument function returning the
+        Figure of the panel and the active theme
+    Returns:
+        PNG bytes ready for st.image
+    """
+    # The version is part of the key, so charts of another version or date
+    # range stay cached side by side; the LRU budget evicts old ones
+    return chart_cache.get((panel, version, theme), None, lambda: render_png(draw()))
+
+
+def bar_chart(
+    data,
+    x,
+    y,
+    palette,
+    figsize,
+    xlabel=None,
+    ylabel=None,
+    ytick_size=None,
+    xtick_rotation=None,
+):
+    """
+    Draw one of the dashboard bar charts on a standalone Figure
+
+    Input:
+        Aggregate table, column names for x and y, seaborn palette (or a
+        (name, n_colors) tuple for sns.color_palette), figure size and
+        optional axis labels / tick formatting
+    Returns:
+        The Figure, to be passed to render_png
+    """
+    # Imported here so cache hits never load the plotting stack
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    if isinstance(palette, tuple) and isinstance(palette[0], str):
+        palette = sns.color_palette(*palette)
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    sns.barplot(x=x, y=y, data=data, palette=palette, ax=ax)
+    if xlabel is not None:
+        ax.set_xlabel(xlabel, fontsize=14)
+    if ylabel is not None:
+        ax.set_ylabel(ylabel, fontsize=14)
+    if ytick_size is not None:
+        ax.tick_params(axis="y", labelsize=ytick_size)
+    if xtick_rotation is not None:
+        ax.tick_params(axis="x", labelrotation=xtick_rotation)
+    return fig
+
+
+def line_chart(data, x, y, figsize, xlabel=None, ylabel=None, color="purple"):
+    """
+    Draw a trend line with markers on a standalone Figure
+
+    Input:
+        Table, column names for x and y, figure size, optional axis labels
+        and the line color
+    Returns:
+        The Figure, to be passed to render_png
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    ax.plot(data[x], data[y], "-o", color=color)
+    if xlabel is not None:
+        ax.set_xlabel(xlabel, fontsize=14)
+    if ylabel is not None:
+        ax.set_ylabel(ylabel, fontsize=14)
+    ax.grid(True)
+    return fig
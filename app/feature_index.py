@@ -0,0 +1,214 @@
+"""
+Direct surface token -> TF-IDF feature lookup for serving.
+
+The saved vectorizer only keeps 300 stems, yet every token of a review goes
+through stopword filtering and RSLP stemming before most of them are thrown
+away. This module precomputes, for every normalized surface token seen in
+the corpus, the feature index its stem maps to (or that it maps to none),
+together with the idf vector. At inference a review is normalized with the
+regex chain and its TF-IDF row is built in one dictionary pass; only tokens
+missing from the table are stemmed, and their result is memoized.
+
+The rows match vectorizer.transform(prod_pipeline.transform(texts)).
+
+    python app/feature_index.py data/comments.csv app/feature_index.json
+"""
+import json
+import os
+import sys
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from inference import normalize_text
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURE_INDEX_PATH = os.path.join(APP_DIR, "feature_index.json")
+DEFAULT_VECTORIZER = os.path.join(APP_DIR, "tfidf_vectorizer.skops")
+
+# Table values for tokens without a feature and tokens whose stem is empty
+# (an empty stem disappears when the stems are joined and re-split, so it
+# doesn't count towards custom_tokenizer's word cap)
+NO_FEATURE = -1
+EMPTY_STEM = -2
+
+
+class FeatureIndex:
+    """
+    Token -> feature table with idf weights
+
+    Input:
+        {surface token: feature index} table, idf vector, feature names,
+        stopwords removed before stemming, custom_tokenizer's word cap, the
+        vectorizer's norm and a stemmer used for tokens missing from the
+        table (memoized up to `max_entries` table entries; a FastRSLPStemmer
+        is created on first use when not given)
+    """
+
+    def __init__(
+        self,
+        table,
+        idf,
+        feature_names,
+        stopwords,
+        max_words=50,
+        norm="l2",
+        stemmer=None,
+        max_entries=500_000,
+    ):
+        self.table = dict(table)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.feature_names = list(feature_names)
+        self.stopwords = frozenset(stopwords)
+        self.max_words = max_words
+        self.norm = norm
+        self.stemmer = stemmer
+        self.max_entries = max_entries
+        self._vocabulary = {name: i for i, name in enumerate(self.feature_names)}
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, stopwords, stemmer, corpus=(), max_words=50):
+        """
+        Build the index for a fitted TfidfVectorizer
+
+        Input:
+            Vectorizer fitted on prod_pipeline output, the stopwords and
+            stemmer of prod_pipeline and raw review texts whose tokens are
+            resolved ahead of time
+        """
+        if vectorizer.ngram_range != (1, 1) or vectorizer.sublinear_tf or vectorizer.binary:
+            raise ValueError("Only unigram, raw-count TF-IDF vectorizers are supported")
+        if vectorizer.norm not in ("l2", None):
+            raise ValueError(f"Unsupported norm: {vectorizer.norm}")
+
+        index = cls(
+            table={},
+            idf=vectorizer.idf_,
+            feature_names=vectorizer.get_feature_names_out(),
+            stopwords=stopwords,
+            max_words=max_words,
+            norm=vectorizer.norm,
+            stemmer=stemmer,
+        )
+        for text in corpus:
+            for token in normalize_text(text).lower().split():
+                if token not in index.stopwords and token not in index.table:
+                    index.table[token] = index._resolve(token)
+        return index
+
+    @classmethod
+    def load(cls, path, stemmer=None):
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        return cls(
+            table=payload["table"],
+            idf=payload["idf"],
+            feature_names=payload["feature_names"],
+            stopwords=payload["stopwords"],
+            max_words=payload["max_words"],
+            norm=payload["norm"],
+            stemmer=stemmer,
+        )
+
+    def save(self, path):
+        payload = {
+            "feature_names": self.feature_names,
+            "idf": self.idf.tolist(),
+            "stopwords": sorted(self.stopwords),
+            "max_words": self.max_words,
+            "norm": self.norm,
+            "table": self.table,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+
+    def matches(self, vectorizer):
+        # True when the index was built from this vectorizer's (or
+        # bundle.SentimentBundle's) vocabulary and idf
+        if hasattr(vectorizer, "get_feature_names_out"):
+            feature_names, idf = list(vectorizer.get_feature_names_out()), vectorizer.idf_
+        else:
+            feature_names, idf = vectorizer.feature_names, vectorizer.idf
+        return feature_names == self.feature_names and np.array_equal(idf, self.idf)
+
+    def _resolve(self, token):
+        if self.stemmer is None:
+            # Only tokens missing from the table need the stemmer (and nltk)
+            from rslp import FastRSLPStemmer
+
+            self.stemmer = FastRSLPStemmer()
+        stem = self.stemmer.stem(token)
+        if not stem:
+            return EMPTY_STEM
+        return self._vocabulary.get(stem, NO_FEATURE)
+
+    def lookup(self, token):
+        feature = self.table.get(token)
+        if feature is None:
+            feature = self._resolve(token)
+            if len(self.table) < self.max_entries:
+                self.table[token] = feature
+        return feature
+
+    def transform(self, texts):
+        """
+        TF-IDF matrix of raw review texts
+
+        Input:
+            List of raw review texts
+        Returns:
+            CSR matrix with one row per text and one column per feature
+        """
+        indptr = [0]
+        indices = []
+        counts = []
+        stop = self.stopwords
+        for text in texts:
+            row = {}
+            n_words = 0
+            for token in normalize_text(text).lower().split():
+                if token in stop:
+                    continue
+                feature = self.lookup(token)
+                if feature == EMPTY_STEM:
+                    continue
+                n_words += 1
+                if n_words > self.max_words:
+                    break
+                if feature >= 0:
+                    row[feature] = row.get(feature, 0) + 1
+            for feature in sorted(row):
+                indices.append(feature)
+                counts.append(row[feature])
+            indptr.append(len(indices))
+
+        indices = np.asarray(indices, dtype=np.int32)
+        indptr = np.asarray(indptr, dtype=np.int32)
+        data = np.asarray(counts, dtype=np.float64) * self.idf[indices]
+        if self.norm == "l2":
+            row_ids = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            norms = np.sqrt(np.bincount(row_ids, weights=data**2, minlength=len(indptr) - 1))
+            norms[norms == 0] = 1.0
+            data /= norms[row_ids]
+        return csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(self.idf)))
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    from inference import load_skops, portuguese_stopwords
+    from rslp import FastRSLPStemmer
+
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else "./data/comments.csv"
+    index_path = sys.argv[2] if len(sys.argv) > 2 else FEATURE_INDEX_PATH
+    vectorizer_path = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_VECTORIZER
+
+    comments = pd.read_csv(corpus_path)["comment"].dropna().astype(str)
+    index = FeatureIndex.from_vectorizer(
+        load_skops(vectorizer_path),
+        portuguese_stopwords(),
+        FastRSLPStemmer(),
+        corpus=comments,
+    )
+    index.save(index_path)
+    print(f"Wrote {len(index.table)} tokens to {index_path}")
@@ -0,0 +1,150 @@
+"""
+Import-time report and budget for the apps.
+
+Every target is imported in fresh interpreters with `python -X importtime`
+and the fastest of `--repeat` runs is kept, so the numbers are reproducible
+on a given machine. A target is a module name or a script; for a script only
+its top-level imports are measured (running it would start the app). The
+report lists the slowest modules by cumulative import time, and targets over
+their budget in import_budget.json make the command exit with status 1.
+
+    python app/import_budget.py                 # report and check
+    python app/import_budget.py --update        # re-baseline the budgets
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET_PATH = os.path.join(APP_DIR, "import_budget.json")
+
+# Headroom over the measured time when budgets are re-baselined, with a
+# floor so near-zero targets don't fail on timer noise
+UPDATE_HEADROOM = 1.5
+MIN_HEADROOM_MS = 50
+
+
+def script_imports(path):
+    """
+    Top-level modules imported by a script, in order
+
+    Imports nested in functions or branches are lazy by design and skipped.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def target_modules(target):
+    if target.endswith(".py"):
+        return script_imports(os.path.join(APP_DIR, target))
+    return [target]
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output
+
+    Returns:
+        List of (module, self us, cumulative us, depth) in report order
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "| imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def run_importtime(modules):
+    code = "import " + ", ".join(modules) if modules else "pass"
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {code!r} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def measure(target, repeat=5):
+    """
+    Import time of a target
+
+    Returns:
+        Dict with the total (ms) and the per-module cumulative times (ms) of
+        the fastest run, interpreter start-up modules excluded
+    """
+    startup = {name for name, *_ in run_importtime([])}
+    best = None
+    for _ in range(repeat):
+        rows = [row for row in run_importtime(target_modules(target)) if row[0] not in startup]
+        total = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total, rows = best
+    return {
+        "total_ms": total / 1000,
+        "modules": {name: cumulative / 1000 for name, _, cumulative, _ in rows},
+    }
+
+
+def load_budgets(path=BUDGET_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("targets", nargs="*", help="default: every target in the budget file")
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules listed per target")
+    parser.add_argument("--update", action="store_true", help="rewrite budgets from this run")
+    args = parser.parse_args(argv)
+
+    budgets = load_budgets(args.budget)
+    targets = args.targets or list(budgets["targets"])
+    over_budget = []
+    for target in targets:
+        report = measure(target, args.repeat)
+        budget = budgets["targets"].get(target, {}).get("budget_ms")
+        if args.update:
+            total = report["total_ms"]
+            budget = round(max(total * UPDATE_HEADROOM, total + MIN_HEADROOM_MS))
+            budgets["targets"].setdefault(target, {})["budget_ms"] = budget
+        status = "no budget" if budget is None else f"budget {budget:.0f} ms"
+        if budget is not None and report["total_ms"] > budget:
+            status += " EXCEEDED"
+            over_budget.append(target)
+        print(f"{target}: {report['total_ms']:.1f} ms ({status})")
+        slowest = sorted(report["modules"].items(), key=lambda item: -item[1])
+        for name, ms in slowest[: args.top]:
+            print(f"  {ms:9.1f} ms  {name}")
+
+    if args.update:
+        with open(args.budget, "w", encoding="utf-8") as f:
+            json.dump(budgets, f, indent=1)
+            f.write("\n")
+    if over_budget:
+        print("Over budget: " + ", ".join(over_budget), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Lightweight core of the sentiment app.
+
+Everything the serving hot path needs (regex normalization, the tokenizer
+referenced by the saved vectorizer, artifact loading and scoring) with no
+import-time dependency beyond the standard library: skops and nltk are only
+imported when an artifact or the stopword list is actually loaded. The
+scikit-learn transformers used for training live in sentiment.py.
+"""
+import re
+import sys
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def portuguese_stopwords():
+    # Read from the nltk corpus once per process
+    from nltk.corpus import stopwords
+
+    return tuple(stopwords.words('portuguese'))
+
+def custom_tokenizer(text, max_words=50):
+    tokens = text.split()[:max_words]
+    return tokens
+
+def load_skops(path):
+    # The vectorizer was saved from a notebook, so it references
+    # __main__.custom_tokenizer. Make it resolvable from any entry point.
+    main_module = sys.modules['__main__']
+    if not hasattr(main_module, 'custom_tokenizer'):
+        main_module.custom_tokenizer = custom_tokenizer
+    import skops.io as sio
+
+    unknown_types = sio.get_untrusted_types(file=path)
+    return sio.load(path, trusted=unknown_types)
+
+# Defining a function to plot the sentiment of a given phrase
+def sentiment_analysis(text, pipeline, vectorizer, model):
+    
+    # Applying the pipeline
+    if type(text) is not list:
+        text = [text]
+    # Without a pipeline the vectorizer takes raw text (feature_index.FeatureIndex)
+    text_prep = pipeline.transform(text) if pipeline is not None else text
+    matrix = vectorizer.transform(text_prep)
+    
+    # Predicting sentiment; predict() would score the matrix a second time
+    proba = model.predict_proba(matrix)
+    pred = model.classes_[proba.argmax(axis=1)]
+    return pred, proba
+    
+# Precompiled patterns of the regex_transformers chain, used by normalize_text
+_HIPERLINKS_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+_DATES_RE = re.compile(r'([0-2][0-9]|(3)[0-1])(\/|\.)(((0)[0-9])|((1)[0-2]))(\/|\.)\d{2,4}')
+_MONEY_RE = re.compile(r'[R]{0,1}\$[ ]{0,}\d+(,|\.)\d+')
+_NUMBERS_RE = re.compile(r'[0-9]+')
+_NEGATION_RE = re.compile(r'([nN][ãÃaA][oO]|[ñÑ]| [nN] )')
+_NON_WORD_RE = re.compile(r'\W+')
+
+def normalize_text(text):
+    """
+    Apply the whole regex_transformers chain to a single document
+
+    Produces exactly the output of ApplyRegex(regex_transformers) with
+    fewer passes over the text:
+      - line breaks are replaced with plain string replacement
+      - links, dates, money and numbers are only searched for when the text
+        contains what their patterns require ('http', an ASCII digit plus
+        '/' or '.', '$', an ASCII digit); earlier steps never introduce them
+      - special characters and whitespace runs are collapsed in one pass,
+        since every whitespace character is also a non-word character
+    """
+    if '\n' in text or '\r' in text:
+        text = text.replace('\n', ' ').replace('\r', ' ')
+    if 'http' in text:
+        text = _HIPERLINKS_RE.sub(' link ', text)
+    has_digit = _NUMBERS_RE.search(text) is not None
+    if has_digit and ('/' in text or '.' in text):
+        text = _DATES_RE.sub(' data ', text)
+    if '$' in text:
+        text = _MONEY_RE.sub(' dinheiro ', text)
+    if has_digit:
+        text = _NUMBERS_RE.sub(' numero ', text)
+    text = _NEGATION_RE.sub(' negação ', text)
+    return _NON_WORD_RE.sub(' ', text).rstrip(' ')
@@ -0,0 +1,108 @@
+"""
+NumPy scorer for the logistic sentiment model.
+
+The coefficients and intercept of logistic_sentiment.skops are exported to a
+small .npz file as float32. Scoring a batch is one sparse dot product, the
+sigmoid and the thresholded label, computed together, so the model is not
+evaluated twice (predict + predict_proba) and no scikit-learn validation
+runs per request. Loading only needs NumPy.
+
+    python app/linear_scorer.py app/logistic_sentiment.skops app/linear_sentiment.npz
+"""
+import os
+import sys
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SCORER_PATH = os.path.join(APP_DIR, "linear_sentiment.npz")
+DEFAULT_MODEL = os.path.join(APP_DIR, "logistic_sentiment.skops")
+
+
+class LinearScorer:
+    """
+    Binary linear classifier with a logistic link
+
+    Input:
+        Coefficient vector, intercept and the two class labels
+    """
+
+    def __init__(self, coef, intercept, classes):
+        self.coef = np.ascontiguousarray(coef, dtype=np.float32).ravel()
+        self.intercept = np.float32(intercept)
+        self.classes_ = np.asarray(classes)
+
+    @classmethod
+    def from_model(cls, model):
+        if model.coef_.shape[0] != 1:
+            raise ValueError("Only binary linear models can be exported")
+        return cls(model.coef_[0], model.intercept_[0], model.classes_)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(arrays["coef"], arrays["intercept"][0], arrays["classes"])
+
+    def save(self, path):
+        np.savez(
+            path,
+            coef=self.coef,
+            intercept=np.array([self.intercept], dtype=np.float32),
+            classes=self.classes_,
+        )
+
+    def matches(self, model, atol=1e-6):
+        # True when exported from this model (up to the float32 rounding)
+        return (
+            model.coef_.shape == (1, len(self.coef))
+            and np.allclose(model.coef_[0], self.coef, rtol=0, atol=atol)
+            and np.isclose(model.intercept_[0], self.intercept, rtol=0, atol=atol)
+            and np.array_equal(model.classes_, self.classes_)
+        )
+
+    def decision_function(self, matrix):
+        """
+        Linear scores of a CSR matrix (or dense 2-D array)
+        """
+        if hasattr(matrix, "indptr"):
+            # CSR: weight every stored value, then sum per row
+            n_rows = matrix.shape[0]
+            row_ids = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+            z = np.bincount(
+                row_ids,
+                weights=matrix.data * self.coef[matrix.indices],
+                minlength=n_rows,
+            )
+        else:
+            z = np.asarray(matrix) @ self.coef
+        return z + self.intercept
+
+    def score(self, matrix):
+        """
+        Labels and class probabilities in one pass
+
+        Returns:
+            Tuple (labels, probabilities) shaped like model.predict and
+            model.predict_proba
+        """
+        z = self.decision_function(matrix)
+        # Sigmoid written to never overflow exp
+        e = np.exp(-np.abs(z))
+        positive = np.where(z >= 0, 1.0, e) / (1.0 + e)
+        labels = self.classes_[(z > 0).astype(np.intp)]
+        return labels, np.column_stack([1.0 - positive, positive])
+
+    def predict(self, matrix):
+        return self.score(matrix)[0]
+
+    def predict_proba(self, matrix):
+        return self.score(matrix)[1]
+
+
+if __name__ == "__main__":
+    from inference import load_skops
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL
+    scorer_path = sys.argv[2] if len(sys.argv) > 2 else SCORER_PATH
+    LinearScorer.from_model(load_skops(model_path)).save(scorer_path)
+    print(f"Wrote {scorer_path}")
@@ -1,8 +1,11 @@
-import numpy as np
-import pandas as pd
+import datetime
+
 import streamlit as st
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from aggregates import current_version, load_aggregates, load_range_aggregates, time_bounds
+from charts import bar_chart, cached_chart, line_chart
+from resources import shared_cache
+from timeseries import load_store
 
 st.set_page_config(
     page_title="Olist EDA",
@@ -11,114 +14,8 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-site_df = pd.read_csv("./data/merged_data.csv")
-site_df["order_purchase_timestamp"] = pd.to_datetime(
-    site_df["order_purchase_timestamp"]
-)
-
-
-def classify_cat(x):
-    if x in [
-        "office_furniture",
-        "furniture_decor",
-        "furniture_living_room",
-        "kitchen_dining_laundry_garden_furniture",
-        "bed_bath_table",
-        "home_comfort",
-        "home_comfort_2",
-        "home_construction",
-        "garden_tools",
-        "furniture_bedroom",
-        "furniture_mattress_and_upholstery",
-    ]:
-        return "Furniture"
-
-    elif x in [
-        "auto",
-        "computers_accessories",
-        "musical_instruments",
-        "consoles_games",
-        "watches_gifts",
-        "air_conditioning",
-        "telephony",
-        "electronics",
-        "fixed_telephony",
-        "tablets_printing_image",
-        "computers",
-        "small_appliances_home_oven_and_coffee",
-        "small_appliances",
-        "audio",
-        "signaling_and_security",
-        "security_and_services",
-    ]:
-        return "Electronics"
-
-    elif x in [
-        "fashio_female_clothing",
-        "fashion_male_clothing",
-        "fashion_bags_accessories",
-        "fashion_shoes",
-        "fashion_sport",
-        "fashion_underwear_beach",
-        "fashion_childrens_clothes",
-        "baby",
-        "cool_stuff",
-    ]:
-        return "Fashion"
-
-    elif x in [
-        "housewares",
-        "home_confort",
-        "home_appliances",
-        "home_appliances_2",
-        "flowers",
-        "costruction_tools_garden",
-        "garden_tools",
-        "construction_tools_lights",
-        "costruction_tools_tools",
-        "luggage_accessories",
-        "la_cuisine",
-        "pet_shop",
-        "market_place",
-    ]:
-        return "Home & Garden"
-
-    elif x in [
-        "sports_leisure",
-        "toys",
-        "cds_dvds_musicals",
-        "music",
-        "dvds_blu_ray",
-        "cine_photo",
-        "party_supplies",
-        "christmas_supplies",
-        "arts_and_craftmanship",
-        "art",
-    ]:
-        return "Entertainment"
-
-    elif x in ["health_beauty", "perfumery", "diapers_and_hygiene"]:
-        return "Beauty & Health"
-
-    elif x in ["food_drink", "drinks", "food"]:
-        return "Food & Drinks"
-
-    elif x in [
-        "books_general_interest",
-        "books_technical",
-        "books_imported",
-        "stationery",
-    ]:
-        return "Books & Stationery"
-
-    elif x in [
-        "construction_tools_construction",
-        "construction_tools_safety",
-        "industry_commerce_and_business",
-        "agro_industry_and_commerce",
-    ]:
-        return "Industry & Construction"
-
+version = current_version()
+theme = st.get_option("theme.base") or "light"
 
 st.sidebar.title("Olist EDA")
 rad = st.sidebar.radio(
@@ -126,162 +23,198 @@ rad = st.sidebar.radio(
     ["Orders and Revenue", "Order Time Analytics", "Category wise Sales Distribution"],
 )
 
-site_df["product_category"] = site_df.product_category_name_english.apply(classify_cat)
+# Purchase date filter, available once the warehouse has been built
+first_purchase, last_purchase = shared_cache.get("time_bounds", version, time_bounds)
+picked = ()
+if first_purchase is not None:
+    picked = st.sidebar.date_input(
+        "Purchase dates",
+        value=(first_purchase.date(), last_purchase.date()),
+        min_value=first_purchase.date(),
+        max_value=last_purchase.date(),
+    )
+
+if len(picked) == 2 and picked != (first_purchase.date(), last_purchase.date()):
+    # Only the monthly order partitions overlapping the range are read
+    start, end = picked[0], picked[1] + datetime.timedelta(days=1)
+    cube = shared_cache.get(
+        ("aggregates", start, end), version, lambda: load_range_aggregates(start, end)
+    )
+    chart_version = f"{version}:{start}:{end}"
+else:
+    # Shared by every session until the dataset changes
+    cube = shared_cache.get("aggregates", version, load_aggregates)
+    start = end = None
+    chart_version = version
 
+# Hourly order buckets of the warehouse; time panels sum them for any range
+store = shared_cache.get("buckets", version, load_store)
+
+
+def show_chart(panel, draw=bar_chart, **chart_kwargs):
+    # Rendered once per (panel, data version, date range, theme), then served as PNG
+    png = cached_chart(panel, chart_version, lambda: draw(**chart_kwargs), theme)
+    st.image(png, use_column_width=True)
 
-import streamlit as st
 
 if rad == "Orders and Revenue":
     st.title("Order and Revenue Insights")
 
-    top_orders_cities = (
-        site_df.groupby("customer_city")["order_id"]
-        .count()
-        .reset_index()
-        .sort_values("order_id", ascending=False)
-    )
-    top_revenue_cities = (
-        site_df.groupby("customer_city")["payment_value"]
-        .sum()
-        .reset_index()
-        .sort_values("payment_value", ascending=False)
-    )
+    top_orders_cities = cube["top_orders_cities"]
+    top_revenue_cities = cube["top_revenue_cities"]
 
     col0, col1 = st.columns(2)
 
     with col0:
-        fig, ax0 = plt.subplots(figsize=(8, 9))
-        sns.barplot(
+        st.write("Cities Generating the Most Orders (Top 10)", fontsize=15)
+        show_chart(
+            "top_orders_cities",
+            data=top_orders_cities[:10],
             x="order_id",
             y="customer_city",
-            data=top_orders_cities[:10],
             palette="magma",
-            ax=ax0,
+            figsize=(8, 9),
+            xlabel="Number of Orders",
+            ylabel="Cities",
+            ytick_size=12,
         )
-        ax0.set_xlabel("Number of Orders", fontsize=14)
-        ax0.set_ylabel("Cities", fontsize=14)
-        ax0.tick_params(axis="y", labelsize=12)
-        st.write("Cities Generating the Most Orders (Top 10)", fontsize=15)
-
-        st.pyplot(fig)
 
     with col1:
-        fig, ax2 = plt.subplots(figsize=(8, 9))
-        sns.barplot(
-            x=site_df.seller_city.value_counts().values[:10],
-            y=site_df.seller_city.value_counts().index[:10],
+        st.write("Top 10 Sellers Cities", fontsize=15)
+        show_chart(
+            "seller_cities",
+            data=cube["seller_cities"][:10],
+            x="orders",
+            y="seller_city",
             palette="magma",
+            figsize=(8, 9),
+            xlabel="Number of Orders",
+            ylabel="Cities",
+            ytick_size=12,
         )
-        ax2.set_xlabel("Number of Orders", fontsize=14)
-        ax2.set_ylabel("Cities", fontsize=14)
-        ax2.tick_params(axis="y", labelsize=12)
-        st.write("Top 10 Sellers Cities", fontsize=15)
-        st.pyplot(fig)
 
-    fig, ax = plt.subplots(figsize=(14, 7))
-    sns.barplot(
+    st.write("Cities Generating the Highest Revenue (Top 10)", fontsize=15)
+    show_chart(
+        "top_revenue_cities",
+        data=top_revenue_cities[:10],
         x="payment_value",
         y="customer_city",
-        data=top_revenue_cities[:10],
         palette="magma",
-        ax=ax,
+        figsize=(14, 7),
+        xlabel="Total Revenue (in Millions of Brazilian Real)",
+        ylabel="Cities",
+        ytick_size=12,
     )
-    ax.set_xlabel("Total Revenue (in Millions of Brazilian Real)", fontsize=14)
-    ax.set_ylabel("Cities", fontsize=14)
-    ax.tick_params(axis="y", labelsize=12)
-    st.write("Cities Generating the Highest Revenue (Top 10)", fontsize=15)
-    st.pyplot(fig)
 
 if rad == "Order Time Analytics":
     st.title("Order Time Insights")
 
-    clrp = sns.color_palette("hls", 1)
+    # Resolved by seaborn only when the chart is drawn
+    clrp = ("hls", 1)
 
-    orders_byHour = (
-        site_df.groupby(site_df.order_purchase_timestamp.dt.hour)["order_id"]
-        .nunique()
-        .reset_index()
-    )
-    plt.figure(figsize=(15, 5))
-    ax = sns.barplot(
-        x="order_purchase_timestamp", y="order_id", data=orders_byHour, palette=clrp
-    )
-    ax.set_xlabel("Hour of Day", fontsize=14)
-    ax.set_ylabel("Number of Orders", fontsize=14)
-    st.write("Orders by Hour", fontsize=20)
-    st.pyplot(ax.figure)
+    if store is not None:
+        orders_byHour = store.by_hour_of_day(start, end)
+        orders_byDays = store.by_weekday(start, end)
+    else:
+        orders_byHour = cube["orders_by_hour"]
+        orders_byDays = cube["orders_by_day"]
 
-    orders_byDays = (
-        site_df.groupby(site_df.order_purchase_timestamp.dt.day_name())["order_id"]
-        .nunique()
-        .reset_index()
-        .sort_values("order_id", ascending=False)
+    st.write("Orders by Hour", fontsize=20)
+    show_chart(
+        "orders_by_hour",
+        data=orders_byHour,
+        x="order_purchase_timestamp",
+        y="order_id",
+        palette=clrp,
+        figsize=(15, 5),
+        xlabel="Hour of Day",
+        ylabel="Number of Orders",
     )
-    clrp = sns.color_palette("hls", 1)
 
-    plt.figure(figsize=(15, 5))
-    ax = sns.barplot(
-        x="order_purchase_timestamp", y="order_id", data=orders_byDays, palette=clrp
-    )
-    ax.set_xlabel("Day of Week", fontsize=14)
-    ax.set_ylabel("Number of Orders", fontsize=14)
     st.write("Orders by Day of Week", fontsize=20)
-    st.pyplot(ax.figure)
+    show_chart(
+        "orders_by_day",
+        data=orders_byDays,
+        x="order_purchase_timestamp",
+        y="order_id",
+        palette=clrp,
+        figsize=(15, 5),
+        xlabel="Day of Week",
+        ylabel="Number of Orders",
+    )
+
+    if store is not None:
+        monthly = store.rollup("month", start, end).reset_index()
+        col0, col1 = st.columns(2)
+
+        with col0:
+            st.write("Monthly Orders", fontsize=20)
+            show_chart(
+                "monthly_orders",
+                draw=line_chart,
+                data=monthly,
+                x="bucket",
+                y="orders",
+                figsize=(10, 6),
+                xlabel="Date",
+                ylabel="Number of Orders",
+            )
+
+        with col1:
+            st.write("Monthly Revenue", fontsize=20)
+            show_chart(
+                "monthly_revenue",
+                draw=line_chart,
+                data=monthly,
+                x="bucket",
+                y="revenue",
+                figsize=(10, 6),
+                xlabel="Year-Month",
+                ylabel="Revenue (BRL)",
+            )
 
 if rad == "Category wise Sales Distribution":
     st.title("Category wise Sales Distribution")
 
     col0, col1 = st.columns(2)
-    prodCat_TopOrders = (
-        site_df.groupby(site_df["product_category_name_english"])["order_id"]
-        .nunique()
-        .reset_index()
-        .sort_values("order_id", ascending=False)
-    )
-    prodCat_TopOrders = (
-        site_df.groupby(site_df["product_category_name_english"])["order_id"]
-        .nunique()
-        .reset_index()
-        .sort_values("order_id", ascending=True)
-    )
+    prodCat_TopOrders = cube["category_orders"]
+    prodCat_BottomOrders = prodCat_TopOrders.sort_values("order_id", ascending=True)
 
     with col0:
-        fig, ax0 = plt.subplots(figsize=(8, 9))
-        sns.barplot(
+        st.write("Product Categories with the Highest Orders (Top 10)")
+        show_chart(
+            "top_categories",
+            data=prodCat_TopOrders[:10],
             x="order_id",
             y="product_category_name_english",
-            data=prodCat_TopOrders[:10],
             palette="magma",
-            ax=ax0,
+            figsize=(8, 9),
+            xlabel="Number of Orders",
+            ylabel="Product Categories",
+            ytick_size=12,
         )
-        ax0.set_xlabel("Number of Orders", fontsize=14)
-        ax0.set_ylabel("Product Categories", fontsize=14)
-        ax0.tick_params(axis="y", labelsize=12)
-        st.write("Product Categories with the Highest Orders (Top 10)")
-
-        st.pyplot(fig)
 
     with col1:
-        fig, ax1 = plt.subplots(figsize=(8, 9))
-        sns.barplot(
+        st.write("Product Categories with the Lowest Orders")
+        show_chart(
+            "bottom_categories",
+            data=prodCat_BottomOrders[:10],
             x="order_id",
             y="product_category_name_english",
-            data=prodCat_TopOrders[:10],
             palette="rocket_r",
+            figsize=(8, 9),
+            xlabel="Number of Orders",
+            ylabel="Product Categories",
+            ytick_size=12,
         )
-        ax1.set_xlabel("Number of Orders", fontsize=14)
-        ax1.set_ylabel("Product Categories", fontsize=14)
-        ax1.tick_params(axis="y", labelsize=12)
-        st.write("Product Categories with the Lowest Orders")
 
-        st.pyplot(fig)
-
-    fig = plt.figure(figsize=[5, 3])
-    sns.barplot(
-        x=site_df.product_category.value_counts().values,
-        y=site_df.product_category.value_counts().index,
+    st.write("Number of orders per each SuperCategory")
+    show_chart(
+        "super_categories",
+        data=cube["super_category_orders"],
+        x="orders",
+        y="product_category",
         palette="crest_r",
+        figsize=(5, 3),
+        xtick_rotation=45,
     )
-    st.write("Number of orders per each SuperCategory")
-    plt.xticks(rotation=45)
-    st.pyplot(fig)
@@ -0,0 +1,302 @@
+"""
+Streaming n-gram statistics per label group.
+
+review_analysis.ipynb fitted a CountVectorizer per (n, sentiment) pair and
+sorted the whole vocabulary in Python to keep ten n-grams. NgramCounter reads
+the corpus once, in chunks: each chunk is vectorized for every n from 1 to
+`max_n` at once and reduced to per-label counts with one sparse product
+(label indicator matrix @ document-term matrix). top_k selects with
+argpartition per (label, n) and returns one tidy frame.
+
+Tokenization is CountVectorizer's (lowercase, \\w\\w+ tokens, stop words
+removed before n-grams are formed), so exact counts equal the notebook's.
+
+Exact mode keeps every distinct n-gram. For corpora whose vocabulary does
+not fit in memory, `sketch_width` switches to a count-min sketch: counts go
+to `sketch_depth` hashed rows of `sketch_width` counters per label and only
+the `candidates` best n-grams per (label, n) are kept by name. Sketch counts
+are estimates that can only overshoot, by at most 2 * total / width with
+probability 1 - 2**-depth per n-gram.
+
+    python app/ngram_stats.py data/comments.csv --max-n 3 --top 10
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer
+
+# Mersenne prime for the sketch's universal hash family; hashes and
+# multipliers stay below it so products fit in int64
+_PRIME = (1 << 31) - 1
+LABEL_NAMES = {0: "negative", 1: "positive"}
+
+
+class NgramCounter:
+    """
+    Counts 1..max_n-grams for every label group in a single pass
+
+    Input:
+        Largest n, stop words, optional count-min sketch width (None counts
+        exactly), sketch depth, n-grams tracked per (label, n) in sketch
+        mode and a seed for the sketch hashes
+    """
+
+    def __init__(
+        self,
+        max_n=3,
+        stop_words=None,
+        sketch_width=None,
+        sketch_depth=4,
+        candidates=1000,
+        seed=0,
+    ):
+        self.max_n = max_n
+        self.stop_words = list(stop_words) if stop_words is not None else None
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        self.candidates = candidates
+        self.labels = []
+        self.documents = 0
+        self._label_index = {}
+        if sketch_width:
+            rng = np.random.default_rng(seed)
+            self._hash_a = rng.integers(1, _PRIME, size=(sketch_depth, 1), dtype=np.int64)
+            self._hash_b = rng.integers(0, _PRIME, size=(sketch_depth, 1), dtype=np.int64)
+            self._sketch = np.zeros((0, sketch_depth, sketch_width), dtype=np.int64)
+            # (label row, n) -> {ngram: estimated count}
+            self._candidates = {}
+        else:
+            self._vocabulary = {}
+            self._ngram_n = np.zeros(0, dtype=np.int8)
+            self._counts = np.zeros((0, 0), dtype=np.int64)
+            self._id_terms = np.zeros(0, dtype=object)
+
+    def _vectorizer(self):
+        return CountVectorizer(stop_words=self.stop_words, ngram_range=(1, self.max_n))
+
+    def _label_rows(self, labels):
+        # Label values -> rows of the count arrays, registering new labels
+        for label in pd.unique(labels):
+            if label not in self._label_index:
+                self._label_index[label] = len(self.labels)
+                self.labels.append(label)
+        return np.array([self._label_index[label] for label in labels], dtype=np.int64)
+
+    def partial_fit(self, texts, labels):
+        """
+        Add a chunk of documents with their labels
+        """
+        texts = list(texts)
+        labels = np.asarray(labels)
+        if len(texts) != len(labels):
+            raise ValueError("texts and labels must have the same length")
+        if not texts:
+            return self
+        rows = self._label_rows(labels)
+        self.documents += len(texts)
+        vectorizer = self._vectorizer()
+        try:
+            matrix = vectorizer.fit_transform(texts)
+        except ValueError:
+            # Only stop words in this chunk
+            return self
+        terms = vectorizer.get_feature_names_out()
+
+        # Label indicator @ documents x terms: one row of counts per label
+        indicator = csr_matrix(
+            (np.ones(len(texts), dtype=np.int64), (rows, np.arange(len(texts)))),
+            shape=(len(self.labels), len(texts)),
+        )
+        chunk_counts = (indicator @ matrix).toarray()
+        ngram_n = np.char.count(terms.astype(str), " ") + 1
+
+        if self.sketch_width:
+            self._add_to_sketch(terms, ngram_n, chunk_counts)
+        else:
+            self._add_exact(terms, ngram_n, chunk_counts)
+        return self
+
+    def _add_exact(self, terms, ngram_n, chunk_counts):
+        vocabulary = self._vocabulary
+        ids = np.fromiter(
+            (vocabulary.setdefault(term, len(vocabulary)) for term in terms),
+            dtype=np.int64,
+            count=len(terms),
+        )
+        n_labels, capacity = self._counts.shape
+        if len(vocabulary) > capacity or len(self.labels) > n_labels:
+            # Amortized doubling of the term axis
+            new_capacity = max(len(vocabulary), 2 * capacity)
+            counts = np.zeros((len(self.labels), new_capacity), dtype=np.int64)
+            counts[:n_labels, :capacity] = self._counts
+            ngram = np.zeros(new_capacity, dtype=np.int8)
+            ngram[:capacity] = self._ngram_n
+            self._counts, self._ngram_n = counts, ngram
+        # Terms are unique within a chunk, so fancy-index += is safe
+        self._counts[:, ids] += chunk_counts
+        self._ngram_n[ids] = ngram_n
+
+    def _sketch_columns(self, terms):
+        # Python's string hash (stable within the process, which is all the
+        # in-memory sketch needs), spread over `depth` independent rows
+        hashes = np.fromiter((hash(term) for term in terms), dtype=np.int64, count=len(terms))
+        hashes = (hashes & _PRIME) % _PRIME
+        return (self._hash_a * hashes + self._hash_b) % _PRIME % self.sketch_width
+
+    def _add_to_sketch(self, terms, ngram_n, chunk_counts):
+        if len(self.labels) > self._sketch.shape[0]:
+            grown = np.zeros(
+                (len(self.labels), self.sketch_depth, self.sketch_width), dtype=np.int64
+            )
+            grown[: self._sketch.shape[0]] = self._sketch
+            self._sketch = grown
+        columns = self._sketch_columns(terms)
+        for row in range(len(self.labels)):
+            counts = chunk_counts[row]
+            present = counts > 0
+            if not present.any():
+                continue
+            for depth in range(self.sketch_depth):
+                self._sketch[row, depth] += np.bincount(
+                    columns[depth, present], weights=counts[present], minlength=self.sketch_width
+                ).astype(np.int64)
+            estimates = self._sketch[row, np.arange(self.sketch_depth)[:, None], columns].min(
+                axis=0
+            )
+            for n in np.unique(ngram_n[present]):
+                self._update_candidates(row, int(n), terms, estimates, present & (ngram_n == n))
+
+    def _update_candidates(self, row, n, terms, estimates, mask):
+        # Merge the chunk's n-grams into the tracked set and keep the best
+        tracked = self._candidates.setdefault((row, n), {})
+        tracked.update(zip(terms[mask].tolist(), estimates[mask].tolist()))
+        if len(tracked) > self.candidates:
+            names = np.array(list(tracked))
+            values = np.fromiter(tracked.values(), dtype=np.int64, count=len(tracked))
+            keep = np.argpartition(-values, self.candidates - 1)[: self.candidates]
+            self._candidates[(row, n)] = dict(zip(names[keep].tolist(), values[keep].tolist()))
+
+    def _group_counts(self, row, n):
+        # (ngrams, counts) of one label group and n
+        if self.sketch_width:
+            tracked = self._candidates.get((row, n), {})
+            return np.array(list(tracked), dtype=object), np.fromiter(
+                tracked.values(), dtype=np.int64, count=len(tracked)
+            )
+        size = len(self._vocabulary)
+        mask = (self._ngram_n[:size] == n) & (self._counts[row, :size] > 0)
+        ids = np.flatnonzero(mask)
+        if len(self._id_terms) != size:
+            self._id_terms = np.array(list(self._vocabulary), dtype=object)
+        return self._id_terms[ids], self._counts[row, ids]
+
+    def top_k(self, k=10):
+        """
+        The k most frequent n-grams of every label group and n
+
+        Returns:
+            DataFrame with columns label, n, rank, ngram, count, ordered by
+            label, n and rank (ties broken alphabetically)
+        """
+        frames = []
+        for row, label in enumerate(self.labels):
+            for n in range(1, self.max_n + 1):
+                ngrams, counts = self._group_counts(row, n)
+                if not len(counts):
+                    continue
+                if len(counts) > k:
+                    best = np.argpartition(-counts, k - 1)[:k]
+                    ngrams, counts = ngrams[best], counts[best]
+                order = np.lexsort((ngrams.astype(str), -counts))
+                frames.append(
+                    pd.DataFrame(
+                        {
+                            "label": label,
+                            "n": n,
+                            "rank": np.arange(1, len(order) + 1),
+                            "ngram": ngrams[order].astype(str),
+                            "count": counts[order],
+                        }
+                    )
+                )
+        columns = ["label", "n", "rank", "ngram", "count"]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)[columns]
+
+
+def count_reviews(
+    path,
+    max_n=3,
+    chunk_size=20_000,
+    sketch_width=None,
+    stem=True,
+    workers=1,
+):
+    """
+    N-gram counts of a review CSV by sentiment label
+
+    Texts go through build_prod_pipeline() first when `stem` is set, as the
+    notebook's `stemming` column did.
+
+    Returns:
+        Fitted NgramCounter with labels "negative" and "positive"
+    """
+    from inference import portuguese_stopwords
+    from train_sentiment import read_reviews
+
+    pipeline = None
+    if stem:
+        if workers > 1:
+            from parallel_preprocess import ParallelPreprocessor
+
+            pipeline = ParallelPreprocessor(workers)
+        else:
+            from sentiment import build_prod_pipeline
+
+            pipeline = build_prod_pipeline()
+    try:
+        counter = NgramCounter(max_n, portuguese_stopwords(), sketch_width=sketch_width)
+        for _, texts, labels in read_reviews(path, chunk_size):
+            if pipeline is not None:
+                texts = pipeline.transform(texts)
+            counter.partial_fit(texts, [LABEL_NAMES[label] for label in labels])
+    finally:
+        if hasattr(pipeline, "close"):
+            pipeline.close()
+    return counter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="review CSV with score and comment columns")
+    parser.add_argument("--max-n", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=20_000)
+    parser.add_argument(
+        "--sketch-width", type=int, default=None, help="count-min sketch width (default: exact)"
+    )
+    parser.add_argument("--raw", action="store_true", help="count raw text instead of stems")
+    parser.add_argument("--workers", type=int, default=1, help="preprocessing processes")
+    parser.add_argument("--output", help="write the table to this CSV instead of printing it")
+    args = parser.parse_args(argv)
+
+    counter = count_reviews(
+        args.input,
+        max_n=args.max_n,
+        chunk_size=args.chunk_size,
+        sketch_width=args.sketch_width,
+        stem=not args.raw,
+        workers=args.workers,
+    )
+    table = counter.top_k(args.top)
+    if args.output:
+        table.to_csv(args.output, index=False)
+    else:
+        print(table.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
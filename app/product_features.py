@@ -0,0 +1,303 @@
+"""
+Product feature table for the sales prediction model.
+
+Sales Prediction.ipynb built the features with four groupby('product_id')
+aggregations over the exploded merged_data.csv, three outer merges and a
+right merge that re-expanded the result to one row per merged row. Here the
+item-grain facts of the warehouse are aggregated once per product, so every
+product appears exactly once:
+
+    sales_amt            distinct orders containing the product (target)
+    avg_review_score     mean review score of those orders' items
+    avg_price            mean item price
+    estimated_delivery   mean days between delivery and the estimated date
+    product_category     super-category, encoded like the notebook's
+                         LabelEncoder (sorted super-category names)
+
+Means are taken over order items, not over the item x payment x review rows
+of the merged file.
+
+The table stores sums and counts rather than means, so it can be updated
+with only the orders purchased after its high-water mark: only the products
+in those orders are recomputed, and each row records the table version that
+last changed it, which lets the scorer re-score just those products.
+
+The warehouse is rebuilt as a whole on every ingest, so orders before the
+mark may also be added, dropped or edited (late reviews or deliveries).
+When its version changes, the totals of every sum and count over the items
+up to the mark are compared with the table's, and the table is rebuilt if
+they differ.
+
+    python app/product_features.py build
+    python app/product_features.py update
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from taxonomy import SUPER_CATEGORIES
+from warehouse import WAREHOUSE_DIR, Warehouse
+
+FEATURES_PATH = "./data/features/product_features.arrow"
+FEATURE_COLUMNS = ["avg_review_score", "avg_price", "estimated_delivery", "product_category"]
+TARGET_COLUMN = "sales_amt"
+
+# LabelEncoder codes of the notebook: position in the sorted class names
+CATEGORY_CODES = {name: code for code, name in enumerate(sorted(SUPER_CATEGORIES))}
+
+# Item-grain columns read from the warehouse
+ITEM_COLUMNS = [
+    "order_key",
+    "product_key",
+    "price",
+    "review_score",
+    "order_delivered_customer_date",
+    "order_estimated_delivery_date",
+    "order_purchase_timestamp",
+]
+
+# Sums and counts behind each mean feature
+STATISTICS = {
+    "avg_review_score": ("review_sum", "review_count"),
+    "avg_price": ("price_sum", "price_count"),
+    "estimated_delivery": ("delivery_sum", "delivery_count"),
+}
+
+# Schema metadata key of the stored table
+METADATA_KEY = b"olist.features"
+
+
+def product_statistics(items, products):
+    """
+    Per-product sums and counts of a batch of order items
+
+    Input:
+        Item-grain frame with the ITEM_COLUMNS and the dim_products frame
+        (product_id, product_category)
+    Returns:
+        DataFrame indexed by product_id
+    """
+    items = items[(items.product_key >= 0) & (items.order_key >= 0)]
+    delivery = (
+        items.order_estimated_delivery_date - items.order_delivered_customer_date
+    ).dt.days
+    grouped = items.assign(delivery=delivery).groupby("product_key", sort=True)
+    stats = grouped.agg(
+        sales_amt=("order_key", "nunique"),
+        review_sum=("review_score", "sum"),
+        review_count=("review_score", "count"),
+        price_sum=("price", "sum"),
+        price_count=("price", "count"),
+        delivery_sum=("delivery", "sum"),
+        delivery_count=("delivery", "count"),
+    )
+    keys = stats.index.to_numpy()
+    stats.index = pd.Index(products.product_id.to_numpy()[keys], name="product_id")
+    stats.insert(0, "product_category", products.product_category.astype(str).to_numpy()[keys])
+    return stats.sort_index()
+
+
+def statistics_totals(items):
+    """
+    Column totals of product_statistics over all products, without grouping
+
+    Returns:
+        Series indexed by the statistics columns
+    """
+    items = items[(items.product_key >= 0) & (items.order_key >= 0)]
+    delivery = (
+        items.order_estimated_delivery_date - items.order_delivered_customer_date
+    ).dt.days
+    return pd.Series(
+        {
+            # Sum over products of their distinct orders
+            "sales_amt": int((~items.duplicated(["product_key", "order_key"])).sum()),
+            "review_sum": items.review_score.sum(),
+            "review_count": items.review_score.count(),
+            "price_sum": items.price.sum(),
+            "price_count": items.price.count(),
+            "delivery_sum": delivery.sum(),
+            "delivery_count": delivery.count(),
+        },
+        dtype="float64",
+    )
+
+
+class ProductFeatureTable:
+    """
+    Per-product sufficient statistics with incremental updates
+
+    Input:
+        Statistics frame indexed by product_id (with an `updated` column),
+        table version, purchase-time high-water mark and the version of the
+        warehouse the statistics come from
+    """
+
+    def __init__(self, stats, version=1, watermark=None, warehouse_version=None):
+        self.stats = stats
+        self.version = version
+        self.watermark = watermark
+        self.warehouse_version = warehouse_version
+
+    @staticmethod
+    def _read_items(wh, start=None):
+        items = wh.frame("items", ITEM_COLUMNS, start=start)
+        products = wh.table("dim_products", ["product_id", "product_category"])
+        return items, products
+
+    @classmethod
+    def build(cls, wh):
+        """
+        Compute the table from every order in the warehouse
+        """
+        items, products = cls._read_items(wh)
+        stats = product_statistics(items, products)
+        stats["updated"] = 1
+        _, last_purchase = wh.time_bounds()
+        return cls(stats, 1, last_purchase, wh.version)
+
+    def is_consistent(self, wh):
+        """
+        Whether the warehouse items up to the mark add up to the table
+
+        Compares the totals of every statistics column, so orders added,
+        dropped or edited before the mark are detected unless their changes
+        cancel out exactly.
+        """
+        counters = self.stats.columns.drop(["product_category", "updated"])
+        if self.watermark is None:
+            return self.stats.empty
+        items = wh.frame("items", ITEM_COLUMNS, end=self.watermark + pd.Timedelta(1, "ns"))
+        expected = statistics_totals(items)[counters]
+        return np.allclose(self.stats[counters].sum(), expected, rtol=1e-9, atol=1e-6)
+
+    def _rebuild(self, wh):
+        # Replace the statistics with a fresh build; every product changed
+        fresh = ProductFeatureTable.build(wh)
+        touched = self.stats.index.union(fresh.stats.index)
+        self.version += 1
+        fresh.stats["updated"] = self.version
+        self.stats = fresh.stats
+        self.watermark = fresh.watermark
+        self.warehouse_version = fresh.warehouse_version
+        return touched
+
+    def update(self, wh):
+        """
+        Add the orders purchased after the high-water mark
+
+        Only the products of those orders are recomputed, unless the
+        warehouse changed before the mark (see is_consistent), in which case
+        the table is rebuilt.
+
+        Returns:
+            Index of the product ids that changed
+        """
+        if self.warehouse_version != wh.version and not self.is_consistent(wh):
+            return self._rebuild(wh)
+        start = None if self.watermark is None else self.watermark + pd.Timedelta(1, "ns")
+        items, products = self._read_items(wh, start)
+        self.warehouse_version = wh.version
+        if items.empty:
+            return pd.Index([], name="product_id")
+
+        delta = product_statistics(items, products)
+        self.version += 1
+        touched = delta.index
+        counters = delta.columns.drop("product_category")
+        current = self.stats.reindex(touched)
+        current["product_category"] = delta["product_category"]
+        current[counters] = current[counters].fillna(0) + delta[counters]
+        current["updated"] = self.version
+        self.stats = pd.concat([self.stats.drop(touched, errors="ignore"), current]).sort_index()
+        self.watermark = items.order_purchase_timestamp.max()
+        return touched
+
+    def changed_since(self, version):
+        # Product ids whose features changed after `version`
+        return self.stats.index[self.stats.updated.to_numpy() > version]
+
+    def features(self, products=None, dropna=True):
+        """
+        Model features and target per product
+
+        Input:
+            Optional product ids to restrict to and whether to drop products
+            with a missing feature (as the notebook's dropna did)
+        Returns:
+            DataFrame indexed by product_id with TARGET_COLUMN followed by
+            FEATURE_COLUMNS
+        """
+        stats = self.stats if products is None else self.stats.reindex(products)
+        frame = pd.DataFrame(index=stats.index)
+        frame[TARGET_COLUMN] = stats[TARGET_COLUMN]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for column, (total, count) in STATISTICS.items():
+                frame[column] = stats[total] / stats[count].where(stats[count] > 0)
+        frame["product_category"] = stats["product_category"].map(CATEGORY_CODES)
+        if dropna:
+            frame = frame.dropna()
+        return frame
+
+    def save(self, path=FEATURES_PATH):
+        table = pa.Table.from_pandas(self.stats, preserve_index=True)
+        metadata = dict(table.schema.metadata or {})
+        metadata[METADATA_KEY] = json.dumps(
+            {
+                "version": self.version,
+                "watermark": None if self.watermark is None else self.watermark.isoformat(),
+                "warehouse_version": self.warehouse_version,
+            }
+        ).encode()
+        table = table.replace_schema_metadata(metadata)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=FEATURES_PATH):
+        table = feather.read_table(path, memory_map=True)
+        info = json.loads(table.schema.metadata[METADATA_KEY])
+        watermark = info["watermark"]
+        return cls(
+            table.to_pandas(),
+            info["version"],
+            None if watermark is None else pd.Timestamp(watermark),
+            info["warehouse_version"],
+        )
+
+
+def training_frame(table):
+    """
+    Rows for Sales Prediction.ipynb: product_id, sales_amt and the features
+    """
+    return table.features().astype({TARGET_COLUMN: "int64", "product_category": "int64"}).reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["build", "update"])
+    parser.add_argument("--warehouse", default=WAREHOUSE_DIR)
+    parser.add_argument("--output", default=FEATURES_PATH)
+    args = parser.parse_args(argv)
+
+    wh = Warehouse(args.warehouse)
+    if args.command == "build" or not os.path.exists(args.output):
+        table = ProductFeatureTable.build(wh)
+        message = f"{len(table.stats)} products"
+    else:
+        table = ProductFeatureTable.load(args.output)
+        touched = table.update(wh)
+        message = f"{len(touched)} products updated"
+    table.save(args.output)
+    print(f"Wrote {args.output} (version {table.version}): {message}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Incremental refresh of the sentiment model from new reviews.
+
+Models are kept as numbered versions under a store directory:
+
+    models/sentiment/v0001/tfidf_vectorizer.skops
+                          /logistic_sentiment.skops
+                          /state.json     documents seen, document frequency
+                                          of every vocabulary term, parent
+                                          version and holdout metrics
+
+A refresh reads only the new reviews: it adds their document frequencies to
+the stored ones and recomputes the idf of the existing vocabulary, then
+continues training the classifier with partial_fit from the current
+coefficients. The result is written as the next version, with the holdout
+metrics of the previous and the refreshed model on the new reviews' holdout
+rows. Cost is proportional to the new reviews, not to the corpus.
+
+    python app/refresh_sentiment.py init --documents 40977
+    python app/refresh_sentiment.py refresh new_reviews.csv
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+from inference import load_skops
+from train_sentiment import (
+    CLASSES,
+    HoldoutMetrics,
+    build_vectorizer,
+    holdout_mask,
+    read_reviews,
+    smooth_idf,
+)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(os.path.dirname(APP_DIR), "models", "sentiment")
+VECTORIZER_FILE = "tfidf_vectorizer.skops"
+MODEL_FILE = "logistic_sentiment.skops"
+STATE_FILE = "state.json"
+
+_VERSION_RE = re.compile(r"^v(\d{4,})$")
+
+
+def versions(store_dir=STORE_DIR):
+    # Version numbers present in the store, ascending
+    if not os.path.isdir(store_dir):
+        return []
+    found = (_VERSION_RE.match(name) for name in os.listdir(store_dir))
+    return sorted(int(match.group(1)) for match in found if match)
+
+
+def version_dir(store_dir, version):
+    return os.path.join(store_dir, f"v{version:04d}")
+
+
+def load_version(store_dir=STORE_DIR, version=None):
+    """
+    Load a stored version (the latest by default)
+
+    Returns:
+        Tuple (vectorizer, model, state)
+    """
+    if version is None:
+        available = versions(store_dir)
+        if not available:
+            raise FileNotFoundError(f"No model versions in {store_dir}")
+        version = available[-1]
+    path = version_dir(store_dir, version)
+    with open(os.path.join(path, STATE_FILE), encoding="utf-8") as f:
+        state = json.load(f)
+    vectorizer = load_skops(os.path.join(path, VECTORIZER_FILE))
+    model = load_skops(os.path.join(path, MODEL_FILE))
+    return vectorizer, model, state
+
+
+def write_version(store_dir, vectorizer, model, state):
+    """
+    Write the next version of the store
+
+    The version is written to a temporary directory and renamed into place.
+
+    Returns:
+        Path of the new version
+    """
+    import skops.io as sio
+
+    available = versions(store_dir)
+    version = available[-1] + 1 if available else 1
+    state = dict(
+        state,
+        version=version,
+        created=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    )
+    path = version_dir(store_dir, version)
+    tmp_path = path + ".tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    sio.dump(vectorizer, os.path.join(tmp_path, VECTORIZER_FILE))
+    sio.dump(model, os.path.join(tmp_path, MODEL_FILE))
+    with open(os.path.join(tmp_path, STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+def recover_document_frequencies(idf, n_docs):
+    """
+    Invert the smooth idf of a fitted vectorizer
+
+    Input:
+        idf vector and the number of documents it was fitted on
+    Returns:
+        Integer document frequencies
+    """
+    df = (1 + n_docs) / np.exp(np.asarray(idf) - 1) - 1
+    rounded = np.rint(df)
+    if np.abs(df - rounded).max() > 1e-3 or (rounded < 0).any():
+        raise ValueError("idf is not consistent with the given number of documents")
+    return rounded.astype(np.int64)
+
+
+def init_store(store_dir, vectorizer_path, model_path, n_docs):
+    """
+    Seed the store with an existing vectorizer and model as version 1
+
+    Input:
+        Store directory, paths of the skops artifacts and the number of
+        documents the vectorizer was fitted on (train_sentiment.py reports
+        it as "documents")
+    """
+    if versions(store_dir):
+        raise FileExistsError(f"{store_dir} already holds model versions")
+    vectorizer = load_skops(vectorizer_path)
+    model = load_skops(model_path)
+    state = {
+        "parent": None,
+        "documents": int(n_docs),
+        "document_frequency": recover_document_frequencies(vectorizer.idf_, n_docs).tolist(),
+        "source": {"vectorizer": vectorizer_path, "model": model_path},
+    }
+    return write_version(store_dir, vectorizer, model, state)
+
+
+def warm_start_model(model, n_docs, eta0=0.05):
+    """
+    SGD learner continuing from a fitted binary linear model
+
+    An SGDClassifier keeps its L2 strength. Any other linear model (the
+    notebook's LogisticRegression) becomes an SGDClassifier with the same
+    coefficients and the equivalent L2 strength for `n_docs` samples.
+    Updates use a constant step `eta0`: the "optimal" schedule restarts
+    with steps close to 1 for weak regularization, which undoes much of the
+    base model on a small delta.
+    """
+    from sklearn.base import clone
+    from sklearn.linear_model import SGDClassifier
+
+    if isinstance(model, SGDClassifier):
+        learner = clone(model)
+        alpha = model.alpha
+        t = model.t_
+    else:
+        # LogisticRegression minimizes C * sum(loss) + ||w||^2 / 2
+        alpha = 1.0 / (getattr(model, "C", 1.0) * max(n_docs, 1))
+        learner = SGDClassifier(loss="log_loss", alpha=alpha)
+        t = float(n_docs)
+    learner.set_params(alpha=alpha, learning_rate="constant", eta0=eta0)
+    learner.coef_ = np.array(model.coef_, dtype=np.float64, copy=True)
+    learner.intercept_ = np.array(model.intercept_, dtype=np.float64, copy=True)
+    learner.t_ = t
+    return learner
+
+
+def refresh(
+    new_reviews_path,
+    store_dir=STORE_DIR,
+    chunk_size=20_000,
+    epochs=3,
+    eta0=0.05,
+    test_size=0.2,
+    seed=0,
+    workers=1,
+    verbose=False,
+):
+    """
+    Refresh the latest version with a file of new reviews
+
+    Returns:
+        Tuple (path of the new version, its state)
+    """
+    from parallel_preprocess import ParallelPreprocessor
+    from sentiment import build_prod_pipeline
+
+    vectorizer, model, state = load_version(store_dir)
+    pipeline = ParallelPreprocessor(workers) if workers > 1 else build_prod_pipeline()
+    try:
+        vocabulary = list(vectorizer.get_feature_names_out())
+
+        # Document frequencies of the existing vocabulary in the new reviews
+        df = np.asarray(state["document_frequency"], dtype=np.int64)
+        n_docs = state["documents"]
+        new_docs = 0
+        for _, texts, _ in read_reviews(new_reviews_path, chunk_size):
+            matrix = vectorizer.transform(pipeline.transform(texts))
+            df += np.bincount(matrix.indices, minlength=len(vocabulary))
+            new_docs += len(texts)
+        if not new_docs:
+            raise ValueError(f"No reviews in {new_reviews_path}")
+        n_docs += new_docs
+        refreshed = build_vectorizer(vocabulary, smooth_idf(df, n_docs), vectorizer.stop_words)
+
+        learner = warm_start_model(model, state["documents"], eta0)
+        previous_metrics = HoldoutMetrics()
+        refreshed_metrics = HoldoutMetrics()
+        for epoch in range(epochs):
+            for rows, texts, labels in read_reviews(new_reviews_path, chunk_size):
+                stems = pipeline.transform(texts)
+                matrix = refreshed.transform(stems)
+                test = holdout_mask(rows, test_size, seed)
+                if (~test).any():
+                    learner.partial_fit(matrix[~test], labels[~test], classes=CLASSES)
+                if epoch == epochs - 1 and test.any():
+                    old_matrix = vectorizer.transform([s for s, keep in zip(stems, test) if keep])
+                    previous_metrics.update(labels[test], model.predict_proba(old_matrix)[:, 1])
+            if verbose:
+                print(f"epoch {epoch} done", file=sys.stderr)
+
+        # Score the holdout rows with the final coefficients
+        for rows, texts, labels in read_reviews(new_reviews_path, chunk_size):
+            test = holdout_mask(rows, test_size, seed)
+            if test.any():
+                stems = pipeline.transform([text for text, keep in zip(texts, test) if keep])
+                refreshed_metrics.update(
+                    labels[test], learner.predict_proba(refreshed.transform(stems))[:, 1]
+                )
+    finally:
+        if isinstance(pipeline, ParallelPreprocessor):
+            pipeline.close()
+
+    new_state = {
+        "parent": state["version"],
+        "documents": int(n_docs),
+        "new_documents": int(new_docs),
+        "document_frequency": df.tolist(),
+        "source": {"new_reviews": new_reviews_path},
+        "holdout": {
+            "previous": previous_metrics.report(),
+            "refreshed": refreshed_metrics.report(),
+        },
+    }
+    return write_version(store_dir, refreshed, learner, new_state), new_state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--store", default=STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser("init", help="seed the store with existing artifacts")
+    init.add_argument("--vectorizer", default=os.path.join(APP_DIR, VECTORIZER_FILE))
+    init.add_argument("--model", default=os.path.join(APP_DIR, MODEL_FILE))
+    init.add_argument(
+        "--documents", type=int, required=True, help="documents the vectorizer was fitted on"
+    )
+
+    update = commands.add_parser("refresh", help="train the next version on new reviews")
+    update.add_argument("input", help="CSV of new reviews with score and comment columns")
+    update.add_argument("--chunk-size", type=int, default=20_000)
+    update.add_argument("--epochs", type=int, default=3)
+    update.add_argument("--eta0", type=float, default=0.05, help="constant SGD step")
+    update.add_argument("--test-size", type=float, default=0.2)
+    update.add_argument("--seed", type=int, default=0)
+    update.add_argument("--workers", type=int, default=1)
+    update.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        path = init_store(args.store, args.vectorizer, args.model, args.documents)
+        print(f"Wrote {path}")
+        return
+
+    path, state = refresh(
+        args.input,
+        args.store,
+        chunk_size=args.chunk_size,
+        epochs=args.epochs,
+        eta0=args.eta0,
+        test_size=args.test_size,
+        seed=args.seed,
+        workers=args.workers,
+        verbose=args.verbose,
+    )
+    print(f"Wrote {path} ({state['new_documents']} new reviews)")
+    print(json.dumps(state["holdout"], indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Process-wide cache of read-only resources shared by all Streamlit sessions.
+
+Streamlit re-executes the page script for every session and every rerun,
+but imported modules live for the whole server process. Datasets and
+models loaded through `shared_cache` are therefore loaded once and the same
+objects are handed to every session until the file they came from changes.
+
+The memory budget is read from the OLIST_CACHE_MB environment variable
+(default 1024 MB). Least recently used entries are evicted beyond it.
+"""
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+DEFAULT_BUDGET_MB = 1024
+
+# Returned by ResourceCache._lookup on a miss; None is a valid cached value
+_MISSING = object()
+
+
+def file_version(path, content_hash=False):
+    """
+    Version tag of a file used to invalidate cached resources
+
+    Input:
+        Path of the file and a flag to hash its content instead of relying
+        on size and modification time
+    Returns:
+        A string that changes whenever the file changes
+    """
+    if content_hash:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def estimate_size(obj):
+    # DataFrames and arrays know their footprint, containers and fitted
+    # estimators are summed over their contents
+    if callable(obj):
+        return sys.getsizeof(obj)
+    if hasattr(obj, "memory_usage"):
+        return int(obj.memory_usage(deep=True).sum())
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            estimate_size(key) + estimate_size(value) for key, value in obj.items()
+        )
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(value) for value in obj)
+    if hasattr(obj, "__dict__"):
+        return sys.getsizeof(obj) + estimate_size(vars(obj))
+    return sys.getsizeof(obj)
+
+
+class ResourceCache:
+    """
+    Thread-safe LRU cache of loaded resources with a memory budget
+
+    Each entry is identified by a key and a version. Asking for a key with a
+    different version reloads the resource and drops the stale copy.
+    Concurrent requests for the same missing entry load it only once.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, version, loader, size=None):
+        """
+        Return the cached resource or load it
+
+        Input:
+            Cache key, version of the underlying data, a zero-argument
+            loader and optionally the size in bytes of the loaded object
+            (estimated when not given)
+        Returns:
+            The shared resource. Callers must treat it as read-only.
+        """
+        entry = self._lookup(key, version)
+        if entry is not _MISSING:
+            return entry
+
+        key_lock = self._key_lock(key)
+        try:
+            with key_lock:
+                # Another session may have loaded it while we were waiting
+                entry = self._lookup(key, version, count=False)
+                if entry is not _MISSING:
+                    return entry
+                value = loader()
+                nbytes = estimate_size(value) if size is None else size
+                self._store(key, version, value, nbytes)
+                return value
+        finally:
+            self._release_key_lock(key, key_lock)
+
+    def get_file(self, path, loader, content_hash=False, size=None):
+        # Convenience wrapper for resources loaded from a single file
+        return self.get(
+            os.path.abspath(path),
+            file_version(path, content_hash),
+            lambda: loader(path),
+            size=size,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _release_key_lock(self, key, key_lock):
+        # Locks are only needed while a load is pending; dropping them keeps
+        # _key_locks from growing with every key ever requested (one per
+        # date range in main.py). Waiters still hold the lock object.
+        with self._lock:
+            if self._key_locks.get(key) is key_lock and not key_lock.locked():
+                del self._key_locks[key]
+
+    def _lookup(self, key, version, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entry[1]
+            if count:
+                self.misses += 1
+            return _MISSING
+
+    def _store(self, key, version, value, nbytes):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[2]
+            self._entries[key] = (version, value, nbytes)
+            self.total_bytes += nbytes
+
+            # Evict least recently used entries, never the one just loaded
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+
+
+shared_cache = ResourceCache(
+    int(float(os.environ.get("OLIST_CACHE_MB", DEFAULT_BUDGET_MB)) * 1024 * 1024)
+)
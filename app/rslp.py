@@ -0,0 +1,181 @@
+"""
+Drop-in replacement for nltk's RSLPStemmer.
+
+The RSLP rules of each step are compiled into a trie keyed by the reversed
+suffix, so finding the applicable rule walks at most a few characters of
+the word instead of testing every rule of the step. Stems are memoized in a
+bounded LRU table and an optional stem dictionary built from the review
+corpus can be preloaded. Results are identical to RSLPStemmer.stem.
+
+Build the stem dictionary with:
+
+    python app/rslp.py data/comments.csv app/rslp_stems.json
+"""
+import hashlib
+import json
+import os
+import sys
+import warnings
+from functools import lru_cache
+
+from inference import normalize_text
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STEM_TABLE_PATH = os.path.join(APP_DIR, "rslp_stems.json")
+
+# Trie key holding the rules whose suffix ends at a node
+_RULES = ""
+
+
+def _compile_trie(rules):
+    root = {}
+    for index, (suffix, min_size, replacement, exceptions) in enumerate(rules):
+        node = root
+        for char in reversed(suffix):
+            node = node.setdefault(char, {})
+        node.setdefault(_RULES, []).append(
+            (index, len(suffix), min_size, replacement, frozenset(exceptions))
+        )
+    return root
+
+
+def rules_digest(model):
+    # Identifies the rule set a persisted stem table was computed with
+    return hashlib.sha256(repr(model).encode("utf-8")).hexdigest()
+
+
+class FastRSLPStemmer:
+    """
+    RSLP stemmer with suffix tries and memoized results
+
+    Input:
+        Maximum number of memoized stems and an optional {word: stem}
+        dictionary (or path to one written by build_stem_table)
+    """
+
+    def __init__(self, cache_size=100_000, stem_table=None):
+        self.cache_size = cache_size
+        # nltk is only imported when a stemmer is created
+        from nltk.stem import RSLPStemmer
+
+        self._model = RSLPStemmer()._model
+        self._digest = rules_digest(self._model)
+        self._tries = [_compile_trie(rules) for rules in self._model]
+        self._table = {}
+        if isinstance(stem_table, str):
+            self._table = load_stem_table(stem_table, self._digest)
+        elif stem_table is not None:
+            self._table = dict(stem_table)
+        self._cached_stem = lru_cache(maxsize=cache_size)(self._stem)
+
+    def __getstate__(self):
+        # lru_cache wrappers can't be pickled (process pools); rebuild them
+        state = self.__dict__.copy()
+        del state["_cached_stem"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cached_stem = lru_cache(maxsize=self.cache_size)(self._stem)
+
+    def stem(self, word):
+        stem = self._table.get(word)
+        if stem is None:
+            stem = self._cached_stem(word)
+        return stem
+
+    def cache_info(self):
+        return self._cached_stem.cache_info()
+
+    def _apply_rule(self, word, rule_index):
+        # Among the rules whose suffix matches, RSLPStemmer applies the first
+        # one (in file order) that passes the size and exception checks
+        node = self._tries[rule_index]
+        length = len(word)
+        best = None
+        for position in range(length - 1, -1, -1):
+            node = node.get(word[position])
+            if node is None:
+                break
+            for rule in node.get(_RULES, ()):
+                index, suffix_length, min_size, _, exceptions = rule
+                if best is not None and index > best[0]:
+                    continue
+                if length >= suffix_length + min_size and word not in exceptions:
+                    best = rule
+        if best is None:
+            return word
+        return word[: -best[1]] + best[3]
+
+    def _stem(self, word):
+        # Same step sequence as RSLPStemmer.stem
+        word = word.lower()
+
+        if word[-1] == "s":
+            word = self._apply_rule(word, 0)
+
+        if word[-1] == "a":
+            word = self._apply_rule(word, 1)
+
+        word = self._apply_rule(word, 3)
+        word = self._apply_rule(word, 2)
+
+        prev_word = word
+        word = self._apply_rule(word, 4)
+        if word == prev_word:
+            prev_word = word
+            word = self._apply_rule(word, 5)
+            if word == prev_word:
+                word = self._apply_rule(word, 6)
+
+        return word
+
+
+def load_stem_table(path, digest=None):
+    """
+    Load a persisted stem dictionary
+
+    Returns an empty table when the file was built with different RSLP rules
+    than the ones installed, since its stems could then be wrong.
+    """
+    with open(path, encoding="utf-8") as f:
+        payload = json.load(f)
+    if digest is not None and payload.get("rules") != digest:
+        warnings.warn(f"{path} was built with different RSLP rules, ignoring it")
+        return {}
+    return payload["stems"]
+
+
+def build_stem_table(texts, path, stopwords=(), stemmer=None):
+    """
+    Stem every distinct token of a corpus and persist the dictionary
+
+    Input:
+        Iterable of raw review texts, output path, stopwords to skip and
+        optionally the stemmer to use
+    Returns:
+        Number of entries written
+    """
+    stemmer = stemmer or FastRSLPStemmer()
+    stop = frozenset(stopwords)
+    vocabulary = set()
+    for text in texts:
+        vocabulary.update(
+            token for token in normalize_text(text).lower().split() if token not in stop
+        )
+    stems = {token: stemmer.stem(token) for token in sorted(vocabulary)}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"rules": stemmer._digest, "stems": stems}, f, ensure_ascii=False)
+    return len(stems)
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    from inference import portuguese_stopwords
+
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else "./data/comments.csv"
+    table_path = sys.argv[2] if len(sys.argv) > 2 else STEM_TABLE_PATH
+    comments = pd.read_csv(corpus_path)["comment"].dropna().astype(str)
+    n_stems = build_stem_table(comments, table_path, portuguese_stopwords())
+    print(f"Wrote {n_stems} stems to {table_path}")
@@ -0,0 +1,252 @@
+"""
+Batch scoring of the product catalog with the sales model.
+
+models/sales.pkl is a pickled XGBRegressor trained in Sales Prediction.ipynb
+on the product features of product_features.py. Unpickling runs arbitrary
+code and is tied to the xgboost version that wrote it, so `convert` saves the
+booster once in xgboost's own UBJSON format (models/sales.ubj), which is a
+plain data file that loads faster, and flattens its trees into NumPy node
+arrays (models/sales_trees.npz, see tree_engine.py). Scoring reads the .npz
+and so never imports xgboost; pass --model models/sales.ubj to score with
+xgboost itself.
+
+`score` builds the feature matrix of every product in the catalog
+(dim_products, including products that were never ordered, whose order
+features are missing values to xgboost) from the feature table in one
+vectorized step and predicts in large batches. Predictions are stored with
+the features they were computed from and the versions of the model, the
+feature table and the warehouse. A later run returns them as they are when
+nothing changed, and otherwise re-scores only the products whose feature row
+differs or that are new to the catalog.
+
+    python app/sales_scoring.py convert
+    python app/sales_scoring.py score --output predictions.csv
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from product_features import (
+    CATEGORY_CODES,
+    FEATURE_COLUMNS,
+    FEATURES_PATH,
+    ProductFeatureTable,
+)
+from resources import file_version, shared_cache
+from tree_engine import TREES_PATH, TreeEnsemble, export_trees
+from warehouse import WAREHOUSE_DIR, Warehouse
+
+MODEL_PICKLE = "./models/sales.pkl"
+MODEL_PATH = "./models/sales.ubj"
+ENGINE_PATH = TREES_PATH
+PREDICTIONS_PATH = "./data/features/sales_predictions.arrow"
+BATCH_SIZE = 1 << 20
+
+# Schema metadata key of the stored predictions
+METADATA_KEY = b"olist.sales_predictions"
+
+
+def convert_model(pickle_path=MODEL_PICKLE, model_path=MODEL_PATH, engine_path=ENGINE_PATH):
+    """
+    Save the pickled regressor in xgboost's native format and as node arrays
+
+    Only run this on the trusted pickle shipped with the repo.
+    """
+    import pickle
+
+    with open(pickle_path, "rb") as f:
+        model = pickle.load(f)
+    tmp_path = model_path + ".tmp" + os.path.splitext(model_path)[1]
+    model.get_booster().save_model(tmp_path)
+    os.replace(tmp_path, model_path)
+    export_trees(model_path, engine_path)
+    return model_path
+
+
+def load_model(model_path=ENGINE_PATH):
+    """
+    Load a model saved by convert_model
+
+    Returns:
+        TreeEnsemble for a .npz, otherwise an xgboost.Booster; both have the
+        training feature names and inplace_predict
+    """
+    if model_path.endswith(".npz"):
+        booster = TreeEnsemble.load(model_path)
+    else:
+        import xgboost as xgb
+
+        booster = xgb.Booster()
+        booster.load_model(model_path)
+    if booster.feature_names and list(booster.feature_names) != FEATURE_COLUMNS:
+        raise ValueError(
+            f"Model expects features {booster.feature_names}, the feature table has "
+            f"{FEATURE_COLUMNS}"
+        )
+    return booster
+
+
+def catalog_features(products, table):
+    """
+    Feature matrix of the whole catalog
+
+    Input:
+        dim_products frame (product_id, product_category) and a
+        ProductFeatureTable
+    Returns:
+        Tuple (product ids, float32 matrix with FEATURE_COLUMNS); products
+        without orders have NaN order features
+    """
+    ids = pd.Index(products.product_id.to_numpy(), name="product_id")
+    features = table.features(ids, dropna=False)
+    matrix = np.empty((len(ids), len(FEATURE_COLUMNS)), dtype=np.float32)
+    for i, column in enumerate(FEATURE_COLUMNS[:-1]):
+        matrix[:, i] = features[column].to_numpy(dtype=np.float32)
+    # The category is known for every catalog product, ordered or not
+    matrix[:, -1] = (
+        products.product_category.astype(str).map(CATEGORY_CODES).to_numpy(dtype=np.float32)
+    )
+    return ids, matrix
+
+
+def predict(booster, matrix, batch_size=BATCH_SIZE):
+    # inplace_predict skips the DMatrix copy; NaN marks missing features
+    out = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), batch_size):
+        batch = matrix[start : start + batch_size]
+        out[start : start + len(batch)] = booster.inplace_predict(batch, missing=np.nan)
+    return out
+
+
+def _versions(model_path, table, wh):
+    return {
+        "model": file_version(model_path, content_hash=True),
+        "features": table.version,
+        "warehouse": wh.version,
+    }
+
+
+def read_predictions(path=PREDICTIONS_PATH):
+    """
+    Stored predictions and their versions, (None, None) when absent
+    """
+    if not os.path.exists(path):
+        return None, None
+    table = feather.read_table(path, memory_map=True)
+    versions = json.loads(table.schema.metadata[METADATA_KEY])
+    return table.to_pandas(), versions
+
+
+def write_predictions(frame, versions, path=PREDICTIONS_PATH):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps(versions).encode()
+    table = table.replace_schema_metadata(metadata)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def score_catalog(
+    wh,
+    table,
+    model_path=ENGINE_PATH,
+    predictions_path=PREDICTIONS_PATH,
+    batch_size=BATCH_SIZE,
+):
+    """
+    Predicted sales of every catalog product, re-scoring only what changed
+
+    Returns:
+        Tuple (DataFrame with product_id, FEATURE_COLUMNS and
+        predicted_sales, number of products scored in this call)
+    """
+    versions = _versions(model_path, table, wh)
+    cached, cached_versions = read_predictions(predictions_path)
+    if cached is not None and cached_versions == versions:
+        return cached, 0
+
+    booster = shared_cache.get_file(model_path, load_model, content_hash=True)
+    products = wh.table("dim_products", ["product_id", "product_category"])
+    ids, matrix = catalog_features(products, table)
+    predictions = np.full(len(ids), np.nan, dtype=np.float32)
+
+    stale = np.ones(len(ids), dtype=bool)
+    if cached is not None and cached_versions.get("model") == versions["model"]:
+        # Reuse rows whose features are unchanged (NaN equal to NaN)
+        rows = pd.Index(cached.product_id).get_indexer(ids)
+        known = rows >= 0
+        old = cached[FEATURE_COLUMNS].to_numpy(dtype=np.float32)[rows[known]]
+        same = ((old == matrix[known]) | (np.isnan(old) & np.isnan(matrix[known]))).all(axis=1)
+        reuse = np.flatnonzero(known)[same]
+        predictions[reuse] = cached.predicted_sales.to_numpy()[rows[reuse]]
+        stale[reuse] = False
+
+    if stale.any():
+        predictions[stale] = predict(booster, matrix[stale], batch_size)
+    frame = pd.DataFrame(matrix, columns=FEATURE_COLUMNS)
+    frame.insert(0, "product_id", ids.to_numpy())
+    frame["predicted_sales"] = predictions
+    write_predictions(frame, versions, predictions_path)
+    return frame, int(stale.sum())
+
+
+def load_feature_table(wh, path=FEATURES_PATH):
+    # Stored table brought up to date, or a fresh build
+    if os.path.exists(path):
+        table = ProductFeatureTable.load(path)
+        previous = table.warehouse_version
+        # Also saved when only the warehouse version moved, so the
+        # consistency check of update() runs once per warehouse version
+        if table.update(wh).size or table.warehouse_version != previous:
+            table.save(path)
+    else:
+        table = ProductFeatureTable.build(wh)
+        table.save(path)
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="save sales.pkl as UBJSON and node arrays")
+    convert.add_argument("--pickle", default=MODEL_PICKLE)
+    convert.add_argument("--model", default=MODEL_PATH)
+    convert.add_argument("--engine", default=ENGINE_PATH)
+    score = commands.add_parser("score", help="predict sales for the whole catalog")
+    score.add_argument("--model", default=ENGINE_PATH)
+    score.add_argument("--warehouse", default=WAREHOUSE_DIR)
+    score.add_argument("--features", default=FEATURES_PATH)
+    score.add_argument("--predictions", default=PREDICTIONS_PATH)
+    score.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    score.add_argument("--output", help="also write the predictions to this CSV")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        convert_model(args.pickle, args.model, args.engine)
+        print(f"Wrote {args.model} and {args.engine}")
+        return
+
+    wh = Warehouse(args.warehouse)
+    table = load_feature_table(wh, args.features)
+    start = time.perf_counter()
+    frame, scored = score_catalog(wh, table, args.model, args.predictions, args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(frame)} products, {scored} scored in {elapsed:.2f}s",
+        file=sys.stderr,
+    )
+    if args.output:
+        frame[["product_id", "predicted_sales"]].to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
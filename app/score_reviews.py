@@ -0,0 +1,184 @@
+"""
+Batch sentiment scoring of review dumps.
+
+Streams a CSV or JSON Lines (.jsonl, .ndjson) file in chunks through the production preprocessing
+pipeline, the TF-IDF vectorizer and the logistic model, and appends the
+predicted label and class probabilities to an output file of the same kind.
+Memory use is bounded by the chunk size, not by the input size.
+
+    python app/score_reviews.py data/comments.csv scored.csv --text-column comment
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_index import FeatureIndex
+from linear_scorer import LinearScorer
+from parallel_preprocess import ParallelPreprocessor
+from sentiment import build_prod_pipeline, load_skops
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_VECTORIZER = os.path.join(APP_DIR, "tfidf_vectorizer.skops")
+DEFAULT_MODEL = os.path.join(APP_DIR, "logistic_sentiment.skops")
+
+
+def file_format(path):
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if path.endswith(".json"):
+        # A JSON array can't be read or appended in chunks
+        raise ValueError(f"{path}: JSON arrays are not supported, use JSON Lines (.jsonl)")
+    return "csv"
+
+
+def read_chunks(path, chunk_size):
+    if file_format(path) == "jsonl":
+        return pd.read_json(path, lines=True, chunksize=chunk_size)
+    return pd.read_csv(path, chunksize=chunk_size)
+
+
+def write_chunk(chunk, path, first):
+    if file_format(path) == "jsonl":
+        with open(path, "w" if first else "a", encoding="utf-8") as f:
+            # pandas terminates every record, including the last, with a newline
+            chunk.to_json(f, orient="records", lines=True, force_ascii=False)
+    else:
+        chunk.to_csv(path, mode="w" if first else "a", header=first, index=False)
+
+
+def score_chunk(chunk, text_column, pipeline, vectorizer, model):
+    """
+    Score the reviews of one chunk
+
+    Input:
+        DataFrame chunk, name of the review text column and the loaded
+        pipeline, vectorizer and model. With pipeline=None the vectorizer
+        takes the raw texts (a FeatureIndex)
+    Returns:
+        The chunk with `sentiment`, `proba_negative` and `proba_positive`
+        columns. Rows without text are left empty.
+    """
+    has_text = chunk[text_column].notna().to_numpy()
+    texts = chunk.loc[has_text, text_column].astype(str).tolist()
+
+    pred = np.full(len(chunk), np.nan)
+    proba = np.full((len(chunk), 2), np.nan)
+    if texts:
+        if pipeline is not None:
+            texts = pipeline.transform(texts)
+        matrix = vectorizer.transform(texts)
+        if isinstance(model, LinearScorer):
+            text_pred, text_proba = model.score(matrix)
+        else:
+            # predict() would score the matrix a second time
+            text_proba = model.predict_proba(matrix)
+            text_pred = model.classes_[text_proba.argmax(axis=1)]
+        pred[has_text] = text_pred
+        proba[has_text] = text_proba
+
+    chunk = chunk.copy()
+    chunk["sentiment"] = pd.array(pred, dtype="Int8")
+    chunk["proba_negative"] = proba[:, 0]
+    chunk["proba_positive"] = proba[:, 1]
+    return chunk
+
+
+def score_file(
+    input_path,
+    output_path,
+    text_column="comment",
+    chunk_size=5000,
+    vectorizer_path=DEFAULT_VECTORIZER,
+    model_path=DEFAULT_MODEL,
+    feature_index_path=None,
+    scorer_path=None,
+    workers=1,
+    verbose=False,
+):
+    """
+    Score every review of a CSV/JSONL file into an output file
+
+    Returns:
+        Tuple (rows scored, elapsed seconds)
+    """
+    # Unsupported file types fail before the artifacts are loaded
+    for path in (input_path, output_path):
+        file_format(path)
+    vectorizer = load_skops(vectorizer_path)
+    model = LinearScorer.load(scorer_path) if scorer_path else load_skops(model_path)
+    if feature_index_path is not None:
+        feature_index = FeatureIndex.load(feature_index_path)
+        if not feature_index.matches(vectorizer):
+            raise ValueError(f"{feature_index_path} was built from another vectorizer")
+        pipeline, vectorizer = None, feature_index
+    elif workers > 1:
+        pipeline = ParallelPreprocessor(workers)
+    else:
+        pipeline = build_prod_pipeline()
+
+    rows = 0
+    start = time.perf_counter()
+    try:
+        for i, chunk in enumerate(read_chunks(input_path, chunk_size)):
+            chunk_start = time.perf_counter()
+            scored = score_chunk(chunk, text_column, pipeline, vectorizer, model)
+            write_chunk(scored, output_path, first=i == 0)
+            rows += len(chunk)
+            if verbose:
+                elapsed = time.perf_counter() - chunk_start
+                print(
+                    f"chunk {i}: {len(chunk)} rows, {len(chunk) / elapsed:,.0f} rows/s",
+                    file=sys.stderr,
+                )
+    finally:
+        if isinstance(pipeline, ParallelPreprocessor):
+            pipeline.close()
+    return rows, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="CSV or JSON Lines (.jsonl, .ndjson) file with reviews")
+    parser.add_argument("output", help="CSV or JSON Lines file to write")
+    parser.add_argument("--text-column", default="comment")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--vectorizer", default=DEFAULT_VECTORIZER)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument(
+        "--feature-index",
+        help="token -> feature table from feature_index.py, used instead of the pipeline",
+    )
+    parser.add_argument(
+        "--scorer",
+        help="NumPy export from linear_scorer.py, used instead of --model",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes for the text preprocessing"
+    )
+    parser.add_argument("--verbose", action="store_true", help="per-chunk throughput")
+    args = parser.parse_args(argv)
+
+    rows, elapsed = score_file(
+        args.input,
+        args.output,
+        text_column=args.text_column,
+        chunk_size=args.chunk_size,
+        vectorizer_path=args.vectorizer,
+        model_path=args.model,
+        feature_index_path=args.feature_index,
+        scorer_path=args.scorer,
+        workers=args.workers,
+        verbose=args.verbose,
+    )
+    print(
+        f"Scored {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Customer segmentation by recency, frequency and monetary value (RFM).
+
+The README's segmentation model (models/seg.pkl) has no code in the tree that
+builds it. This module rebuilds the segmentation from the warehouse in three
+streaming steps:
+
+    rfm       one pass over fact_orders in row chunks, accumulating per
+              customer_unique_id the last purchase, the number of orders
+              and the amount paid (bincount per chunk), written to
+              data/features/customer_rfm.arrow
+    fit       MiniBatchKMeans.partial_fit over shuffled mini-batches of
+              memory-mapped chunks of that table, for a few epochs, on the
+              standardized [recency in days, log1p(orders), log1p(paid)]
+    assign    nearest center of every customer, in blocks, written to
+              data/features/customer_segments.arrow
+
+Reading orders only holds three accumulators per customer (24 bytes each);
+fitting and assignment read the RFM table one chunk at a time, so neither
+needs the orders or the customers in memory at once.
+
+Models are numbered versions under models/segmentation/:
+
+    models/segmentation/v0001/model.npz    centers, feature mean and scale
+                             /state.json   customers, reference date,
+                                           warehouse version, inertia and
+                                           per-segment size and mean R/F/M
+
+Segments are numbered by decreasing value (recent, frequent, high-paying
+customers first), so segment 0 holds the best customers in every version.
+Assignment only needs NumPy.
+
+    python app/segmentation.py rfm
+    python app/segmentation.py fit --clusters 5
+    python app/segmentation.py assign
+"""
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from warehouse import WAREHOUSE_DIR, Warehouse
+
+RFM_PATH = "./data/features/customer_rfm.arrow"
+SEGMENTS_PATH = "./data/features/customer_segments.arrow"
+STORE_DIR = "./models/segmentation"
+MODEL_FILE = "model.npz"
+STATE_FILE = "state.json"
+
+# Rows read from disk at a time
+CHUNK_ROWS = 1 << 18
+# Rows assigned together
+BLOCK_ROWS = 1 << 16
+# Customers sampled to seed the centers
+INIT_SIZE = 1 << 16
+# Segment labels are stored as int8
+MAX_CLUSTERS = np.iinfo(np.int8).max
+
+RFM_COLUMNS = ["recency", "frequency", "monetary"]
+# Orders that never became a sale
+EXCLUDED_STATUSES = ["canceled", "unavailable"]
+
+# Schema metadata key of the RFM table and of the segments table
+METADATA_KEY = b"olist.rfm"
+SEGMENTS_METADATA_KEY = b"olist.segments"
+
+_VERSION_RE = re.compile(r"^v(\d{4,})$")
+_DAY = np.timedelta64(1, "D")
+
+
+def compute_rfm(wh, chunk_rows=CHUNK_ROWS):
+    """
+    Recency, frequency and monetary value per customer_unique_id
+
+    Input:
+        Warehouse and the number of fact_orders rows read at a time
+    Returns:
+        Tuple (DataFrame with customer_unique_id and RFM_COLUMNS for every
+        customer with at least one order, reference timestamp); recency is
+        counted in days before the reference, one day after the last
+        purchase
+    """
+    customers = wh.table("dim_customers", ["customer_unique_id"]).customer_unique_id
+    codes, uniques = pd.factorize(customers)
+    n_customers = len(uniques)
+    frequency = np.zeros(n_customers, dtype=np.int64)
+    monetary = np.zeros(n_customers, dtype=np.float64)
+    last = np.full(n_customers, np.iinfo(np.int64).min, dtype=np.int64)
+
+    n_rows = wh.manifest["tables"]["fact_orders"]["rows"]
+    columns = ["customer_key", "order_status", "order_purchase_timestamp", "payment_value"]
+    for start in range(0, n_rows, chunk_rows):
+        orders = wh.table("fact_orders", columns, (start, min(start + chunk_rows, n_rows)))
+        keep = (
+            (orders.customer_key.to_numpy() >= 0)
+            & orders.order_purchase_timestamp.notna().to_numpy()
+            & ~orders.order_status.isin(EXCLUDED_STATUSES).to_numpy()
+        )
+        key = codes[orders.customer_key.to_numpy()[keep]]
+        frequency += np.bincount(key, minlength=n_customers)
+        monetary += np.bincount(
+            key,
+            weights=orders.payment_value.fillna(0).to_numpy()[keep],
+            minlength=n_customers,
+        )
+        purchase = orders.order_purchase_timestamp.to_numpy()[keep].view(np.int64)
+        np.maximum.at(last, key, purchase)
+
+    active = frequency > 0
+    if not active.any():
+        raise ValueError("The warehouse has no orders to segment")
+    last = last[active].view("datetime64[ns]")
+    reference = last.max() + _DAY
+    frame = pd.DataFrame(
+        {
+            "customer_unique_id": np.asarray(uniques, dtype=object)[active],
+            "recency": (reference - last) / _DAY,
+            "frequency": frequency[active],
+            "monetary": monetary[active],
+        }
+    )
+    return frame, pd.Timestamp(reference)
+
+
+def write_rfm(frame, reference, warehouse_version, path=RFM_PATH):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps(
+        {"reference": reference.isoformat(), "warehouse_version": warehouse_version}
+    ).encode()
+    table = table.replace_schema_metadata(metadata)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def read_rfm(path=RFM_PATH):
+    """
+    Memory-mapped RFM table and its metadata
+    """
+    table = feather.read_table(path, memory_map=True)
+    return table, json.loads(table.schema.metadata[METADATA_KEY])
+
+
+def _chunks(table, chunk_rows=CHUNK_ROWS):
+    # RFM columns of consecutive row chunks, as float64 arrays
+    for start in range(0, table.num_rows, chunk_rows):
+        chunk = table.slice(start, chunk_rows)
+        yield start, [chunk.column(name).to_numpy() for name in RFM_COLUMNS]
+
+
+def rfm_features(recency, frequency, monetary):
+    """
+    Unscaled clustering features: recency days, log1p(orders), log1p(paid)
+    """
+    return np.column_stack(
+        [
+            np.asarray(recency, dtype=np.float64),
+            np.log1p(np.asarray(frequency, dtype=np.float64)),
+            np.log1p(np.maximum(np.asarray(monetary, dtype=np.float64), 0)),
+        ]
+    )
+
+
+class Segmenter:
+    """
+    Nearest-center assignment of customers to segments
+
+    Input:
+        Centers in standardized feature space (segments x 3) and the mean
+        and scale of the features
+    """
+
+    def __init__(self, centers, mean, scale):
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        # Folding the scaling into the centers leaves one product per block:
+        # argmin |(x - m)/s - c|^2 = argmin (|c|^2 + 2 m.(c/s) - 2 x.(c/s))
+        weights = (2 * self.centers / self.scale).T
+        self._weights = weights.astype(np.float32)
+        self._offsets = ((self.centers**2).sum(axis=1) + self.mean @ weights).astype(np.float32)
+
+    @property
+    def n_segments(self):
+        return len(self.centers)
+
+    @classmethod
+    def load(cls, store_dir=STORE_DIR, version=None):
+        path = version_dir(store_dir, _resolve_version(store_dir, version))
+        with np.load(os.path.join(path, MODEL_FILE)) as data:
+            return cls(data["centers"], data["mean"], data["scale"])
+
+    def scale_features(self, features):
+        return (features - self.mean) / self.scale
+
+    def assign(self, recency, frequency, monetary, block_rows=BLOCK_ROWS):
+        """
+        Segment of every customer
+
+        Returns:
+            int8 array of segment numbers
+        """
+        features = rfm_features(recency, frequency, monetary).astype(np.float32)
+        out = np.empty(len(features), dtype=np.int8)
+        for start in range(0, len(features), block_rows):
+            block = features[start : start + block_rows]
+            scores = block @ self._weights
+            np.subtract(self._offsets, scores, out=scores)
+            out[start : start + len(block)] = scores.argmin(axis=1)
+        return out
+
+
+def versions(store_dir=STORE_DIR):
+    # Version numbers present in the store, ascending
+    if not os.path.isdir(store_dir):
+        return []
+    found = (_VERSION_RE.match(name) for name in os.listdir(store_dir))
+    return sorted(int(match.group(1)) for match in found if match)
+
+
+def version_dir(store_dir, version):
+    return os.path.join(store_dir, f"v{version:04d}")
+
+
+def _resolve_version(store_dir, version):
+    if version is not None:
+        return version
+    available = versions(store_dir)
+    if not available:
+        raise FileNotFoundError(f"No segmentation versions in {store_dir}")
+    return available[-1]
+
+
+def load_state(store_dir=STORE_DIR, version=None):
+    path = version_dir(store_dir, _resolve_version(store_dir, version))
+    with open(os.path.join(path, STATE_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_version(store_dir, segmenter, state):
+    """
+    Write the next version of the store
+
+    Returns:
+        Path of the new version
+    """
+    available = versions(store_dir)
+    version = available[-1] + 1 if available else 1
+    state = dict(
+        state,
+        version=version,
+        parent=available[-1] if available else None,
+        created=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    )
+    path = version_dir(store_dir, version)
+    tmp_path = path + ".tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    np.savez(
+        os.path.join(tmp_path, MODEL_FILE),
+        centers=segmenter.centers,
+        mean=segmenter.mean,
+        scale=segmenter.scale,
+    )
+    with open(os.path.join(tmp_path, STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+def segment_summary(table, segmenter, chunk_rows=CHUNK_ROWS):
+    """
+    Size, mean R/F/M and inertia of every segment, in one pass
+
+    Returns:
+        Tuple (list of per-segment dictionaries, mean squared distance to
+        the nearest center in standardized space)
+    """
+    k = segmenter.n_segments
+    sizes = np.zeros(k, dtype=np.int64)
+    sums = np.zeros((k, len(RFM_COLUMNS)))
+    distance = 0.0
+    for _, columns in _chunks(table, chunk_rows):
+        labels = segmenter.assign(*columns)
+        scaled = segmenter.scale_features(rfm_features(*columns))
+        distance += ((scaled - segmenter.centers[labels]) ** 2).sum()
+        sizes += np.bincount(labels, minlength=k)
+        for j, values in enumerate(columns):
+            sums[:, j] += np.bincount(labels, weights=values, minlength=k)
+    means = sums / np.maximum(sizes, 1)[:, None]
+    segments = [
+        {
+            "segment": segment,
+            "customers": int(sizes[segment]),
+            **{f"{name}_mean": float(means[segment, j]) for j, name in enumerate(RFM_COLUMNS)},
+        }
+        for segment in range(k)
+    ]
+    return segments, float(distance / max(table.num_rows, 1))
+
+
+def fit_segments(
+    rfm_path=RFM_PATH,
+    n_clusters=5,
+    batch_size=4096,
+    epochs=5,
+    seed=0,
+    chunk_rows=CHUNK_ROWS,
+    init_size=INIT_SIZE,
+):
+    """
+    Mini-batch k-means over the stored RFM table
+
+    The centers start from k-means on `init_size` customers sampled from
+    the whole table. Every epoch then visits the chunks in a random order
+    and splits each shuffled chunk into mini-batches for partial_fit.
+
+    Returns:
+        Tuple (Segmenter, state dictionary for write_version)
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if not 1 <= n_clusters <= MAX_CLUSTERS:
+        raise ValueError(f"n_clusters must be between 1 and {MAX_CLUSTERS}, got {n_clusters}")
+    table, info = read_rfm(rfm_path)
+    if table.num_rows < n_clusters:
+        raise ValueError(f"{table.num_rows} customers cannot form {n_clusters} segments")
+
+    # Feature mean and scale, streamed
+    total = np.zeros(len(RFM_COLUMNS))
+    squares = np.zeros(len(RFM_COLUMNS))
+    for _, columns in _chunks(table, chunk_rows):
+        features = rfm_features(*columns)
+        total += features.sum(axis=0)
+        squares += (features**2).sum(axis=0)
+    mean = total / table.num_rows
+    scale = np.sqrt(np.maximum(squares / table.num_rows - mean**2, 0))
+    scale[scale == 0] = 1.0
+
+    # Seed the centers with k-means on a sample drawn from the whole table;
+    # k-means++ on the first mini-batch alone lands in poor local minima
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(table.num_rows, min(table.num_rows, init_size), replace=False))
+    sample = table.take(pa.array(sample_rows))
+    sample = rfm_features(*(sample.column(name).to_numpy() for name in RFM_COLUMNS))
+    init = KMeans(n_clusters, n_init=4, random_state=seed).fit((sample - mean) / scale)
+    model = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        init=init.cluster_centers_,
+        batch_size=batch_size,
+        random_state=seed,
+        n_init=1,
+        # Chunks follow the customer file rather than being random samples,
+        # so a center drawing few customers from one chunk would otherwise
+        # be moved to a random point; the sampled seed makes that unneeded
+        reassignment_ratio=0,
+    )
+    starts = np.arange(0, table.num_rows, chunk_rows)
+    for _ in range(epochs):
+        for start in rng.permutation(starts):
+            chunk = table.slice(int(start), chunk_rows)
+            features = rfm_features(*(chunk.column(name).to_numpy() for name in RFM_COLUMNS))
+            scaled = (features - mean) / scale
+            scaled = scaled[rng.permutation(len(scaled))]
+            for first in range(0, len(scaled), batch_size):
+                batch = scaled[first : first + batch_size]
+                if len(batch) >= n_clusters:
+                    model.partial_fit(batch)
+
+    # Most valuable segment first: recent, frequent, high-paying
+    centers = model.cluster_centers_
+    value = -centers[:, 0] + centers[:, 1] + centers[:, 2]
+    segmenter = Segmenter(centers[np.argsort(-value, kind="stable")], mean, scale)
+
+    segments, inertia = segment_summary(table, segmenter, chunk_rows)
+    state = {
+        "customers": table.num_rows,
+        "clusters": n_clusters,
+        "reference": info["reference"],
+        "warehouse_version": info["warehouse_version"],
+        "features": ["recency_days", "log1p_orders", "log1p_paid"],
+        "batch_size": batch_size,
+        "init_size": int(len(sample_rows)),
+        "epochs": epochs,
+        "seed": seed,
+        "inertia": inertia,
+        "segments": segments,
+    }
+    return segmenter, state
+
+
+def assign_customers(
+    segmenter, rfm_path=RFM_PATH, output_path=SEGMENTS_PATH, version=None, chunk_rows=CHUNK_ROWS
+):
+    """
+    Write the segment of every customer of the RFM table
+
+    Returns:
+        Number of customers assigned
+    """
+    table, info = read_rfm(rfm_path)
+    labels = np.empty(table.num_rows, dtype=np.int8)
+    for start, columns in _chunks(table, chunk_rows):
+        labels[start : start + len(columns[0])] = segmenter.assign(*columns)
+    result = table.append_column("segment", pa.array(labels))
+    metadata = dict(table.schema.metadata or {})
+    metadata.pop(METADATA_KEY, None)
+    metadata[SEGMENTS_METADATA_KEY] = json.dumps(dict(info, model_version=version)).encode()
+    result = result.replace_schema_metadata(metadata)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    feather.write_feather(result, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, output_path)
+    return table.num_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rfm", default=RFM_PATH)
+    parser.add_argument("--store", default=STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    rfm = commands.add_parser("rfm", help="compute RFM per customer from the warehouse")
+    rfm.add_argument("--warehouse", default=WAREHOUSE_DIR)
+    rfm.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    fit = commands.add_parser("fit", help="train the next segmentation version")
+    fit.add_argument("--clusters", type=int, default=5)
+    fit.add_argument("--batch-size", type=int, default=4096)
+    fit.add_argument("--epochs", type=int, default=5)
+    fit.add_argument("--seed", type=int, default=0)
+    assign = commands.add_parser("assign", help="segment every customer")
+    assign.add_argument("--version", type=int, help="model version (default: latest)")
+    assign.add_argument("--output", default=SEGMENTS_PATH)
+    args = parser.parse_args(argv)
+    if args.command == "fit" and not 1 <= args.clusters <= MAX_CLUSTERS:
+        parser.error(f"--clusters must be between 1 and {MAX_CLUSTERS}")
+
+    start = time.perf_counter()
+    if args.command == "rfm":
+        wh = Warehouse(args.warehouse)
+        frame, reference = compute_rfm(wh, args.chunk_rows)
+        write_rfm(frame, reference, wh.version, args.rfm)
+        message = f"Wrote {args.rfm}: {len(frame)} customers, reference {reference}"
+    elif args.command == "fit":
+        segmenter, state = fit_segments(
+            args.rfm, args.clusters, args.batch_size, args.epochs, args.seed
+        )
+        path = write_version(args.store, segmenter, state)
+        message = f"Wrote {path}:\n" + pd.DataFrame(state["segments"]).to_string(index=False)
+    else:
+        version = _resolve_version(args.store, args.version)
+        segmenter = Segmenter.load(args.store, version)
+        assigned = assign_customers(segmenter, args.rfm, args.output, version)
+        message = f"Wrote {args.output}: {assigned} customers"
+    print(f"{message}\n({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
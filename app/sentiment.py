@@ -0,0 +1,202 @@
+"""
+Review sentiment pipeline shared by the Streamlit app and batch tools.
+
+Holds the text preprocessing transformers used to train the model in
+review_analysis.ipynb. The serving helpers (normalize_text, load_skops,
+sentiment_analysis) live in the lightweight inference module and are
+re-exported here.
+"""
+import os
+import re
+from functools import lru_cache
+
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline
+
+from inference import (
+    custom_tokenizer,
+    load_skops,
+    normalize_text,
+    portuguese_stopwords,
+    sentiment_analysis,
+)
+from rslp import STEM_TABLE_PATH, FastRSLPStemmer
+
+# Class for regular expressions application
+class ApplyRegex(BaseEstimator, TransformerMixin):
+    
+    def __init__(self, regex_transformers):
+        self.regex_transformers = regex_transformers
+        
+    def fit(self, X, y=None):
+        return self
+    
+    def transform(self, X, y=None):
+        # Applying all regex functions in the regex_transformers dictionary
+        for regex_name, regex_function in self.regex_transformers.items():
+            X = regex_function(X)
+            
+        return X
+    
+def stopwords_removal(text, cached_stopwords=None):
+    if cached_stopwords is None:
+        cached_stopwords = portuguese_stopwords()
+    return [c.lower() for c in text.split() if c.lower() not in cached_stopwords]
+
+# Class for stopwords removal from the corpus
+class StopWordsRemoval(BaseEstimator, TransformerMixin):
+    
+    def __init__(self, text_stopwords):
+        self.text_stopwords = text_stopwords
+    def fit(self, X, y=None):
+        return self
+    
+    def transform(self, X, y=None):
+        return [' '.join(stopwords_removal(comment, self.text_stopwords)) for comment in X]
+
+@lru_cache(maxsize=None)
+def rslp_stemmer():
+    # nltk's stemmer, created on first use instead of at import
+    from nltk.stem import RSLPStemmer
+
+    return RSLPStemmer()
+
+def stemming_process(text, stemmer=None):
+    stemmer = stemmer or rslp_stemmer()
+    return [stemmer.stem(c) for c in text.split()]
+
+# Class for apply the stemming process
+class StemmingProcess(BaseEstimator, TransformerMixin):
+    
+    def __init__(self, stemmer):
+        self.stemmer = stemmer
+    
+    def fit(self, X, y=None):
+        return self
+    
+    def transform(self, X, y=None):
+        return [' '.join(stemming_process(comment, self.stemmer)) for comment in X]
+    
+# Class for extracting features from corpus
+class TextFeatureExtraction(BaseEstimator, TransformerMixin):
+    
+    def __init__(self, vectorizer):
+        self.vectorizer = vectorizer
+        
+    def fit(self, X, y=None):
+        return self
+    
+    def transform(self, X, y=None):
+        return self.vectorizer.fit_transform(X).toarray()
+
+def re_breakline(text_list):
+    # Applying regex
+    return [re.sub('[\n\r]', ' ', r) for r in text_list]
+
+def re_hiperlinks(text_list):
+    # Applying regex
+    pattern = 'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
+    return [re.sub(pattern, ' link ', r) for r in text_list]
+
+def re_dates(text_list):
+    # Applying regex
+    pattern = '([0-2][0-9]|(3)[0-1])(\/|\.)(((0)[0-9])|((1)[0-2]))(\/|\.)\d{2,4}'
+    return [re.sub(pattern, ' data ', r) for r in text_list]
+
+def re_money(text_list):
+    # Applying regex
+    pattern = '[R]{0,1}\$[ ]{0,}\d+(,|\.)\d+'
+    return [re.sub(pattern, ' dinheiro ', r) for r in text_list]
+
+def re_numbers(text_list):    
+    # Applying regex
+    return [re.sub('[0-9]+', ' numero ', r) for r in text_list]
+
+def re_negation(text_list):
+    # Applying regex
+    return [re.sub('([nN][ãÃaA][oO]|[ñÑ]| [nN] )', ' negação ', r) for r in text_list]
+
+def re_special_chars(text_list):
+    # Applying regex
+    return [re.sub('\W', ' ', r) for r in text_list]
+
+def re_whitespaces(text_list):
+    # Applying regex
+    white_spaces = [re.sub('\s+', ' ', r) for r in text_list]
+    white_spaces_end = [re.sub('[ \t]+$', '', r) for r in white_spaces]
+    return white_spaces_end
+
+regex_transformers = {
+    'break_line': re_breakline,
+    'hiperlinks': re_hiperlinks,
+    'dates': re_dates,
+    'money': re_money,
+    'numbers': re_numbers,
+    'negation': re_negation,
+    'special_chars': re_special_chars,
+    'whitespaces': re_whitespaces
+}
+
+# Class for the compiled, single-function version of ApplyRegex
+class RegexNormalizer(BaseEstimator, TransformerMixin):
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X, y=None):
+        return [normalize_text(comment) for comment in X]
+
+# Class fusing StopWordsRemoval and StemmingProcess into one token pass
+class TokenStemmer(BaseEstimator, TransformerMixin):
+    """
+    Split, lowercase, drop stopwords and stem every comment in one pass
+
+    With join=True the output is the space-joined string produced by
+    StopWordsRemoval + StemmingProcess, as expected by the saved
+    tfidf_vectorizer.skops. With join=False each comment becomes its list
+    of stems, to be consumed by a vectorizer built with TokenListAnalyzer.
+    """
+
+    def __init__(self, text_stopwords, stemmer, join=True):
+        self.text_stopwords = text_stopwords
+        self.stemmer = stemmer
+        self.join = join
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X, y=None):
+        stop = frozenset(self.text_stopwords)
+        stem = self.stemmer.stem
+        docs = [
+            [stem(token) for token in map(str.lower, comment.split()) if token not in stop]
+            for comment in X
+        ]
+        if self.join:
+            return [' '.join(tokens) for tokens in docs]
+        return docs
+
+# Analyzer equivalent to custom_tokenizer + stop_words for token lists
+class TokenListAnalyzer:
+    """
+    Analyzer for vectorizers fed by TokenStemmer(join=False)
+
+    Keeps the first `max_words` tokens and drops stop words, like the
+    saved vectorizer does with custom_tokenizer, without rebuilding and
+    re-splitting a string per document.
+    """
+
+    def __init__(self, max_words=50, stop_words=None):
+        self.max_words = max_words
+        self.stop_words = frozenset(stop_words or ())
+
+    def __call__(self, tokens):
+        return [token for token in tokens[:self.max_words] if token not in self.stop_words]
+
+def build_prod_pipeline():
+    # Preload the corpus stem table when it has been built
+    stem_table = STEM_TABLE_PATH if os.path.exists(STEM_TABLE_PATH) else None
+    return Pipeline([
+        ('regex', RegexNormalizer()),
+        ('tokens', TokenStemmer(portuguese_stopwords(), FastRSLPStemmer(stem_table=stem_table)))
+    ])
@@ -0,0 +1,107 @@
+"""
+Load generator for the sentiment inference server.
+
+Opens `--concurrency` keep-alive connections, each sending single-review
+POST /predict requests back to back with texts sampled from a review dump,
+then prints client-side throughput and latency percentiles next to the
+server's /stats.
+
+    python app/sentiment_server.py --port 8000 &
+    python app/sentiment_loadgen.py data/comments.csv --port 8000 --requests 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+async def request(reader, writer, method, path, payload=None):
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    writer.write(
+        (
+            f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        ).encode("latin-1")
+        + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    length = 0
+    for line in header_lines:
+        if line.lower().startswith("content-length:"):
+            length = int(line.split(":", 1)[1])
+    response = await reader.readexactly(length)
+    return int(status_line.split(" ")[1]), json.loads(response)
+
+
+async def client(host, port, texts, n_requests, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            status, _ = await request(
+                reader, writer, "POST", "/predict", {"text": random.choice(texts)}
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(host, port, texts, total_requests, concurrency):
+    latencies, errors = [], []
+    per_client = [total_requests // concurrency] * concurrency
+    for i in range(total_requests % concurrency):
+        per_client[i] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(client(host, port, texts, n, latencies, errors) for n in per_client if n)
+    )
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, server_stats = await request(reader, writer, "GET", "/stats")
+    writer.close()
+
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "client_p50_ms": round(float(p50), 3),
+        "client_p99_ms": round(float(p99), 3),
+        "server": server_stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="CSV file with review texts")
+    parser.add_argument("--text-column", default="comment")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    texts = pd.read_csv(args.input)[args.text_column].dropna().astype(str).tolist()
+    report = asyncio.run(
+        run(args.host, args.port, texts, args.requests, args.concurrency)
+    )
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
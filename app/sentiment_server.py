@@ -0,0 +1,355 @@
+"""
+Local HTTP inference server for review sentiment.
+
+Concurrent requests are coalesced into micro-batches: the first queued text
+opens a batch, which is scored as soon as it holds `max_batch_size` texts or
+`max_wait_ms` have passed, so the pipeline, vectorizer and model run once
+per batch instead of once per request. Batches are scored in a worker thread
+to keep the event loop accepting connections meanwhile.
+
+    python app/sentiment_server.py --port 8000 --max-batch-size 64 --max-wait-ms 5
+
+Endpoints:
+    POST /predict   {"text": "..."} or {"texts": ["...", ...]}
+    GET  /stats     latency percentiles (ms) and batch sizes
+    GET  /health
+
+Use app/sentiment_loadgen.py to drive it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+
+from sentiment import build_prod_pipeline, load_skops, sentiment_analysis
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_VECTORIZER = os.path.join(APP_DIR, "tfidf_vectorizer.skops")
+DEFAULT_MODEL = os.path.join(APP_DIR, "logistic_sentiment.skops")
+
+MAX_BODY_BYTES = 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+}
+
+
+class ServerStats:
+    """
+    Rolling request latencies and batch sizes
+
+    Input:
+        Number of most recent samples kept for the percentiles
+    """
+
+    def __init__(self, window=10_000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batch_sizes.append(size)
+
+    def record_request(self, seconds):
+        self.requests += 1
+        self.latencies.append(seconds * 1000)
+
+    def summary(self):
+        latencies = np.asarray(self.latencies)
+        sizes = np.asarray(self.batch_sizes)
+        summary = {"requests": self.requests, "batches": self.batches}
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99])
+            summary.update(
+                latency_p50_ms=round(float(p50), 3),
+                latency_p99_ms=round(float(p99), 3),
+                latency_max_ms=round(float(latencies.max()), 3),
+            )
+        if len(sizes):
+            summary.update(
+                batch_size_mean=round(float(sizes.mean()), 2),
+                batch_size_p50=float(np.percentile(sizes, 50)),
+                batch_size_max=int(sizes.max()),
+            )
+        return summary
+
+
+class MicroBatcher:
+    """
+    Coalesce single texts into batches for a batch scoring function
+
+    Input:
+        Function mapping a list of texts to a list of results, maximum batch
+        size, maximum time (ms) the first text of a batch waits for others
+        and a ServerStats
+    """
+
+    def __init__(self, score_batch, max_batch_size=64, max_wait_ms=5.0, stats=None):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats or ServerStats()
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, text):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Texts that are already queued join the batch without waiting
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.score_batch, texts)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.stats.record_batch(len(batch))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def build_batch_scorer(
+    vectorizer_path=DEFAULT_VECTORIZER,
+    model_path=DEFAULT_MODEL,
+    feature_index_path=None,
+    scorer_path=None,
+):
+    """
+    Load the sentiment artifacts and return a batch scoring function
+
+    The optional feature index (feature_index.py) and NumPy scorer
+    (linear_scorer.py) replace the pipeline/vectorizer and the model.
+
+    Returns:
+        Function mapping a list of texts to a list of
+        {"label", "proba_negative", "proba_positive"} dicts
+    """
+    vectorizer = load_skops(vectorizer_path)
+    pipeline = build_prod_pipeline()
+    if feature_index_path is not None:
+        from feature_index import FeatureIndex
+
+        feature_index = FeatureIndex.load(feature_index_path)
+        if not feature_index.matches(vectorizer):
+            raise ValueError(f"{feature_index_path} was built from another vectorizer")
+        pipeline, vectorizer = None, feature_index
+    if scorer_path is not None:
+        from linear_scorer import LinearScorer
+
+        model = LinearScorer.load(scorer_path)
+    else:
+        model = load_skops(model_path)
+
+    def score_batch(texts):
+        pred, proba = sentiment_analysis(
+            texts, pipeline=pipeline, vectorizer=vectorizer, model=model
+        )
+        return [
+            {
+                "label": int(label),
+                "proba_negative": float(negative),
+                "proba_positive": float(positive),
+            }
+            for label, (negative, positive) in zip(pred, proba)
+        ]
+
+    return score_batch
+
+
+class SentimentServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, JSON bodies) around a MicroBatcher
+    """
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.stats = batcher.stats
+
+    async def predict(self, payload):
+        if isinstance(payload, dict) and isinstance(payload.get("text"), str):
+            start = time.perf_counter()
+            result = await self.batcher.submit(payload["text"])
+            self.stats.record_request(time.perf_counter() - start)
+            return 200, result
+        if isinstance(payload, dict) and isinstance(payload.get("texts"), list):
+            texts = payload["texts"]
+            if not all(isinstance(text, str) for text in texts):
+                return 400, {"error": "texts must be strings"}
+            start = time.perf_counter()
+            results = await asyncio.gather(*(self.batcher.submit(t) for t in texts))
+            self.stats.record_request(time.perf_counter() - start)
+            return 200, {"results": results}
+        return 400, {"error": 'expected {"text": str} or {"texts": [str, ...]}'}
+
+    async def route(self, method, path, body):
+        if path == "/predict":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return 400, {"error": "invalid JSON"}
+            return await self.predict(payload)
+        if path == "/stats" and method == "GET":
+            return 200, self.stats.summary()
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok"}
+        return 404, {"error": f"no route {method} {path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, _ = request_line.split(" ", 2)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "bad request line"}, False)
+                    break
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                # Bodies are only framed by Content-Length; a chunked body
+                # would otherwise be left unread and parsed as the next request
+                if "transfer-encoding" in headers:
+                    await self.respond(
+                        writer, 501, {"error": "Transfer-Encoding is not supported"}, False
+                    )
+                    break
+                # Only plain ASCII digits: int() would also take "-1", "+1",
+                # "1_000" and non-ASCII digits
+                length = headers.get("content-length", "0")
+                if not (length.isascii() and length.isdigit()):
+                    await self.respond(writer, 400, {"error": "bad content-length"}, False)
+                    break
+                length = int(length)
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {"error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = await self.route(method, target.split("?", 1)[0], body)
+                except Exception:
+                    # The details stay in the server log, not in the response
+                    print(f"Error handling {method} {target}:", file=sys.stderr)
+                    traceback.print_exc(file=sys.stderr)
+                    status, payload = 500, {"error": "internal server error"}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(host, port, score_batch, max_batch_size=64, max_wait_ms=5.0):
+    batcher = MicroBatcher(score_batch, max_batch_size, max_wait_ms)
+    batcher.start()
+    server = SentimentServer(batcher)
+    tcp_server = await asyncio.start_server(server.handle, host, port)
+    print(
+        f"Serving on http://{host}:{port} "
+        f"(max batch {max_batch_size}, max wait {max_wait_ms} ms)",
+        file=sys.stderr,
+    )
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--vectorizer", default=DEFAULT_VECTORIZER)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--feature-index", help="table from feature_index.py")
+    parser.add_argument("--scorer", help="NumPy export from linear_scorer.py")
+    args = parser.parse_args(argv)
+
+    score_batch = build_batch_scorer(
+        args.vectorizer, args.model, args.feature_index, args.scorer
+    )
+    try:
+        asyncio.run(
+            serve(args.host, args.port, score_batch, args.max_batch_size, args.max_wait_ms)
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Columnar snapshot of merged_data.csv for the dashboard.
+
+The snapshot is an uncompressed Arrow IPC (Feather v2) file, so it can be
+memory-mapped instead of parsed. Timestamps are already converted, the
+low-cardinality text columns are stored as dictionary (categorical) columns
+and the `product_category` super-category is precomputed.
+
+Build it once after regenerating merged_data.csv:
+
+    python app/snapshot.py
+"""
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from taxonomy import classify_categories
+
+MERGED_CSV = "./data/merged_data.csv"
+SNAPSHOT_PATH = "./data/merged_data.arrow"
+
+DATE_COLUMNS = [
+    "order_purchase_timestamp",
+    "order_approved_at",
+    "order_delivered_carrier_date",
+    "order_delivered_customer_date",
+    "order_estimated_delivery_date",
+    "shipping_limit_date",
+    "review_creation_date",
+    "review_answer_timestamp",
+]
+
+CATEGORY_COLUMNS = [
+    "customer_city",
+    "customer_state",
+    "seller_city",
+    "seller_state",
+    "order_status",
+    "payment_type",
+    "product_category_name",
+    "product_category_name_english",
+    "product_category",
+]
+
+# Schema metadata key holding the fingerprint of the CSV the snapshot came from
+SOURCE_KEY = b"olist.source"
+
+
+def source_fingerprint(csv_path=MERGED_CSV):
+    # Size and modification time are enough to notice a regenerated CSV
+    stat = os.stat(csv_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def prepare_frame(df):
+    """
+    Apply the dtype conversions and derived columns used by the dashboard
+
+    Input:
+        Raw DataFrame as read from merged_data.csv
+    Returns:
+        The same DataFrame with parsed timestamps, categorical columns and
+        the `product_category` super-category
+    """
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    df["product_category"] = classify_categories(df.product_category_name_english)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def load_csv(csv_path=MERGED_CSV):
+    return prepare_frame(pd.read_csv(csv_path))
+
+
+def build_snapshot(csv_path=MERGED_CSV, snapshot_path=SNAPSHOT_PATH):
+    """
+    Convert merged_data.csv into the columnar snapshot
+
+    Input:
+        Path of the source CSV and of the snapshot to write
+    Returns:
+        The prepared DataFrame
+    """
+    df = load_csv(csv_path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_KEY] = source_fingerprint(csv_path).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    # Write to a temporary file first so readers never see a partial snapshot
+    tmp_path = snapshot_path + ".tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, snapshot_path)
+    return df
+
+
+def stored_fingerprint(snapshot_path=SNAPSHOT_PATH):
+    schema = feather.read_table(snapshot_path, memory_map=True).schema
+    return (schema.metadata or {}).get(SOURCE_KEY, b"").decode()
+
+
+def snapshot_is_fresh(csv_path=MERGED_CSV, snapshot_path=SNAPSHOT_PATH):
+    if not os.path.exists(snapshot_path):
+        return False
+    if not os.path.exists(csv_path):
+        # Deployments may ship only the snapshot
+        return True
+    return stored_fingerprint(snapshot_path) == source_fingerprint(csv_path)
+
+
+def dataset_version(csv_path=MERGED_CSV, snapshot_path=SNAPSHOT_PATH):
+    """
+    Identify the version of the dashboard data
+
+    Uses the CSV fingerprint when the CSV is available, otherwise the
+    fingerprint recorded in the snapshot it was built from.
+    """
+    if os.path.exists(csv_path):
+        return source_fingerprint(csv_path)
+    return stored_fingerprint(snapshot_path)
+
+
+def load_site_df(csv_path=MERGED_CSV, snapshot_path=SNAPSHOT_PATH):
+    """
+    Load the dashboard frame, preferring the columnar snapshot
+
+    Falls back to parsing the CSV when the snapshot is missing or was built
+    from a different version of the CSV.
+    """
+    if snapshot_is_fresh(csv_path, snapshot_path):
+        table = feather.read_table(snapshot_path, memory_map=True)
+        return table.to_pandas()
+    return load_csv(csv_path)
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else MERGED_CSV
+    snapshot_path = sys.argv[2] if len(sys.argv) > 2 else SNAPSHOT_PATH
+    df = build_snapshot(csv_path, snapshot_path)
+    print(f"Wrote {snapshot_path}: {df.shape[0]} rows, {df.shape[1]} columns")
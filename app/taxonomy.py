@@ -0,0 +1,158 @@
+"""
+Product category -> super-category taxonomy.
+
+Single source of the mapping used by the dashboard, the EDA notebook and the
+sales features. Categories are looked up once per distinct value and the
+result is broadcast back to the rows through categorical codes, so the cost
+per row is a vectorized array take instead of a Python call.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Order matters: a category listed under several super-categories belongs to
+# the first one (e.g. garden_tools is Furniture)
+SUPER_CATEGORIES = {
+    "Furniture": [
+        "office_furniture",
+        "furniture_decor",
+        "furniture_living_room",
+        "kitchen_dining_laundry_garden_furniture",
+        "bed_bath_table",
+        "home_comfort",
+        "home_comfort_2",
+        "home_construction",
+        "garden_tools",
+        "furniture_bedroom",
+        "furniture_mattress_and_upholstery",
+    ],
+    "Electronics": [
+        "auto",
+        "computers_accessories",
+        "musical_instruments",
+        "consoles_games",
+        "watches_gifts",
+        "air_conditioning",
+        "telephony",
+        "electronics",
+        "fixed_telephony",
+        "tablets_printing_image",
+        "computers",
+        "small_appliances_home_oven_and_coffee",
+        "small_appliances",
+        "audio",
+        "signaling_and_security",
+        "security_and_services",
+    ],
+    "Fashion": [
+        "fashio_female_clothing",
+        "fashion_male_clothing",
+        "fashion_bags_accessories",
+        "fashion_shoes",
+        "fashion_sport",
+        "fashion_underwear_beach",
+        "fashion_childrens_clothes",
+        "baby",
+        "cool_stuff",
+    ],
+    "Home & Garden": [
+        "housewares",
+        "home_confort",
+        "home_appliances",
+        "home_appliances_2",
+        "flowers",
+        "costruction_tools_garden",
+        "garden_tools",
+        "construction_tools_lights",
+        "costruction_tools_tools",
+        "luggage_accessories",
+        "la_cuisine",
+        "pet_shop",
+        "market_place",
+    ],
+    "Entertainment": [
+        "sports_leisure",
+        "toys",
+        "cds_dvds_musicals",
+        "music",
+        "dvds_blu_ray",
+        "cine_photo",
+        "party_supplies",
+        "christmas_supplies",
+        "arts_and_craftmanship",
+        "art",
+    ],
+    "Beauty & Health": ["health_beauty", "perfumery", "diapers_and_hygiene"],
+    "Food & Drinks": ["food_drink", "drinks", "food"],
+    "Books & Stationery": [
+        "books_general_interest",
+        "books_technical",
+        "books_imported",
+        "stationery",
+    ],
+    "Industry & Construction": [
+        "construction_tools_construction",
+        "construction_tools_safety",
+        "industry_commerce_and_business",
+        "agro_industry_and_commerce",
+    ],
+}
+
+SUPER_CATEGORY_NAMES = list(SUPER_CATEGORIES)
+
+CATEGORY_TO_SUPER = {}
+for _super, _categories in SUPER_CATEGORIES.items():
+    for _category in _categories:
+        CATEGORY_TO_SUPER.setdefault(_category, _super)
+
+_SUPER_CODES = {name: code for code, name in enumerate(SUPER_CATEGORY_NAMES)}
+
+
+def unmapped_categories(categories):
+    """
+    List the categories that have no super-category
+
+    Input:
+        Iterable or Series of product_category_name_english values
+    Returns:
+        Sorted list of distinct, non-missing values missing from the taxonomy
+    """
+    uniques = pd.unique(pd.Series(categories).dropna())
+    return sorted(str(c) for c in uniques if c not in CATEGORY_TO_SUPER)
+
+
+def classify_categories(categories, warn=True):
+    """
+    Map product categories to their super-category
+
+    Input:
+        Series (object or categorical) of product_category_name_english
+        values and a flag to warn about categories missing from the taxonomy
+    Returns:
+        Categorical Series aligned with the input, NaN where the category is
+        missing or unmapped
+    """
+    categories = pd.Series(categories)
+    codes, uniques = pd.factorize(categories)
+
+    # One dictionary lookup per distinct category, then a vectorized take.
+    # The trailing -1 is picked by the -1 codes of missing values.
+    lookup = np.array(
+        [_SUPER_CODES.get(CATEGORY_TO_SUPER.get(c), -1) for c in uniques] + [-1],
+        dtype=np.int8,
+    )
+    super_codes = lookup[codes]
+
+    if warn:
+        unmapped = [str(c) for c in uniques if c not in CATEGORY_TO_SUPER]
+        if unmapped:
+            warnings.warn(
+                "Categories without a super-category: " + ", ".join(sorted(unmapped))
+            )
+
+    return pd.Series(
+        pd.Categorical.from_codes(super_codes, categories=SUPER_CATEGORY_NAMES),
+        index=categories.index,
+        name="product_category",
+    )
@@ -0,0 +1,322 @@
+"""
+Out-of-core training of the review sentiment model.
+
+The notebook densifies the whole TF-IDF matrix and refits the vectorizer on
+every transform before fitting LogisticRegression in memory. Here the review
+CSV is read in chunks, features stay in CSR form from the vectorizer to the
+learner, and an SGDClassifier with logistic loss is fit with partial_fit, so
+memory is bounded by the chunk size.
+
+Two feature modes:
+  vocab    (default) a first pass counts term and document frequencies to
+           pick the `max_features` most frequent stems and their idf, as
+           TfidfVectorizer(max_features=300, stop_words=..., tokenizer=
+           custom_tokenizer) would on the whole corpus (up to terms tied at
+           the cutoff); a second pass trains.
+  hashing  a single pass with HashingVectorizer; document frequencies and
+           idf are updated incrementally and each chunk is weighted with the
+           idf of everything seen so far. For experiments only: the exported
+           vectorizer is a HashingVectorizer + TfidfTransformer pipeline,
+           which the app, bundle.py, feature_index.py, linear_scorer.py and
+           refresh_sentiment.py can't use, since they need the vocabulary of
+           a TfidfVectorizer.
+
+Rows are split into train/holdout by a hash of their position, so the split
+does not depend on the chunk size. Reviews with score >= 3 are positive (1),
+as in review_analysis.ipynb. The vectorizer and model are written as skops
+files (in vocab mode, the ones the app loads), plus a JSON report of the
+holdout metrics.
+
+    python app/train_sentiment.py data/comments.csv models/trained --epochs 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import diags
+from sklearn.feature_extraction.text import (
+    HashingVectorizer,
+    TfidfTransformer,
+    TfidfVectorizer,
+)
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, f1_score, log_loss, roc_auc_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import normalize
+
+from inference import custom_tokenizer, portuguese_stopwords
+from parallel_preprocess import ParallelPreprocessor
+from sentiment import build_prod_pipeline
+
+CLASSES = np.array([0, 1])
+POSITIVE_MIN_SCORE = 3
+
+
+def read_reviews(path, chunk_size, text_column="comment", score_column="score"):
+    """
+    Stream (row numbers, texts, labels) chunks of a review CSV
+
+    Rows without text are skipped; row numbers count every row of the file.
+    """
+    start = 0
+    for chunk in pd.read_csv(path, usecols=[text_column, score_column], chunksize=chunk_size):
+        rows = np.arange(start, start + len(chunk))
+        start += len(chunk)
+        has_text = chunk[text_column].notna().to_numpy()
+        texts = chunk.loc[has_text, text_column].astype(str).tolist()
+        labels = (chunk.loc[has_text, score_column].to_numpy() >= POSITIVE_MIN_SCORE).astype(int)
+        yield rows[has_text], texts, labels
+
+
+def holdout_mask(rows, test_size, seed=0):
+    # Multiplicative hash of the row number: stable across chunk sizes
+    hashed = (rows.astype(np.uint64) * np.uint64(2654435761) + np.uint64(seed)) & np.uint64(
+        0xFFFFFFFF
+    )
+    return hashed / 2**32 < test_size
+
+
+def build_vectorizer(vocabulary, idf, stop_words):
+    """
+    Fitted TfidfVectorizer with a fixed vocabulary and idf
+
+    Same parameters as the notebook's vectorizer, so it is a drop-in
+    replacement for tfidf_vectorizer.skops.
+    """
+    vectorizer = TfidfVectorizer(
+        stop_words=list(stop_words),
+        tokenizer=custom_tokenizer,
+        token_pattern=None,
+        vocabulary={term: i for i, term in enumerate(vocabulary)},
+    )
+    vectorizer._validate_vocabulary()
+    vectorizer.idf_ = idf
+    return vectorizer
+
+
+def smooth_idf(df, n_docs):
+    # TfidfVectorizer's default: smooth_idf=True
+    return np.log((1 + n_docs) / (1 + np.asarray(df, dtype=np.float64))) + 1
+
+
+def fit_vocabulary(path, chunk_size, pipeline, stop_words, max_features=300, verbose=False):
+    """
+    First pass of the vocab mode: term/document frequencies over the corpus
+
+    Returns:
+        Tuple (sorted vocabulary, idf vector, number of documents)
+    """
+    analyzer = TfidfVectorizer(
+        stop_words=list(stop_words), tokenizer=custom_tokenizer, token_pattern=None
+    ).build_analyzer()
+    term_counts = Counter()
+    doc_counts = Counter()
+    n_docs = 0
+    for _, texts, _ in read_reviews(path, chunk_size):
+        for doc in pipeline.transform(texts):
+            tokens = analyzer(doc)
+            term_counts.update(tokens)
+            doc_counts.update(set(tokens))
+        n_docs += len(texts)
+        if verbose:
+            print(f"vocabulary pass: {n_docs} documents", file=sys.stderr)
+
+    # CountVectorizer keeps the most frequent terms. Its argsort is not
+    # stable, so which of the terms tied at the cutoff it keeps is
+    # unspecified; here ties are broken in vocabulary order
+    terms = sorted(term_counts)
+    counts = np.array([term_counts[term] for term in terms])
+    keep = np.sort((-counts).argsort(kind="stable")[:max_features])
+    vocabulary = [terms[i] for i in keep]
+    idf = smooth_idf([doc_counts[term] for term in vocabulary], n_docs)
+    return vocabulary, idf, n_docs
+
+
+class HoldoutMetrics:
+    """
+    Accumulates holdout labels and probabilities across chunks
+    """
+
+    def __init__(self):
+        self.labels = []
+        self.proba = []
+
+    def update(self, labels, proba):
+        self.labels.append(labels)
+        self.proba.append(proba)
+
+    def report(self):
+        if not self.labels:
+            return {}
+        labels = np.concatenate(self.labels)
+        proba = np.concatenate(self.proba)
+        pred = (proba >= 0.5).astype(int)
+        return {
+            "rows": int(len(labels)),
+            "accuracy": float(accuracy_score(labels, pred)),
+            "f1": float(f1_score(labels, pred)),
+            "log_loss": float(log_loss(labels, proba, labels=CLASSES)),
+            "roc_auc": float(roc_auc_score(labels, proba)) if len(set(labels)) > 1 else None,
+        }
+
+
+def train(
+    path,
+    mode="vocab",
+    chunk_size=20_000,
+    epochs=5,
+    test_size=0.2,
+    max_features=300,
+    n_hash_features=2**18,
+    alpha=1e-5,
+    seed=0,
+    workers=1,
+    verbose=False,
+):
+    """
+    Train the vectorizer and classifier out of core
+
+    With workers > 1 the text preprocessing of every chunk is sharded over
+    a process pool (parallel_preprocess.py).
+
+    Returns:
+        Tuple (vectorizer, model, report). The vectorizer transforms the
+        output of build_prod_pipeline() into the CSR matrix the model takes.
+    """
+    if mode not in ("vocab", "hashing"):
+        raise ValueError(f"Unknown mode: {mode}")
+    if workers > 1:
+        pipeline = ParallelPreprocessor(workers)
+    else:
+        pipeline = build_prod_pipeline()
+    try:
+        stop_words = portuguese_stopwords()
+        model = SGDClassifier(loss="log_loss", alpha=alpha, random_state=seed)
+        start = time.perf_counter()
+
+        if mode == "vocab":
+            vocabulary, idf, n_docs = fit_vocabulary(
+                path, chunk_size, pipeline, stop_words, max_features, verbose
+            )
+            vectorizer = build_vectorizer(vocabulary, idf, stop_words)
+            featurize = vectorizer.transform
+        else:
+            hasher = HashingVectorizer(
+                n_features=n_hash_features,
+                alternate_sign=False,
+                norm=None,
+                stop_words=list(stop_words),
+                tokenizer=custom_tokenizer,
+                token_pattern=None,
+            )
+            df = np.zeros(n_hash_features, dtype=np.int64)
+            n_docs = 0
+            update_df = True
+
+            def featurize(docs):
+                # Weight with the idf of every document seen so far
+                nonlocal n_docs
+                counts = hasher.transform(docs)
+                if update_df:
+                    df[:] += np.bincount(counts.indices, minlength=n_hash_features)
+                    n_docs += counts.shape[0]
+                return normalize(counts @ diags(smooth_idf(df, n_docs)))
+
+        for epoch in range(epochs):
+            for rows, texts, labels in read_reviews(path, chunk_size):
+                matrix = featurize(pipeline.transform(texts))
+                train_rows = ~holdout_mask(rows, test_size, seed)
+                if train_rows.any():
+                    model.partial_fit(matrix[train_rows], labels[train_rows], classes=CLASSES)
+            # Document frequencies are complete after the first pass
+            update_df = False
+            if verbose:
+                print(f"epoch {epoch} done", file=sys.stderr)
+
+        if mode == "hashing":
+            transformer = TfidfTransformer()
+            transformer.idf_ = smooth_idf(df, n_docs)
+            vectorizer = Pipeline([("hashing", hasher), ("tfidf", transformer)])
+
+        # Holdout rows were never passed to partial_fit
+        metrics = HoldoutMetrics()
+        for rows, texts, labels in read_reviews(path, chunk_size):
+            test = holdout_mask(rows, test_size, seed)
+            if test.any():
+                test_texts = [text for text, keep in zip(texts, test) if keep]
+                matrix = vectorizer.transform(pipeline.transform(test_texts))
+                metrics.update(labels[test], model.predict_proba(matrix)[:, 1])
+
+        report = {
+            "mode": mode,
+            "documents": int(n_docs),
+            "epochs": epochs,
+            "chunk_size": chunk_size,
+            "features": int(model.coef_.shape[1]),
+            "seconds": round(time.perf_counter() - start, 2),
+            "holdout": metrics.report(),
+        }
+    finally:
+        if isinstance(pipeline, ParallelPreprocessor):
+            pipeline.close()
+    return vectorizer, model, report
+
+
+def export(vectorizer, model, report, output_dir):
+    """
+    Write tfidf_vectorizer.skops, logistic_sentiment.skops and the report
+    """
+    import skops.io as sio
+
+    os.makedirs(output_dir, exist_ok=True)
+    sio.dump(vectorizer, os.path.join(output_dir, "tfidf_vectorizer.skops"))
+    sio.dump(model, os.path.join(output_dir, "logistic_sentiment.skops"))
+    with open(os.path.join(output_dir, "training_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="review CSV with score and comment columns")
+    parser.add_argument("output_dir", help="directory for the skops artifacts")
+    parser.add_argument(
+        "--mode",
+        choices=["vocab", "hashing"],
+        default="vocab",
+        help="only vocab artifacts can be loaded by the app (default: vocab)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=20_000)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--max-features", type=int, default=300)
+    parser.add_argument("--hash-features", type=int, default=2**18)
+    parser.add_argument("--alpha", type=float, default=1e-5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="preprocessing processes")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    vectorizer, model, report = train(
+        args.input,
+        mode=args.mode,
+        chunk_size=args.chunk_size,
+        epochs=args.epochs,
+        test_size=args.test_size,
+        max_features=args.max_features,
+        n_hash_features=args.hash_features,
+        alpha=args.alpha,
+        seed=args.seed,
+        workers=args.workers,
+        verbose=args.verbose,
+    )
+    export(vectorizer, model, report, args.output_dir)
+    print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
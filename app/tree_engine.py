@@ -0,0 +1,410 @@
+"""
+NumPy evaluator for the sales model's tree ensemble.
+
+Serving the sales regressor with xgboost costs seconds of import for a
+100-tree model over four features. `export` flattens the trees of a saved
+booster into contiguous node arrays, saved as .npz:
+
+    feature       split feature per node
+    threshold     split value; rows with x < threshold go left
+    left, right   child node indices (leaves point to themselves)
+    default_left  direction of missing values
+    value         leaf value (0 for split nodes)
+    roots         first node of every tree
+
+TreeEnsemble evaluates all trees at once. The reference walk moves every
+(row, tree) pair down one level per step, `max_depth` gather/compare/select
+steps in all; leaves point to themselves, so paths that end early stay put.
+For trees of depth 6 or less (xgboost's default) it instead precomputes,
+per feature, 64-bit masks of the leaves each threshold rules out, so a row
+costs one table lookup per feature rather than one gather per level; that is
+what makes it faster than xgboost's own predictor on catalog-sized batches.
+Predictions match xgboost's within float32 rounding of the leaf sum. Only
+NumPy is needed; xgboost is imported by the exporter and the benchmark.
+
+    python app/tree_engine.py export
+    python app/tree_engine.py benchmark --rows 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+MODEL_PATH = "./models/sales.ubj"
+TREES_PATH = "./models/sales_trees.npz"
+# Rows evaluated together; bounds the (rows x trees) working arrays
+BLOCK_ROWS = 1 << 10
+# Deepest trees evaluated with 64-bit leaf masks; deeper ones are walked
+BITMASK_DEPTH = 6
+# Largest mask table built (8 bytes per word)
+MASK_WORDS = 1 << 24
+
+_ALL_BITS = (1 << 64) - 1
+_DE_BRUIJN = np.uint64(0x03F79D71B4CB0A89)
+_DE_BRUIJN_BITS = np.zeros(64, dtype=np.intp)
+_DE_BRUIJN_BITS[[((0x03F79D71B4CB0A89 << i) & _ALL_BITS) >> 58 for i in range(64)]] = np.arange(64)
+
+# Supported objectives and their output transform of the margin
+OBJECTIVES = {
+    "reg:squarederror": "identity",
+    "reg:linear": "identity",
+    "reg:pseudohubererror": "identity",
+    "reg:absoluteerror": "identity",
+    "reg:logistic": "sigmoid",
+    "binary:logistic": "sigmoid",
+}
+
+
+def _parse_base_score(raw):
+    # "0.5" in older models, "[5E-1]" (a vector) in newer ones
+    return float(str(raw).strip("[]").split(",")[0])
+
+
+def _base_margin(learner, transform):
+    # base_score is stored as a prediction, the trees add to its margin
+    base_score = _parse_base_score(learner["learner_model_param"]["base_score"])
+    if transform == "sigmoid":
+        return np.log(base_score / (1 - base_score))
+    return base_score
+
+
+def flatten_model(model_json):
+    """
+    Node arrays of a booster in xgboost's JSON model format
+
+    Input:
+        Parsed JSON of Booster.save_raw("json") or a saved .json model
+    Returns:
+        Dictionary of arrays, as stored by export_trees (base_score is
+        the base margin)
+    """
+    learner = model_json["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unsupported objective: {objective}")
+    booster = learner["gradient_booster"]
+    if booster["name"] != "gbtree":
+        raise ValueError(f"Unsupported booster: {booster['name']}")
+    if int(learner["learner_model_param"].get("num_class", "0")) > 1:
+        raise ValueError("Multi-class models are not supported")
+    trees = booster["model"]["trees"]
+
+    feature, threshold, left, right, default_left, value = [], [], [], [], [], []
+    roots, depths = [], []
+    offset = 0
+    for tree in trees:
+        if any(tree["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        tree_left = np.asarray(tree["left_children"], dtype=np.int32)
+        tree_right = np.asarray(tree["right_children"], dtype=np.int32)
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        n_nodes = len(tree_left)
+        nodes = np.arange(n_nodes, dtype=np.int32)
+        leaf = tree_left < 0
+
+        feature.append(np.where(leaf, 0, tree["split_indices"]).astype(np.int32))
+        threshold.append(np.where(leaf, np.float32(np.inf), conditions))
+        left.append(np.where(leaf, nodes, tree_left) + offset)
+        right.append(np.where(leaf, nodes, tree_right) + offset)
+        default_left.append(np.asarray(tree["default_left"], dtype=bool))
+        # Split conditions hold the leaf values on leaf nodes
+        value.append(np.where(leaf, conditions, np.float32(0)))
+        roots.append(offset)
+        depths.append(_tree_depth(tree_left, tree_right))
+        offset += n_nodes
+
+    return {
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "default_left": np.concatenate(default_left),
+        "value": np.concatenate(value).astype(np.float32),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": np.int32(max(depths, default=0)),
+        "base_score": np.float32(_base_margin(learner, OBJECTIVES[objective])),
+        "n_features": np.int32(learner["learner_model_param"]["num_feature"]),
+        "transform": np.array(OBJECTIVES[objective]),
+        "feature_names": np.array(learner.get("feature_names") or [], dtype=str),
+    }
+
+
+def _tree_depth(left, right):
+    # Longest root-to-leaf path, in splits
+    depth = np.zeros(len(left), dtype=np.int32)
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def export_trees(model_path, output_path=TREES_PATH):
+    """
+    Flatten a saved xgboost model (.ubj, .json) into a .npz of node arrays
+    """
+    import xgboost as xgb
+
+    booster = xgb.Booster()
+    booster.load_model(model_path)
+    arrays = flatten_model(json.loads(booster.save_raw("json")))
+    tmp_path = output_path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+class TreeEnsemble:
+    """
+    Vectorized evaluator of flattened xgboost trees
+
+    Input:
+        The node arrays produced by flatten_model
+    """
+
+    def __init__(
+        self,
+        feature,
+        threshold,
+        left,
+        right,
+        default_left,
+        value,
+        roots,
+        max_depth,
+        base_score,
+        n_features,
+        transform="identity",
+        feature_names=(),
+    ):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.value = np.asarray(value, dtype=np.float32)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.base_score = np.float32(base_score)
+        self.n_features = int(n_features)
+        self.transform = str(transform)
+        self.feature_names = [str(name) for name in feature_names]
+        self._masks = None
+        # At most one mask row per split and feature, one word per tree
+        mask_words = (len(self.value) + 2 * self.n_features) * self.n_trees
+        if self.max_depth <= BITMASK_DEPTH and mask_words <= MASK_WORDS:
+            self._build_masks()
+
+    @classmethod
+    def load(cls, path=TREES_PATH):
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def leaves(self, X):
+        """
+        Leaf node reached in every tree, walking all trees level by level
+
+        Returns:
+            Array of node indices of shape (rows, trees)
+        """
+        X = np.asarray(X, dtype=np.float32)
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = np.where(np.isnan(x), self.default_left[node], x < self.threshold[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def _build_masks(self):
+        # Every tree is laid out as a complete tree of max_depth levels, slot s
+        # having children 2s+1 and 2s+2; a leaf above the last level continues
+        # as a never-taken split down to its leftmost descendant. The leaves
+        # of the last level are numbered left to right, one bit each. When a
+        # split sends a row right, the leaves of its left subtree become
+        # unreachable; the exit leaf is the lowest bit left after clearing
+        # them for every split the row goes right at. Per feature, the splits
+        # sorted by threshold give cumulative masks, so a row needs one
+        # lookup per feature instead of one gather per level.
+        depth = self.max_depth
+        n_slots = (1 << depth) - 1
+        node = self.roots[:, None]
+        slot_feature = np.zeros((self.n_trees, n_slots), dtype=np.intp)
+        slot_threshold = np.full((self.n_trees, n_slots), np.nan, dtype=np.float32)
+        slot_default_left = np.ones((self.n_trees, n_slots), dtype=bool)
+        for level in range(depth):
+            slots = slice((1 << level) - 1, (1 << (level + 1)) - 1)
+            split = self.left[node] != node
+            slot_feature[:, slots] = self.feature[node]
+            slot_threshold[:, slots] = np.where(split, self.threshold[node], np.nan)
+            slot_default_left[:, slots] = self.default_left[node]
+            children = np.stack(
+                [np.where(split, self.left[node], node), np.where(split, self.right[node], node)],
+                axis=2,
+            )
+            node = children.reshape(self.n_trees, -1)
+        self._leaf_value = self.value[node].ravel()
+
+        # Leaves of the left subtree of each slot
+        slot_masks = []
+        for slot in range(n_slots):
+            level = (slot + 1).bit_length() - 1
+            first = (slot - (1 << level) + 1) << (depth - level)
+            half = 1 << (depth - level - 1)
+            slot_masks.append(~(((1 << half) - 1) << first) & _ALL_BITS)
+        slot_masks = np.array(slot_masks, dtype=np.uint64)
+
+        split = ~np.isnan(slot_threshold)
+        self._masks, self._thresholds = [], []
+        for f in range(self.n_features):
+            trees, slots = np.nonzero(split & (slot_feature == f))
+            thresholds = slot_threshold[trees, slots]
+            order = np.argsort(thresholds, kind="stable")
+            trees, slots, thresholds = trees[order], slots[order], thresholds[order]
+            cumulative = np.full((len(order), self.n_trees), _ALL_BITS, dtype=np.uint64)
+            cumulative[np.arange(len(order)), trees] = slot_masks[slots]
+            np.bitwise_and.accumulate(cumulative, axis=0, out=cumulative)
+            # Row k: the splits with the k smallest distinct thresholds go right
+            unique, first = np.unique(thresholds, return_index=True)
+            masks = np.full((len(unique) + 2, self.n_trees), _ALL_BITS, dtype=np.uint64)
+            if len(unique):
+                masks[1:-1] = cumulative[np.r_[first[1:], len(order)] - 1]
+            # Last row: a missing value goes right where the default is right
+            right = ~slot_default_left[trees, slots]
+            np.bitwise_and.at(masks[-1], trees[right], slot_masks[slots[right]])
+            self._masks.append(masks)
+            self._thresholds.append(unique)
+
+    def _exit_values(self, X):
+        # Leaf value reached in every tree, shape (rows, trees)
+        if self._masks is None:
+            return self.value[self.leaves(X)]
+        reachable = None
+        for f, (masks, thresholds) in enumerate(zip(self._masks, self._thresholds)):
+            if not len(thresholds):
+                continue
+            x = X[:, f]
+            # Number of thresholds <= x: the splits that send x right
+            k = np.searchsorted(thresholds, x, side="right")
+            k[np.isnan(x)] = len(masks) - 1
+            if reachable is None:
+                reachable = masks.take(k, axis=0)
+            else:
+                reachable &= masks.take(k, axis=0)
+        if reachable is None:
+            leaf = np.zeros((len(X), self.n_trees), dtype=np.intp)
+        else:
+            # Index of the lowest set bit by de Bruijn multiplication
+            lowest = reachable & (~reachable + np.uint64(1))
+            lowest *= _DE_BRUIJN
+            lowest >>= np.uint64(58)
+            leaf = _DE_BRUIJN_BITS.take(lowest.astype(np.intp))
+        leaf += np.arange(self.n_trees) << self.max_depth
+        return self._leaf_value.take(leaf)
+
+    def predict_margin(self, X, block_rows=BLOCK_ROWS):
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), block_rows):
+            block = X[start : start + block_rows]
+            out[start : start + len(block)] = self._exit_values(block).sum(
+                axis=1, dtype=np.float32
+            )
+        return out + self.base_score
+
+    def predict(self, X, block_rows=BLOCK_ROWS):
+        """
+        Predictions for a 2-D feature array (NaN marks a missing value)
+        """
+        margin = self.predict_margin(X, block_rows)
+        if self.transform == "sigmoid":
+            return 1 / (1 + np.exp(-margin))
+        return margin
+
+    # Same entry point as xgboost.Booster, so callers can take either
+    def inplace_predict(self, X, missing=np.nan):
+        X = np.asarray(X, dtype=np.float32)
+        if missing is not None and not np.isnan(missing):
+            X = np.where(X == missing, np.float32(np.nan), X)
+        return self.predict(X)
+
+
+def benchmark(model_path, trees_path, n_rows, repeat=3, seed=0):
+    """
+    Compare TreeEnsemble with xgboost on random catalog-like rows
+
+    Returns:
+        Dictionary of timings (s) and the max absolute difference
+    """
+    import xgboost as xgb
+
+    booster = xgb.Booster()
+    booster.load_model(model_path)
+    ensemble = TreeEnsemble.load(trees_path)
+    rng = np.random.default_rng(seed)
+    X = np.column_stack(
+        [
+            rng.uniform(1, 5, n_rows),
+            rng.gamma(2, 60, n_rows),
+            rng.normal(11, 10, n_rows),
+            rng.integers(0, 9, n_rows),
+        ]
+    ).astype(np.float32)
+    X[rng.random(X.shape) < 0.05] = np.nan
+
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    numpy_s, ours = best(lambda: ensemble.predict(X))
+    inplace_s, theirs = best(lambda: booster.inplace_predict(X, missing=np.nan))
+    names = booster.feature_names
+    dmatrix_s, _ = best(
+        lambda: booster.predict(xgb.DMatrix(X, missing=np.nan, feature_names=names))
+    )
+    return {
+        "rows": n_rows,
+        "numpy_s": numpy_s,
+        "xgboost_inplace_s": inplace_s,
+        "xgboost_dmatrix_s": dmatrix_s,
+        "max_abs_diff": float(np.abs(ours - theirs).max()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="flatten a saved xgboost model")
+    export.add_argument("--model", default=MODEL_PATH)
+    export.add_argument("--output", default=TREES_PATH)
+    bench = commands.add_parser("benchmark", help="compare with xgboost")
+    bench.add_argument("--model", default=MODEL_PATH)
+    bench.add_argument("--trees", default=TREES_PATH)
+    bench.add_argument("--rows", type=int, default=100_000)
+    bench.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        path = export_trees(args.model, args.output)
+        ensemble = TreeEnsemble.load(path)
+        print(
+            f"Wrote {path}: {ensemble.n_trees} trees, {len(ensemble.value)} nodes, "
+            f"max depth {ensemble.max_depth}"
+        )
+        return
+    report = benchmark(args.model, args.trees, args.rows, args.repeat)
+    print(json.dumps(report, indent=1), file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
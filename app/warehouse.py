@@ -0,0 +1,612 @@
+"""
+Star-schema ingestion of the Olist tables.
+
+EDA.ipynb chained seven inner merges into merged_data.csv, so every order
+was repeated once per item x payment x review and sums over the wide file
+counted payments several times. Here the nine source CSVs are read once with
+explicit dtypes and split by grain:
+
+    fact_orders     one row per order, with per-order rollups of its items,
+                    payments and reviews
+    fact_items      one row per order item
+    fact_payments   one row per payment
+    fact_reviews    one row per review (without the comment text)
+    dim_customers, dim_products, dim_sellers, dim_geolocation (zip prefix)
+
+Every fact refers to the tables it belongs to through integer keys that are
+row positions (`order_key` is the row of fact_orders, `product_key` the row
+of dim_products, ...; -1 when the id is unknown), so a join is an array take.
+Tables are written as uncompressed Arrow IPC files with dictionary-encoded
+text columns, next to a manifest holding row counts and the fingerprints of
+the source files.
+
+Orders are sorted by purchase time and fact_orders is stored as one file per
+purchase month (orders without a purchase time last), with the first row and
+the min/max timestamp of each partition in the manifest. The other facts are
+sorted by order_key, so the orders of any time range are a contiguous key
+range and their items, payments and reviews a contiguous slice.
+
+Warehouse.frame() builds the join an analysis needs at the grain it needs,
+reading only the requested columns, and with a time range only the
+partitions that overlap it:
+
+    wh = Warehouse()
+    wh.frame("items", ["price", "product_category", "customer_state"])
+    wh.frame("orders", ["payment_value"], start="2018-01-01", end="2018-04-01")
+
+Build it after updating the raw CSVs:
+
+    python app/warehouse.py [raw_dir] [warehouse_dir]
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from snapshot import source_fingerprint
+from taxonomy import classify_categories
+
+RAW_DIR = "./data"
+WAREHOUSE_DIR = "./data/warehouse"
+MANIFEST = "manifest.json"
+
+# fact_orders is partitioned by month of this column
+PARTITION_COLUMN = "order_purchase_timestamp"
+UNKNOWN_PARTITION = "unknown"
+
+# Source file, explicit dtypes and timestamp columns of every raw table
+SOURCES = {
+    "customers": (
+        "olist_customers_dataset.csv",
+        {
+            "customer_id": str,
+            "customer_unique_id": str,
+            "customer_zip_code_prefix": "int32",
+            "customer_city": "category",
+            "customer_state": "category",
+        },
+        [],
+    ),
+    "geolocation": (
+        "olist_geolocation_dataset.csv",
+        {
+            "geolocation_zip_code_prefix": "int32",
+            "geolocation_lat": "float64",
+            "geolocation_lng": "float64",
+            "geolocation_city": "category",
+            "geolocation_state": "category",
+        },
+        [],
+    ),
+    "orders": (
+        "olist_orders_dataset.csv",
+        {"order_id": str, "customer_id": str, "order_status": "category"},
+        [
+            "order_purchase_timestamp",
+            "order_approved_at",
+            "order_delivered_carrier_date",
+            "order_delivered_customer_date",
+            "order_estimated_delivery_date",
+        ],
+    ),
+    "items": (
+        "olist_order_items_dataset.csv",
+        {
+            "order_id": str,
+            "order_item_id": "int16",
+            "product_id": str,
+            "seller_id": str,
+            "price": "float64",
+            "freight_value": "float64",
+        },
+        ["shipping_limit_date"],
+    ),
+    "payments": (
+        "olist_order_payments_dataset.csv",
+        {
+            "order_id": str,
+            "payment_sequential": "int16",
+            "payment_type": "category",
+            "payment_installments": "int16",
+            "payment_value": "float64",
+        },
+        [],
+    ),
+    "reviews": (
+        "olist_order_reviews_dataset.csv",
+        {"review_id": str, "order_id": str, "review_score": "int8"},
+        ["review_creation_date", "review_answer_timestamp"],
+    ),
+    "products": (
+        "olist_products_dataset.csv",
+        {
+            "product_id": str,
+            "product_category_name": "category",
+            "product_name_lenght": "float32",
+            "product_description_lenght": "float32",
+            "product_photos_qty": "float32",
+            "product_weight_g": "float32",
+            "product_length_cm": "float32",
+            "product_height_cm": "float32",
+            "product_width_cm": "float32",
+        },
+        [],
+    ),
+    "sellers": (
+        "olist_sellers_dataset.csv",
+        {
+            "seller_id": str,
+            "seller_zip_code_prefix": "int32",
+            "seller_city": "category",
+            "seller_state": "category",
+        },
+        [],
+    ),
+    "translation": (
+        "product_category_name_translation.csv",
+        {"product_category_name": str, "product_category_name_english": str},
+        [],
+    ),
+}
+
+# Foreign keys of every table: key column -> referenced table
+REFERENCES = {
+    "fact_items": {
+        "order_key": "fact_orders",
+        "product_key": "dim_products",
+        "seller_key": "dim_sellers",
+    },
+    "fact_payments": {"order_key": "fact_orders"},
+    "fact_reviews": {"order_key": "fact_orders"},
+    "fact_orders": {"customer_key": "dim_customers"},
+    "dim_customers": {},
+    "dim_products": {},
+    "dim_sellers": {},
+    "dim_geolocation": {},
+}
+
+# Grain name accepted by Warehouse.frame -> table at that grain
+GRAINS = {
+    "orders": "fact_orders",
+    "items": "fact_items",
+    "payments": "fact_payments",
+    "reviews": "fact_reviews",
+    "customers": "dim_customers",
+    "products": "dim_products",
+    "sellers": "dim_sellers",
+}
+
+
+def read_source(name, raw_dir=RAW_DIR):
+    # Only the declared columns, with their declared dtypes
+    file_name, dtypes, dates = SOURCES[name]
+    return pd.read_csv(
+        os.path.join(raw_dir, file_name),
+        usecols=list(dtypes) + dates,
+        dtype=dtypes,
+        parse_dates=dates,
+    )
+
+
+def _keys(index, ids):
+    # Row positions of `ids` in a unique index, -1 where missing
+    return index.get_indexer(ids).astype(np.int32)
+
+
+def _by_order(facts):
+    # Facts of the same order are adjacent and in time order
+    return facts.sort_values("order_key", kind="stable").reset_index(drop=True)
+
+
+def _per_order(order_key, n_orders, values=None):
+    # Sum (or count) of fact rows per order, ignoring unknown orders
+    known = order_key >= 0
+    weights = None if values is None else np.asarray(values, dtype=np.float64)[known]
+    return np.bincount(order_key[known], weights=weights, minlength=n_orders)
+
+
+def build_tables(raw_dir=RAW_DIR):
+    """
+    Read the raw CSVs and split them into fact and dimension tables
+
+    Returns:
+        Dictionary of table name -> DataFrame
+    """
+    raw = {name: read_source(name, raw_dir) for name in SOURCES}
+
+    customers = raw["customers"].drop_duplicates("customer_id").reset_index(drop=True)
+    sellers = raw["sellers"].drop_duplicates("seller_id").reset_index(drop=True)
+    products = (
+        raw["products"]
+        .drop_duplicates("product_id")
+        .merge(raw["translation"], on="product_category_name", how="left")
+        .rename(
+            columns={
+                "product_name_lenght": "product_name_length",
+                "product_description_lenght": "product_description_length",
+            }
+        )
+    )
+    products["product_category_name_english"] = products[
+        "product_category_name_english"
+    ].astype("category")
+    products["product_category"] = classify_categories(
+        products.product_category_name_english, warn=False
+    )
+    geolocation = (
+        raw["geolocation"]
+        .groupby("geolocation_zip_code_prefix", as_index=False, observed=True)
+        .agg(
+            geolocation_lat=("geolocation_lat", "mean"),
+            geolocation_lng=("geolocation_lng", "mean"),
+            geolocation_city=("geolocation_city", "first"),
+            geolocation_state=("geolocation_state", "first"),
+        )
+    )
+
+    # Time order makes every purchase-time range a contiguous key range
+    orders = (
+        raw["orders"]
+        .drop_duplicates("order_id")
+        .sort_values(PARTITION_COLUMN, kind="stable", na_position="last")
+        .reset_index(drop=True)
+    )
+    order_index = pd.Index(orders.order_id)
+    orders.insert(1, "customer_key", _keys(pd.Index(customers.customer_id), orders.customer_id))
+
+    items = raw["items"]
+    items.insert(0, "order_key", _keys(order_index, items.order_id))
+    items.insert(2, "product_key", _keys(pd.Index(products.product_id), items.product_id))
+    items.insert(3, "seller_key", _keys(pd.Index(sellers.seller_id), items.seller_id))
+    items = _by_order(items.drop(columns=["order_id", "product_id", "seller_id"]))
+
+    payments = raw["payments"]
+    payments.insert(0, "order_key", _keys(order_index, payments.order_id))
+    payments = _by_order(payments.drop(columns="order_id"))
+
+    reviews = raw["reviews"]
+    reviews.insert(1, "order_key", _keys(order_index, reviews.order_id))
+    reviews = _by_order(reviews.drop(columns="order_id"))
+
+    # Order-grain rollups, so order-level questions never touch the other facts
+    n_orders = len(orders)
+    review_count = _per_order(reviews.order_key.to_numpy(), n_orders)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        review_mean = (
+            _per_order(reviews.order_key.to_numpy(), n_orders, reviews.review_score)
+            / review_count
+        )
+    orders = orders.drop(columns="customer_id").assign(
+        item_count=_per_order(items.order_key.to_numpy(), n_orders).astype(np.int16),
+        items_price=_per_order(items.order_key.to_numpy(), n_orders, items.price),
+        items_freight=_per_order(items.order_key.to_numpy(), n_orders, items.freight_value),
+        payment_count=_per_order(payments.order_key.to_numpy(), n_orders).astype(np.int16),
+        payment_value=_per_order(payments.order_key.to_numpy(), n_orders, payments.payment_value),
+        review_count=review_count.astype(np.int16),
+        review_score=review_mean.astype(np.float32),
+    )
+
+    return {
+        "fact_orders": orders,
+        "fact_items": items,
+        "fact_payments": payments,
+        "fact_reviews": reviews,
+        "dim_customers": customers,
+        "dim_products": products,
+        "dim_sellers": sellers,
+        "dim_geolocation": geolocation,
+    }
+
+
+def month_partitions(timestamps):
+    """
+    Split time-sorted timestamps into purchase-month partitions
+
+    Returns:
+        List of (name, first row, stop row, min, max), with NaT rows in a
+        final partition named UNKNOWN_PARTITION
+    """
+    timestamps = pd.Series(timestamps).reset_index(drop=True)
+    known = int(timestamps.notna().sum())
+    months = timestamps[:known].dt.strftime("%Y-%m").to_numpy()
+    bounds = np.flatnonzero(months[1:] != months[:-1]) + 1
+    starts = np.concatenate([[0], bounds]) if known else []
+    stops = np.concatenate([bounds, [known]]) if known else []
+    partitions = [
+        (months[start], int(start), int(stop), timestamps[start], timestamps[stop - 1])
+        for start, stop in zip(starts, stops)
+    ]
+    if known < len(timestamps):
+        partitions.append((UNKNOWN_PARTITION, known, len(timestamps), None, None))
+    return partitions
+
+
+def _write_arrow(frame, path):
+    feather.write_feather(
+        pa.Table.from_pandas(frame, preserve_index=False), path, compression="uncompressed"
+    )
+
+
+def write_partitioned(frame, directory):
+    """
+    Write fact_orders as one file per purchase month
+
+    Returns:
+        Partition list for the manifest
+    """
+    os.makedirs(directory)
+    partitions = []
+    for name, start, stop, low, high in month_partitions(frame[PARTITION_COLUMN]):
+        _write_arrow(frame.iloc[start:stop], os.path.join(directory, name + ".arrow"))
+        partitions.append(
+            {
+                "name": name,
+                "offset": start,
+                "rows": stop - start,
+                "min": None if low is None else low.isoformat(),
+                "max": None if high is None else high.isoformat(),
+            }
+        )
+    return partitions
+
+
+def source_fingerprints(raw_dir=RAW_DIR):
+    return {
+        file_name: source_fingerprint(os.path.join(raw_dir, file_name))
+        for file_name, _, _ in SOURCES.values()
+    }
+
+
+def write_tables(tables, sources, warehouse_dir=WAREHOUSE_DIR):
+    """
+    Write the tables and their manifest, replacing any previous build
+
+    Returns:
+        The manifest
+    """
+    tmp_dir = warehouse_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    manifest = {
+        "version": hashlib.sha256(json.dumps(sources, sort_keys=True).encode()).hexdigest()[:16],
+        "sources": sources,
+        "tables": {},
+    }
+    for name, frame in tables.items():
+        manifest["tables"][name] = {"rows": len(frame), "columns": list(frame.columns)}
+        if name == "fact_orders":
+            manifest["tables"][name]["partitions"] = write_partitioned(
+                frame, os.path.join(tmp_dir, name)
+            )
+        else:
+            _write_arrow(frame, os.path.join(tmp_dir, name + ".arrow"))
+    with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+    # Swap the complete build in
+    shutil.rmtree(warehouse_dir, ignore_errors=True)
+    os.replace(tmp_dir, warehouse_dir)
+    return manifest
+
+
+def ingest(raw_dir=RAW_DIR, warehouse_dir=WAREHOUSE_DIR):
+    """
+    Build the warehouse from the raw Olist CSVs
+
+    Returns:
+        The manifest
+    """
+    sources = source_fingerprints(raw_dir)
+    return write_tables(build_tables(raw_dir), sources, warehouse_dir)
+
+
+def warehouse_exists(warehouse_dir=WAREHOUSE_DIR):
+    return os.path.exists(os.path.join(warehouse_dir, MANIFEST))
+
+
+def _take(values, positions):
+    # Positional join; -1 becomes a missing value
+    return pd.api.extensions.take(values, positions, allow_fill=True)
+
+
+class Warehouse:
+    """
+    Reader of a built warehouse
+
+    Tables are memory-mapped, sliced to the requested rows in Arrow and only
+    the requested columns are converted to pandas.
+    """
+
+    def __init__(self, warehouse_dir=WAREHOUSE_DIR):
+        self.warehouse_dir = warehouse_dir
+        with open(os.path.join(warehouse_dir, MANIFEST), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    def columns(self, name):
+        return self.manifest["tables"][name]["columns"]
+
+    def partitions(self, name="fact_orders"):
+        return self.manifest["tables"][name].get("partitions")
+
+    def time_bounds(self):
+        """
+        First and last purchase timestamp of the orders
+        """
+        known = [p for p in self.partitions() if p["min"] is not None]
+        if not known:
+            return None, None
+        return pd.Timestamp(known[0]["min"]), pd.Timestamp(known[-1]["max"])
+
+    def _read_file(self, path, columns, start, stop):
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        return table.slice(start, stop - start)
+
+    def table(self, name, columns=None, rows=None):
+        """
+        Read a table, or some of its columns
+
+        Input:
+            Table name, columns (default: all) and an optional (start, stop)
+            row range; of a partitioned table only the partitions holding
+            those rows are opened
+        """
+        if name not in self.manifest["tables"]:
+            raise KeyError(f"Unknown table: {name}")
+        n_rows = self.manifest["tables"][name]["rows"]
+        start, stop = rows if rows is not None else (0, n_rows)
+        partitions = self.partitions(name)
+        if partitions is None:
+            path = os.path.join(self.warehouse_dir, name + ".arrow")
+            return self._read_file(path, columns, start, stop).to_pandas()
+
+        pieces = []
+        for partition in partitions:
+            first = partition["offset"]
+            last = first + partition["rows"]
+            if last <= start or first >= stop:
+                continue
+            path = os.path.join(self.warehouse_dir, name, partition["name"] + ".arrow")
+            pieces.append(
+                self._read_file(path, columns, max(start, first) - first, min(stop, last) - first)
+            )
+        if not pieces:
+            path = os.path.join(self.warehouse_dir, name, partitions[0]["name"] + ".arrow")
+            return self._read_file(path, columns, 0, 0).to_pandas()
+        return pa.concat_tables(pieces).to_pandas()
+
+    def order_range(self, start=None, end=None):
+        """
+        Order keys purchased in [start, end)
+
+        Only the partitions whose min/max statistics overlap the range are
+        read, and of those only the timestamp column.
+
+        Returns:
+            Tuple (first key, stop key)
+        """
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        overlapping = [
+            p
+            for p in self.partitions()
+            if p["min"] is not None
+            and (start is None or pd.Timestamp(p["max"]) >= start)
+            and (end is None or pd.Timestamp(p["min"]) < end)
+        ]
+        if not overlapping:
+            return 0, 0
+        first = overlapping[0]["offset"]
+        stop = overlapping[-1]["offset"] + overlapping[-1]["rows"]
+        # Orders are time-sorted: trim the boundary partitions by bisection
+        timestamps = self.table("fact_orders", [PARTITION_COLUMN], (first, stop))[
+            PARTITION_COLUMN
+        ].to_numpy()
+        low = 0 if start is None else np.searchsorted(timestamps, start.to_datetime64(), "left")
+        high = (
+            len(timestamps)
+            if end is None
+            else np.searchsorted(timestamps, end.to_datetime64(), "left")
+        )
+        return first + int(low), first + int(high)
+
+    def _root_rows(self, root, start, end):
+        # Row ranges of the grain's table and of fact_orders for a
+        # purchase-time range
+        if start is None and end is None:
+            return None, None
+        order_rows = self.order_range(start, end)
+        if root == "fact_orders":
+            return order_rows, order_rows
+        if "order_key" not in REFERENCES.get(root, {}):
+            raise ValueError(f"{root} has no purchase time to filter on")
+        keys = self.table(root, ["order_key"])["order_key"].to_numpy()
+        first, stop = np.searchsorted(keys, order_rows, "left")
+        return (int(first), int(stop)), order_rows
+
+    def _resolve(self, root, columns):
+        # Breadth-first over the references: the nearest table holding a
+        # column provides it, along with the key path to reach that table
+        paths = {root: []}
+        queue = deque([root])
+        while queue:
+            name = queue.popleft()
+            for key, target in REFERENCES[name].items():
+                if target not in paths:
+                    paths[target] = paths[name] + [(name, key)]
+                    queue.append(target)
+        sources = {}
+        for column in columns:
+            owner = next((name for name in paths if column in self.columns(name)), None)
+            if owner is None:
+                raise KeyError(f"No table reachable from {root} has column {column!r}")
+            sources.setdefault(owner, []).append(column)
+        return paths, sources
+
+    def frame(self, grain, columns, start=None, end=None):
+        """
+        Join the requested columns at the given grain
+
+        Input:
+            Grain ("orders", "items", "payments", "reviews" or a dimension),
+            the column names, from the grain's table or any table it
+            references directly or through other tables, and an optional
+            purchase-time range [start, end) for the fact grains
+        Returns:
+            DataFrame with one row per selected row of the grain's table and
+            the columns in the requested order
+        """
+        root = GRAINS.get(grain, grain)
+        paths, sources = self._resolve(root, columns)
+        root_rows, order_rows = self._root_rows(root, start, end)
+        rows = {root: root_rows}
+
+        # Row positions, within the rows read, in every table on a key path
+        positions = {root: None}
+        for owner in sources:
+            for name, key in paths[owner]:
+                target = REFERENCES[name][key]
+                if target in positions:
+                    continue
+                keys = self.table(name, [key], rows.get(name))[key].to_numpy()
+                if positions[name] is not None:
+                    keys = np.where(positions[name] >= 0, keys[positions[name]], -1)
+                rows[target] = None
+                if target == "fact_orders" and order_rows is not None:
+                    # Facts of the range only refer to orders of the range
+                    rows[target] = order_rows
+                    keys = np.where(keys >= 0, keys - order_rows[0], -1)
+                positions[target] = keys
+
+        result = {}
+        for owner, owned in sources.items():
+            data = self.table(owner, owned, rows.get(owner))
+            for column in owned:
+                values = data[column]
+                if positions[owner] is None:
+                    result[column] = values.reset_index(drop=True)
+                else:
+                    result[column] = pd.Series(
+                        _take(values.array, positions[owner]), name=column
+                    )
+        return pd.DataFrame(result, columns=list(columns))
+
+
+if __name__ == "__main__":
+    raw_dir = sys.argv[1] if len(sys.argv) > 1 else RAW_DIR
+    warehouse_dir = sys.argv[2] if len(sys.argv) > 2 else WAREHOUSE_DIR
+    manifest = ingest(raw_dir, warehouse_dir)
+    for name, info in manifest["tables"].items():
+        partitions = info.get("partitions")
+        detail = f", {len(partitions)} monthly partitions" if partitions else ""
+        print(f"{name}: {info['rows']} rows, {len(info['columns'])} columns{detail}")
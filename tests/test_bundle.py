@@ -0,0 +1,63 @@
+"""
+A sentiment bundle must score like the skops artifacts it was exported from.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from bundle import DEFAULT_MODEL, DEFAULT_VECTORIZER, SentimentBundle, export_bundle  # noqa: E402
+from inference import load_skops  # noqa: E402
+from sentiment import build_prod_pipeline  # noqa: E402
+
+COMMENTS_CSV = os.path.join(ROOT, "data", "comments.csv")
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(COMMENTS_CSV), reason="data/comments.csv not present"
+)
+
+
+@pytest.fixture(scope="module")
+def originals():
+    return load_skops(DEFAULT_VECTORIZER), load_skops(DEFAULT_MODEL)
+
+
+@pytest.fixture(scope="module")
+def stems():
+    comments = pd.read_csv(COMMENTS_CSV, usecols=["comment"]).comment.dropna().astype(str)
+    return build_prod_pipeline().transform(list(comments))
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    bundle_dir = str(tmp_path / "sentiment_bundle")
+    export_bundle(bundle_dir, DEFAULT_VECTORIZER, DEFAULT_MODEL)
+    return SentimentBundle(bundle_dir)
+
+
+def test_vectorizer_round_trip(bundle, originals, stems):
+    vectorizer, _ = originals
+    assert list(vectorizer.get_feature_names_out()) == bundle.feature_names
+    np.testing.assert_array_equal(bundle.idf, vectorizer.idf_)
+
+    expected = vectorizer.transform(stems)
+    matrix = bundle.vectorizer().transform(stems)
+    assert matrix.shape == expected.shape
+    assert abs(expected - matrix).max() == 0
+
+
+def test_scorer_round_trip(bundle, originals, stems):
+    vectorizer, model = originals
+    matrix = vectorizer.transform(stems)
+    labels, proba = bundle.scorer().score(matrix)
+    np.testing.assert_array_equal(labels, model.predict(matrix))
+    np.testing.assert_allclose(proba, model.predict_proba(matrix), rtol=0, atol=1e-6)
+
+
+def test_is_current(bundle):
+    assert bundle.is_current(DEFAULT_VECTORIZER, DEFAULT_MODEL)
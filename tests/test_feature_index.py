@@ -0,0 +1,77 @@
+"""
+FeatureIndex.transform must build the rows of
+vectorizer.transform(prod_pipeline.transform(texts)).
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+from sklearn.pipeline import Pipeline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from feature_index import DEFAULT_VECTORIZER, FeatureIndex  # noqa: E402
+from inference import load_skops, portuguese_stopwords  # noqa: E402
+from rslp import FastRSLPStemmer  # noqa: E402
+from sentiment import RegexNormalizer, TokenStemmer, build_prod_pipeline  # noqa: E402
+
+COMMENTS_CSV = os.path.join(ROOT, "data", "comments.csv")
+
+
+class BlankingStemmer:
+    # RSLP never yields an empty stem for the corpus; force some to cover EMPTY_STEM
+    def __init__(self, blank):
+        self.blank = frozenset(blank)
+        self.rslp = FastRSLPStemmer()
+
+    def stem(self, word):
+        return "" if word in self.blank else self.rslp.stem(word)
+
+
+@pytest.fixture(scope="module")
+def vectorizer():
+    return load_skops(DEFAULT_VECTORIZER)
+
+
+def _max_diff(index, pipeline, vectorizer, texts):
+    expected = vectorizer.transform(pipeline.transform(texts))
+    matrix = index.transform(texts)
+    assert matrix.shape == expected.shape
+    return abs(expected - matrix).max() if expected.nnz or matrix.nnz else 0.0
+
+
+@pytest.mark.skipif(not os.path.exists(COMMENTS_CSV), reason="data/comments.csv not present")
+def test_every_comment(vectorizer, tmp_path):
+    texts = list(pd.read_csv(COMMENTS_CSV, usecols=["comment"]).comment.dropna().astype(str))
+    # Half of the corpus is resolved ahead of time, the rest through lookup()
+    index = FeatureIndex.from_vectorizer(
+        vectorizer, portuguese_stopwords(), FastRSLPStemmer(), corpus=texts[::2]
+    )
+    assert index.matches(vectorizer)
+    pipeline = build_prod_pipeline()
+    assert _max_diff(index, pipeline, vectorizer, texts) < 1e-12
+
+    path = str(tmp_path / "feature_index.json")
+    index.save(path)
+    assert _max_diff(FeatureIndex.load(path), pipeline, vectorizer, texts) < 1e-12
+
+
+def test_word_cap_and_empty_stems(vectorizer):
+    blank = ["xyzzy", "plugh"]
+    stemmer = BlankingStemmer(blank)
+    pipeline = Pipeline(
+        [("regex", RegexNormalizer()), ("tokens", TokenStemmer(portuguese_stopwords(), stemmer))]
+    )
+    index = FeatureIndex.from_vectorizer(vectorizer, portuguese_stopwords(), stemmer)
+    texts = [
+        # Past the cap, with stopwords and empty stems that don't count
+        " ".join(["produto", "de", "xyzzy", "bom"] * 30 + ["péssimo"] * 10),
+        " ".join(["ótimo"] * 49 + ["xyzzy", "plugh", "ruim", "péssimo"]),
+        " ".join(["ótimo"] * 50 + ["ruim"]),
+        "xyzzy plugh",
+        "de a o",
+        "",
+    ]
+    assert _max_diff(index, pipeline, vectorizer, texts) < 1e-12
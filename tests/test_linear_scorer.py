@@ -0,0 +1,76 @@
+"""
+LinearScorer must score like logistic_sentiment.skops.
+"""
+import copy
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from feature_index import DEFAULT_VECTORIZER  # noqa: E402
+from inference import load_skops  # noqa: E402
+from linear_scorer import DEFAULT_MODEL, LinearScorer  # noqa: E402
+from sentiment import build_prod_pipeline  # noqa: E402
+
+COMMENTS_CSV = os.path.join(ROOT, "data", "comments.csv")
+
+
+@pytest.fixture(scope="module")
+def model():
+    return load_skops(DEFAULT_MODEL)
+
+
+@pytest.fixture
+def scorer(model, tmp_path):
+    path = str(tmp_path / "linear_sentiment.npz")
+    LinearScorer.from_model(model).save(path)
+    return LinearScorer.load(path)
+
+
+@pytest.mark.skipif(not os.path.exists(COMMENTS_CSV), reason="data/comments.csv not present")
+def test_matches_sklearn_on_comments(model, scorer):
+    texts = list(pd.read_csv(COMMENTS_CSV, usecols=["comment"]).comment.dropna().astype(str))
+    matrix = load_skops(DEFAULT_VECTORIZER).transform(build_prod_pipeline().transform(texts))
+
+    labels, proba = scorer.score(matrix)
+    np.testing.assert_array_equal(labels, model.predict(matrix))
+    np.testing.assert_allclose(proba, model.predict_proba(matrix), rtol=0, atol=1e-6)
+
+    # Dense input takes the other branch of decision_function
+    dense = matrix[:500].toarray()
+    np.testing.assert_array_equal(scorer.predict(dense), model.predict(dense))
+    np.testing.assert_allclose(
+        scorer.predict_proba(dense), model.predict_proba(dense), rtol=0, atol=1e-6
+    )
+
+
+def test_extreme_scores_do_not_overflow(model, scorer):
+    dense = np.zeros((3, len(scorer.coef)))
+    dense[0, np.argmax(scorer.coef)] = 1e4
+    dense[1, np.argmin(scorer.coef)] = 1e4
+    with np.errstate(over="raise"):
+        labels, proba = scorer.score(dense)
+    np.testing.assert_array_equal(labels, model.predict(dense))
+    np.testing.assert_allclose(proba, model.predict_proba(dense), rtol=0, atol=1e-6)
+
+
+def test_matches(model, scorer):
+    assert scorer.matches(model)
+
+    perturbed = copy.deepcopy(model)
+    perturbed.coef_ = perturbed.coef_.copy()
+    perturbed.coef_[0, 0] += 1e-3
+    assert not scorer.matches(perturbed)
+
+    perturbed = copy.deepcopy(model)
+    perturbed.intercept_ = perturbed.intercept_ + 1e-3
+    assert not scorer.matches(perturbed)
+
+    perturbed = copy.deepcopy(model)
+    perturbed.classes_ = perturbed.classes_[::-1].copy()
+    assert not scorer.matches(perturbed)
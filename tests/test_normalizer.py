@@ -0,0 +1,53 @@
+"""
+RegexNormalizer must reproduce the notebook's ApplyRegex(regex_transformers)
+chain byte for byte, since the saved vectorizer was fitted on its output.
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from sentiment import ApplyRegex, RegexNormalizer, regex_transformers  # noqa: E402
+
+COMMENTS_CSV = os.path.join(ROOT, "data", "comments.csv")
+
+EDGE_CASES = [
+    # Dates inside money and money inside dates
+    "paguei R$ 12/05/2018,50 no dia 31/12/2017",
+    "R$10,00 e $ 3.5 e R$  7.25 em 01.02.19",
+    "entrega 3/4/2018 e 29/02/20 e 32/13/2020",
+    # " n " negations next to other negations
+    " n gostei n  recomendo, não, NÃO, nao, ñ, Ñ, n",
+    "n n n",
+    # Unicode digits and word characters
+    "nota ١٢٣ e ５ estrelas, ²³ e ½",
+    "pedido nº 123º — ótimo",
+    # Links, line breaks and whitespace
+    "veja http://example.com/a?b=1&c=%20 e https://x.y\r\nfim",
+    "  \t espaços \n\n finais \t ",
+    "",
+    "!!!",
+]
+
+
+def _both(texts):
+    return RegexNormalizer().transform(texts), ApplyRegex(regex_transformers).transform(texts)
+
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+def test_edge_cases(text):
+    fast, reference = _both([text])
+    assert fast == reference
+
+
+@pytest.mark.skipif(not os.path.exists(COMMENTS_CSV), reason="data/comments.csv not present")
+def test_every_comment():
+    comments = pd.read_csv(COMMENTS_CSV, usecols=["comment"]).comment.dropna().astype(str)
+    fast, reference = _both(list(comments))
+    mismatches = [i for i, (a, b) in enumerate(zip(fast, reference)) if a != b]
+    assert len(fast) == len(reference) == len(comments)
+    assert not mismatches, f"{len(mismatches)} comments differ, first at row {mismatches[0]}"
@@ -0,0 +1,59 @@
+"""
+FastRSLPStemmer must return exactly what nltk's RSLPStemmer returns.
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from inference import normalize_text  # noqa: E402
+from rslp import FastRSLPStemmer, build_stem_table  # noqa: E402
+
+COMMENTS_CSV = os.path.join(ROOT, "data", "comments.csv")
+
+# Words the corpus may not have: exceptions, minimum sizes, very short words
+EXTRA_WORDS = ["a", "ã", "as", "mães", "cães", "lápis", "irmãos", "ns", "inha", "çã"]
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(COMMENTS_CSV), reason="data/comments.csv not present"
+)
+
+
+@pytest.fixture(scope="module")
+def comments():
+    return pd.read_csv(COMMENTS_CSV, usecols=["comment"]).comment.dropna().astype(str)
+
+
+@pytest.fixture(scope="module")
+def expected(comments):
+    from nltk.stem import RSLPStemmer
+
+    vocabulary = set(EXTRA_WORDS)
+    for text in comments:
+        vocabulary.update(normalize_text(text).lower().split())
+    reference = RSLPStemmer()
+    return {word: reference.stem(word) for word in sorted(vocabulary)}
+
+
+def _mismatches(stemmer, expected):
+    return {word: stemmer.stem(word) for word in expected if stemmer.stem(word) != expected[word]}
+
+
+def test_stems_match_nltk(expected):
+    assert not _mismatches(FastRSLPStemmer(), expected)
+
+
+def test_stems_match_nltk_with_small_cache(expected):
+    assert not _mismatches(FastRSLPStemmer(cache_size=16), expected)
+
+
+def test_stems_match_nltk_with_stem_table(comments, expected, tmp_path):
+    path = str(tmp_path / "rslp_stems.json")
+    assert build_stem_table(comments, path) > 0
+    stemmer = FastRSLPStemmer(stem_table=path)
+    assert stemmer._table
+    assert not _mismatches(stemmer, expected)
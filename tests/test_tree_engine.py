@@ -0,0 +1,97 @@
+"""
+TreeEnsemble must predict what xgboost predicts for the same booster.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from tree_engine import BITMASK_DEPTH, TreeEnsemble, export_trees, flatten_model  # noqa: E402
+
+xgb = pytest.importorskip("xgboost")
+
+N_FEATURES = 4
+
+
+def _training_data(seed=0, n_rows=2000):
+    # Coarse values, like the catalog features, so splits land on data values
+    rng = np.random.default_rng(seed)
+    X = np.column_stack(
+        [
+            rng.integers(1, 6, n_rows),
+            np.round(rng.gamma(2, 60, n_rows), 1),
+            np.round(rng.normal(11, 10, n_rows)),
+            rng.integers(0, 9, n_rows),
+        ]
+    ).astype(np.float32)
+    y = 10 + X[:, 0] * np.log1p(X[:, 1]) - 0.3 * X[:, 2] + (X[:, 3] == 4) * 5
+    y += rng.normal(0, 0.5, n_rows)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    return X, y.astype(np.float32)
+
+
+def _test_rows(ensemble, X):
+    # Training rows, every threshold and its neighbours, and missing values
+    rng = np.random.default_rng(1)
+    split = ensemble.left != np.arange(len(ensemble.left))
+    rows = [X]
+    for f in range(N_FEATURES):
+        thresholds = ensemble.threshold[split & (ensemble.feature == f)]
+        for values in (
+            thresholds,
+            np.nextafter(thresholds, np.float32(-np.inf)),
+            np.nextafter(thresholds, np.float32(np.inf)),
+        ):
+            block = X[rng.integers(0, len(X), len(values))].copy()
+            block[:, f] = values
+            rows.append(block)
+    block = X[:64].copy()
+    block[:, :] = np.nan
+    rows.append(block)
+    return np.concatenate(rows).astype(np.float32)
+
+
+@pytest.mark.parametrize("max_depth", [3, BITMASK_DEPTH, BITMASK_DEPTH + 3])
+def test_matches_xgboost_regressor(max_depth):
+    X, y = _training_data()
+    model = xgb.XGBRegressor(n_estimators=40, max_depth=max_depth, learning_rate=0.2)
+    model.fit(X, y)
+    ensemble = TreeEnsemble(**flatten_model(json.loads(model.get_booster().save_raw("json"))))
+    # Both evaluation paths run: leaf masks up to BITMASK_DEPTH, the walk beyond
+    assert ensemble.max_depth == max_depth
+    assert (ensemble._masks is not None) == (max_depth <= BITMASK_DEPTH)
+
+    rows = _test_rows(ensemble, X)
+    expected = model.predict(rows)
+    np.testing.assert_allclose(ensemble.predict(rows), expected, rtol=1e-5)
+    np.testing.assert_allclose(ensemble.inplace_predict(rows), expected, rtol=1e-5)
+    # The level walk agrees with the masks on shallow trees too
+    walked = ensemble.value[ensemble.leaves(rows)].sum(axis=1) + ensemble.base_score
+    np.testing.assert_allclose(walked, ensemble.predict_margin(rows), rtol=1e-5)
+
+
+def test_matches_xgboost_classifier():
+    X, y = _training_data(seed=2)
+    model = xgb.XGBClassifier(n_estimators=30, max_depth=4, objective="binary:logistic")
+    model.fit(X, y > np.median(y))
+    ensemble = TreeEnsemble(**flatten_model(json.loads(model.get_booster().save_raw("json"))))
+
+    rows = _test_rows(ensemble, X)
+    np.testing.assert_allclose(ensemble.predict(rows), model.predict_proba(rows)[:, 1], rtol=1e-5)
+
+
+def test_export_round_trip(tmp_path):
+    X, y = _training_data(seed=3)
+    model = xgb.XGBRegressor(n_estimators=20, max_depth=5)
+    model.fit(X, y)
+    model_path = str(tmp_path / "sales.ubj")
+    model.save_model(model_path)
+    ensemble = TreeEnsemble.load(export_trees(model_path, str(tmp_path / "sales_trees.npz")))
+
+    rows = _test_rows(ensemble, X)
+    np.testing.assert_allclose(ensemble.predict(rows), model.predict(rows), rtol=1e-5)